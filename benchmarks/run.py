@@ -0,0 +1,225 @@
+"""Benchmarks of the build latency, of the call overhead and of the speedup over the Python code
+
+Usage::
+
+    python benchmarks/run.py --output results.json
+
+The results are written as JSON, with a list of records ``{"group", "name", "seconds", ...}``.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pyinlinemodule import InlineFunction, InlineModule, inline  # noqa: E402
+
+
+def _make_function(name, cpp_code, arguments='a', annotations=''):
+    """Create a Python function with C++ code
+
+    The source is executed so that every function has its own code object and name.
+    """
+    source = 'def %s(%s)%s:\n    __cpp__ = """%s"""\n    return None\n' % (name, arguments, annotations, cpp_code)
+    namespace = dict()
+    exec(source, namespace)
+    return namespace[name]
+
+
+def _build_module(name, num_functions):
+    inline_module = InlineModule(name)
+    for index in range(num_functions):
+        function_name = 'function_%d' % index
+        cpp_code = 'return PyLong_FromLong(PyLong_AsLong(a) + %d);' % index
+        inline_module.add_function(_make_function(function_name, cpp_code))
+    return inline_module
+
+
+def bench_precompiled_header(results):
+    """Time to create the precompiled header, shared by the next builds
+
+    The time is the difference between the builds of two empty modules, the first one creating the
+    precompiled header and the second one using it.
+    """
+    if not inline.precompiled_headers() or inline.build_backend() != 'compiler':
+        return
+
+    shutil.rmtree(os.path.join(inline.cache_dir(), 'pch'), ignore_errors=True)
+    start = time.perf_counter()
+    _build_module('bench_pch_create', 0).import_module()
+    create_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _build_module('bench_pch_use', 0).import_module()
+    use_time = time.perf_counter() - start
+
+    results.append(dict(group='build', name='precompiled header', seconds=create_time - use_time))
+
+
+def bench_build(results):
+    """Build time of modules with 1, 10 and 100 functions with cold and warm cache
+
+    The precompiled header is created before (see :func:`bench_precompiled_header`), so the cold builds
+    of all the sizes use it.
+    """
+    for num_functions in (1, 10, 100):
+        name = 'bench_build_%d' % num_functions
+
+        start = time.perf_counter()
+        inline_module = _build_module(name, num_functions)
+        inline_module.get_cpp_code()
+        codegen_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        inline_module.import_module()
+        cold_time = time.perf_counter() - start
+
+        warm_time = _warm_build_time(name, num_functions)
+
+        results.append(dict(group='build', name='codegen', functions=num_functions, seconds=codegen_time))
+        results.append(dict(group='build', name='cold', functions=num_functions, seconds=cold_time))
+        results.append(dict(group='build', name='warm', functions=num_functions, seconds=warm_time))
+
+
+def _warm_build_time(name, num_functions):
+    """Time to load a module from the warm cache in a new process, as a restarted worker does
+
+    In this process the module would be returned from ``sys.modules``, without loading the extension.
+    """
+    environ = dict(os.environ, PY_INLINE_CACHE=inline.cache_dir())
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--warm-build', name,
+                                      str(num_functions)], env=environ, universal_newlines=True)
+    return float(output)
+
+
+def _run_warm_build(name, num_functions):
+    """Body of the process of :func:`_warm_build_time`: print the time to build and load the module"""
+    start = time.perf_counter()
+    _build_module(name, num_functions).import_module()
+    print(time.perf_counter() - start)
+
+
+def _time_call(statement, namespace, number):
+    """Best time of a single call, in seconds"""
+    return min(timeit.repeat(statement, globals=namespace, number=number, repeat=5)) / number
+
+
+def bench_call_overhead(results, number):
+    """Time of a call for each calling convention of the generated wrappers
+    """
+    functions = [
+        ('METH_NOARGS', _make_function('noargs', 'Py_RETURN_NONE;', ''), 'f()'),
+        ('METH_O', _make_function('single_arg', 'Py_RETURN_NONE;', 'a'), 'f(1)'),
+        ('METH_FASTCALL', _make_function('args', 'Py_RETURN_NONE;', 'a, b, c'), 'f(1, 2, 3)'),
+        ('METH_FASTCALL | METH_KEYWORDS', _make_function('kwargs', 'Py_RETURN_NONE;', 'a, b, c=None'),
+         'f(1, 2, c=3)'),
+        ('native types', _make_function('typed', 'return a + b;', 'a: int, b: float', ' -> float'),
+         'f(1, 2.0)'),
+    ]
+
+    inline_module = InlineModule('bench_call_overhead')
+    for _, py_function, _ in functions:
+        inline_module.add_function(InlineFunction(py_function, batched=True))
+    compiled_module = inline_module.import_module()
+
+    empty_time = _time_call('f()', dict(f=lambda: None), number)
+    results.append(dict(group='call', name='python empty function', seconds=empty_time))
+
+    for name, py_function, statement in functions:
+        compiled_function = getattr(compiled_module, py_function.__name__)
+        seconds = _time_call(statement, dict(f=compiled_function), number)
+        results.append(dict(group='call', name=name, seconds=seconds))
+
+    # Time of a call of the typed function for each item of a batch
+    batch_size = 1000
+    namespace = dict(f=compiled_module.typed_many, items=[(1, 2.0)] * batch_size)
+    seconds = _time_call('f(items)', namespace, max(1, number // batch_size)) / batch_size
+    results.append(dict(group='call', name='native types batched', seconds=seconds))
+
+
+def bench_numpy(results, number):
+    """Time of numpy kernels against their Python code
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return
+
+    def sum_of_squares(values: 'float64[::1]') -> float:
+        __cpp__ = """
+        double total = 0.0;
+        for(npy_intp i = 0; i < values_shape[0]; ++i)
+            total += values[i] * values[i];
+        return total;
+        """
+        total = 0.0
+        for value in values:
+            total += value * value
+        return total
+
+    inline_module = InlineModule('bench_numpy')
+    inline_module.add_function(sum_of_squares)
+    compiled_module = inline_module.import_module()
+
+    for size in (10, 1000, 100000):
+        values = np.random.rand(size)
+        namespace = dict(values=values, f=sum_of_squares)
+        python_time = _time_call('f(values)', namespace, max(1, number // size))
+        namespace['f'] = compiled_module.sum_of_squares
+        compiled_time = _time_call('f(values)', namespace, max(1, number // size))
+
+        results.append(dict(group='numpy', name='sum_of_squares python', size=size, seconds=python_time))
+        results.append(dict(group='numpy', name='sum_of_squares compiled', size=size, seconds=compiled_time,
+                            speedup=python_time / compiled_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='benchmark_results.json', help='File of the JSON results')
+    parser.add_argument('--number', type=int, default=100000, help='Number of calls of each timing')
+    parser.add_argument('--warm-build', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.warm_build is not None:
+        _run_warm_build(args.warm_build[0], int(args.warm_build[1]))
+        return
+
+    # Always start from an empty cache, so the cold builds are really cold
+    cache_path = tempfile.mkdtemp(prefix='pyinline_bench_')
+    inline.set_cache_dir(cache_path)
+
+    results = list()
+    try:
+        bench_precompiled_header(results)
+        bench_build(results)
+        bench_call_overhead(results, args.number)
+        bench_numpy(results, args.number)
+    finally:
+        shutil.rmtree(cache_path, ignore_errors=True)
+
+    report = dict(
+        python=sys.version,
+        platform=platform.platform(),
+        build_backend=inline.build_backend(),
+        compile_args=inline.extra_compile_args(),
+        results=results,
+    )
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    for result in results:
+        details = ', '.join('%s=%.4g' % (key, value) for key, value in result.items()
+                            if key not in ('group', 'name', 'seconds'))
+        print('%-8s %-30s %-30s %.3e s' % (result['group'], result['name'], details, result['seconds']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+
+from pyinlinemodule import Cpp
+
+
+@Cpp(verbose=False)
+def typed_add(a: int, b: int) -> int:
+    __cpp__ = """
+    return a + b;
+    """
+    return a + b
+
+
+if __name__ == '__main__':
+
+    assert typed_add(2, 3) == 5
+    assert typed_add(-2, 3) == 1
@@ -1,17 +1,34 @@
 
 
-from .function import InlineFunction, IFunction, METH_NOARGS, METH_O, METH_VARARGS, METH_KEYWORDS
-from .module import InlineModule
+__version__ = '1.0.0'
+
+from .function import InlineFunction, IFunction, CodeFunction, UFunction, BatchedFunction, METH_NOARGS, METH_O, \
+    METH_VARARGS, METH_KEYWORDS, METH_FASTCALL, METH_FASTCALL_KEYWORDS
+from .module import InlineModule, build_all
 from .decorators import Cpp
+from .stats import BuildReport, build_stats, build_reports, reset_build_stats, add_build_callback, \
+    remove_build_callback
 
 
 __all__ = [
     'InlineFunction',
     'IFunction',
+    'CodeFunction',
+    'UFunction',
+    'BatchedFunction',
     'METH_NOARGS',
     'METH_O',
     'METH_VARARGS',
     'METH_KEYWORDS',
+    'METH_FASTCALL',
+    'METH_FASTCALL_KEYWORDS',
     'InlineModule',
+    'build_all',
     'Cpp',
+    'BuildReport',
+    'build_stats',
+    'build_reports',
+    'reset_build_stats',
+    'add_build_callback',
+    'remove_build_callback',
 ]
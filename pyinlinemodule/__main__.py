@@ -0,0 +1,125 @@
+"""Command line tools of pyinlinemodule
+
+Usage::
+
+    python -m pyinlinemodule build mypackage/ --output prebuilt/
+
+The modules built in ``prebuilt/`` are loaded, without compiling them, when the ``PY_INLINE_PREBUILT``
+environment variable is set to that folder.
+
+The build cache is managed with::
+
+    python -m pyinlinemodule cache stats
+    python -m pyinlinemodule cache prune --max-size 512M
+    python -m pyinlinemodule cache clear
+"""
+
+import argparse
+import sys
+import time
+
+from . import cache, inline, prebuilt
+
+
+def _build(args):
+    """Build ahead of time all the modules of the packages
+    """
+    try:
+        modules = prebuilt.build_prebuilt_modules(args.paths, args.output, jobs=args.jobs, silent=not args.verbose,
+                                                  native=args.native)
+    except (ImportError, ValueError) as error:
+        print('Build failed: %s' % error, file=sys.stderr)
+        return 1
+
+    # The keys of the modules depend on the target of the prebuilt modules, recorded in the output folder
+    for module in modules:
+        print(module.get_name())
+    print('Built %d modules in %s' % (len(modules), args.output))
+    return 0
+
+
+def _format_size(size):
+    """Size in bytes in a human readable format"""
+    if size < 1024:
+        return '%d B' % size
+    for unit in ('KiB', 'MiB', 'GiB'):
+        size /= 1024.0
+        if size < 1024 or unit == 'GiB':
+            return '%.1f %s' % (size, unit)
+
+
+def _cache(args):
+    """Show the statistics of the build cache or remove its entries
+    """
+    path = args.path or inline.cache_dir()
+    if path is None:
+        print('The build cache is disabled', file=sys.stderr)
+        return 1
+
+    if args.action == 'stats':
+        stats = cache.cache_stats(path)
+        print('Cache folder: %s' % stats['path'])
+        print('Entries: %d (limit %s)' % (stats['entries'], stats['max_entries'] or 'none'))
+        print('Size: %s (limit %s)' % (_format_size(stats['size']),
+                                       _format_size(stats['max_size']) if stats['max_size'] else 'none'))
+        for kind, kind_stats in sorted(stats['kinds'].items()):
+            print('    %-8s %6d entries %12s' % (kind, kind_stats['entries'], _format_size(kind_stats['size'])))
+        if stats['entries'] > 0:
+            print('Least recently used: %s' % time.ctime(stats['oldest_use']))
+            print('Most recently used: %s' % time.ctime(stats['newest_use']))
+        return 0
+
+    try:
+        if args.action == 'prune':
+            max_size = None if args.max_size is None else inline._parse_size(args.max_size)
+            removed = cache.prune_cache(max_size=max_size, max_entries=args.max_entries, min_age=cache.MIN_AGE,
+                                        path=path)
+        else:
+            removed = cache.clear_cache(path)
+    except ValueError as error:
+        print('Invalid size: %s' % error, file=sys.stderr)
+        return 1
+
+    print('Removed %d entries (%s)' % (len(removed), _format_size(sum(entry.size for entry in removed))))
+    return 0
+
+
+def main(argv=None):
+    """Entry point of the command line tools
+
+    Keyword Args:
+        argv(list[str]): The command line arguments. Default to ``sys.argv[1:]``.
+
+    Returns:
+        int: The exit code
+    """
+    parser = argparse.ArgumentParser(prog='pyinlinemodule', description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    build_parser = subparsers.add_parser('build', help='Build ahead of time the modules of Python packages')
+    build_parser.add_argument('paths', nargs='+', help='Folders of Python packages or Python files')
+    build_parser.add_argument('-o', '--output', default='pyinline_prebuilt', help='Folder of the prebuilt modules')
+    build_parser.add_argument('-j', '--jobs', type=int, default=None, help='Number of parallel builds')
+    build_parser.add_argument('-v', '--verbose', action='store_true', help='Show the output of the compiler')
+    build_parser.add_argument('--native', action='store_true',
+                              help='Build for the CPU of this machine instead of portable ISA levels')
+    build_parser.set_defaults(function=_build)
+
+    cache_parser = subparsers.add_parser('cache', help='Show the statistics of the build cache or remove its entries')
+    cache_parser.add_argument('action', choices=('stats', 'prune', 'clear'),
+                              help='Show the statistics, remove the least recently used entries exceeding the '
+                                   'limits or remove all the entries')
+    cache_parser.add_argument('--path', default=None, help='Folder of the build cache. Default to the current cache')
+    cache_parser.add_argument('--max-size', default=None,
+                              help='Maximum size of the cache for prune, as 512M or 2G. Default to the cache limit')
+    cache_parser.add_argument('--max-entries', type=int, default=None,
+                              help='Maximum number of entries for prune. Default to the cache limit')
+    cache_parser.set_defaults(function=_cache)
+
+    args = parser.parse_args(argv)
+    return args.function(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
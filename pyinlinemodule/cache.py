@@ -0,0 +1,263 @@
+"""
+Management of the build cache: usage statistics and least recently used eviction.
+
+The entries of the cache are the folders of the compiled modules, the object files of the incremental
+builds (``objects``), the precompiled headers (``pch``) and the profile data of the profile guided
+optimization (``.pgo``). The time of the last use of an entry is its modification time, updated each
+time the entry is used. The index of the modules by the key of their Python functions (``functions``)
+is not an entry: an index file is removed when its module does not exist anymore.
+
+An entry is removed only if no other process is building it, and it is first renamed, so a process
+searching the cache never finds a partially removed entry.
+"""
+
+import os
+import re
+import shutil
+import time
+from collections import namedtuple
+
+from . import inline
+
+
+# Entries used in the last seconds are never removed by the automatic eviction, they could be loaded
+# by another process
+MIN_AGE = 60
+
+# Temporary files of the builds (and lock files of removed entries) older than a day are left by
+# interrupted processes
+_STALE_AGE = 24 * 60 * 60
+
+_OBJECT_FILE = re.compile(r'^[0-9a-f]+\.o$')
+_TEMP_SUFFIXES = ('.tmp', '.del')
+
+
+CacheEntry = namedtuple('CacheEntry', ['path', 'kind', 'size', 'last_used'])
+CacheEntry.__doc__ = """Entry of the build cache
+
+Attributes:
+    path(str): File or folder of the entry.
+    kind(str): ``module``, ``object``, ``pch`` or ``profile``.
+    size(int): Size in bytes of the entry.
+    last_used(float): Time of the last use of the entry, in seconds since the epoch.
+"""
+
+
+def _tree_size(path):
+    """Size in bytes of the files of a folder"""
+    size = 0
+    for folder, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(folder, filename))
+            except OSError:
+                pass
+    return size
+
+
+def _entry(path, kind):
+    """Entry of the cache for a file or a folder, ``None`` if it does not exist anymore"""
+    try:
+        last_used = os.path.getmtime(path)
+        size = _tree_size(path) if os.path.isdir(path) else os.path.getsize(path)
+    except OSError:
+        return None
+    return CacheEntry(path, kind, size, last_used)
+
+
+def _index_target_exists(path, index_path):
+    """Whether the module of a file of the ``functions`` index is still in the cache"""
+    try:
+        with open(index_path) as index_file:
+            module_filename = index_file.readline().strip()
+    except OSError:
+        return False
+    return os.path.isfile(os.path.join(path, module_filename))
+
+
+def _scan(path):
+    """Entries and temporary files of a cache folder
+
+    Returns:
+        tuple[list[CacheEntry],list[str]]: The entries and the temporary files and folders
+    """
+    entries = list()
+    temporary = list()
+    if path is None or not os.path.isdir(path):
+        return entries, temporary
+
+    for name in os.listdir(path):
+        full_path = os.path.join(path, name)
+        if name == 'objects' and os.path.isdir(full_path):
+            for object_name in os.listdir(full_path):
+                object_path = os.path.join(full_path, object_name)
+                if _OBJECT_FILE.match(object_name):
+                    entries.append(_entry(object_path, 'object'))
+                else:
+                    temporary.append(object_path)
+        elif name == 'pch' and os.path.isdir(full_path):
+            for pch_name in os.listdir(full_path):
+                pch_path = os.path.join(full_path, pch_name)
+                if pch_name.endswith(_TEMP_SUFFIXES):
+                    temporary.append(pch_path)
+                else:
+                    entries.append(_entry(pch_path, 'pch'))
+        elif name == 'functions' and os.path.isdir(full_path):
+            for index_name in os.listdir(full_path):
+                index_path = os.path.join(full_path, index_name)
+                if index_name.endswith(_TEMP_SUFFIXES) or not _index_target_exists(path, index_path):
+                    temporary.append(index_path)
+        elif name.endswith(_TEMP_SUFFIXES):
+            temporary.append(full_path)
+        elif name.endswith('.lock'):
+            # The lock of a module is kept while the module exists
+            if not os.path.exists(full_path[:-len('.lock')]):
+                temporary.append(full_path)
+        elif name.endswith('.pgo') and os.path.isdir(full_path):
+            entries.append(_entry(full_path, 'profile'))
+        elif os.path.isdir(full_path):
+            entries.append(_entry(full_path, 'module'))
+
+    entries = [entry for entry in entries if entry is not None]
+    entries.sort(key=lambda entry: entry.last_used)
+    return entries, temporary
+
+
+def cache_entries(path=None):
+    """Entries of the build cache, from the least recently used
+
+    Keyword Args:
+        path(str): Folder of the cache. Default to :func:`pyinlinemodule.inline.cache_dir`.
+
+    Returns:
+        list[CacheEntry]: The entries of the cache
+    """
+    return _scan(inline.cache_dir() if path is None else path)[0]
+
+
+def cache_stats(path=None):
+    """Usage statistics of the build cache
+
+    Keyword Args:
+        path(str): Folder of the cache. Default to :func:`pyinlinemodule.inline.cache_dir`.
+
+    Returns:
+        dict: The folder of the cache (``path``), the number of entries and the size in bytes (``entries``
+            and ``size``), the same values by kind of entry (``kinds``), the limits of the cache
+            (``max_size`` and ``max_entries``) and the time of the oldest and of the newest use of an entry
+            (``oldest_use`` and ``newest_use``)
+    """
+    path = inline.cache_dir() if path is None else path
+    entries = cache_entries(path)
+    max_size, max_entries = inline.cache_limits()
+
+    kinds = dict()
+    for entry in entries:
+        kind_stats = kinds.setdefault(entry.kind, dict(entries=0, size=0))
+        kind_stats['entries'] += 1
+        kind_stats['size'] += entry.size
+
+    return dict(
+        path=path,
+        entries=len(entries),
+        size=sum(entry.size for entry in entries),
+        kinds=kinds,
+        max_size=max_size,
+        max_entries=max_entries,
+        oldest_use=entries[0].last_used if entries else None,
+        newest_use=entries[-1].last_used if entries else None,
+    )
+
+
+def _remove(path):
+    """Remove a file or a folder, renaming it first so that it is never found partially removed"""
+    removed_path = '%s.%d.del' % (path, os.getpid())
+    os.rename(path, removed_path)
+    if os.path.isdir(removed_path):
+        shutil.rmtree(removed_path, ignore_errors=True)
+    else:
+        os.remove(removed_path)
+
+
+def _remove_entry(entry, min_age):
+    """Remove an entry of the cache if it is not used
+
+    Returns:
+        bool: ``True`` if the entry was removed
+    """
+    try:
+        if entry.kind != 'module':
+            _remove(entry.path)
+            return True
+
+        # A module is removed only if it is not being built by another process
+        with inline._file_lock(entry.path + '.lock', blocking=False):
+            # The module could have been used since the scan of the cache
+            if time.time() - os.path.getmtime(entry.path) < min_age:
+                return False
+            _remove(entry.path)
+        return True
+    except OSError:
+        # Locked, already removed by another process or in use (i.e. a loaded module on Windows)
+        return False
+
+
+def prune_cache(max_size=None, max_entries=None, min_age=0, path=None):
+    """Remove the least recently used entries of the build cache until it is within the limits
+
+    The temporary files left by interrupted builds are removed too.
+
+    Keyword Args:
+        max_size(int): Maximum size in bytes. Default to the limit of :func:`pyinlinemodule.inline.cache_limits`.
+        max_entries(int): Maximum number of entries. Default to the limit of
+            :func:`pyinlinemodule.inline.cache_limits`.
+        min_age(float): The entries used in the last ``min_age`` seconds are never removed. Default ``0``.
+        path(str): Folder of the cache. Default to :func:`pyinlinemodule.inline.cache_dir`.
+
+    Returns:
+        list[CacheEntry]: The removed entries
+    """
+    default_size, default_entries = inline.cache_limits()
+    max_size = default_size if max_size is None else max_size
+    max_entries = default_entries if max_entries is None else max_entries
+
+    entries, temporary = _scan(inline.cache_dir() if path is None else path)
+    now = time.time()
+
+    for temp_path in temporary:
+        try:
+            if now - os.path.getmtime(temp_path) > _STALE_AGE:
+                if os.path.isdir(temp_path):
+                    shutil.rmtree(temp_path, ignore_errors=True)
+                else:
+                    os.remove(temp_path)
+        except OSError:
+            pass
+
+    size = sum(entry.size for entry in entries)
+    num_entries = len(entries)
+    removed = list()
+    for entry in entries:
+        if (max_size is None or size <= max_size) and (max_entries is None or num_entries <= max_entries):
+            break
+        if now - entry.last_used < min_age:
+            # The next entries are used more recently
+            break
+        if _remove_entry(entry, min_age):
+            size -= entry.size
+            num_entries -= 1
+            removed.append(entry)
+
+    return removed
+
+
+def clear_cache(path=None):
+    """Remove all the entries of the build cache, except the modules being built by other processes
+
+    Keyword Args:
+        path(str): Folder of the cache. Default to :func:`pyinlinemodule.inline.cache_dir`.
+
+    Returns:
+        list[CacheEntry]: The removed entries
+    """
+    return prune_cache(max_size=0, max_entries=0, path=path)
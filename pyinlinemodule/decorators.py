@@ -1,6 +1,239 @@
+import functools
+import threading
 import warnings
 
-from .module import InlineModule
+from . import inline, prebuilt
+from .function import InlineFunction, UFunction
+from .module import InlineModule, load_function_module
+
+
+# Groups of functions compiled in a single extension, by module name and group name
+_GROUPS = dict()
+_GROUPS_LOCK = threading.Lock()
+
+
+def _extension_name(func, suffix):
+    """Name of the extension module of a decorated function
+    """
+    return func.__module__.replace('.', '_') + '_' + suffix
+
+
+def _replace_in_globals(py_function, proxy, function):
+    """Replace the proxy of a decorated function in the globals of its module
+    """
+    module_globals = py_function.__globals__
+    if module_globals.get(py_function.__name__) is proxy:
+        module_globals[py_function.__name__] = function
+
+
+class _LazyFunction(object):
+    """Proxy that compiles the decorated function on its first call
+
+    After the first call the proxy replaces itself, in the globals of the module of the decorated
+    function, with the compiled function, so that the next calls do not pass through the proxy.
+    """
+
+    def __init__(self, compile_function, func):
+        """Constructor
+
+        Args:
+            compile_function(callable): Function that compiles ``func`` and returns the function to use
+            func(function): The decorated Python function
+        """
+        functools.update_wrapper(self, func)
+        self._compile_function = compile_function
+        self._py_function = func
+        self._function = self._bind
+        self._lock = threading.Lock()
+
+    def _bind(self, *args, **kwargs):
+        """Compile the function, bind it and call it
+        """
+        with self._lock:
+            if self._function == self._bind:
+                function = self._compile_function(self._py_function)
+                _replace_in_globals(self._py_function, self, function)
+                self._function = function
+
+        return self._function(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs):
+        return self._function(*args, **kwargs)
+
+
+class _BackgroundFunction(object):
+    """Dispatcher that executes the Python function while the C++ code is compiled in a background thread
+
+    When the compiled function is loaded, the dispatcher switches to it and replaces itself in the
+    globals of the module of the decorated function.
+    """
+
+    def __init__(self, compile_function, func):
+        """Constructor
+
+        Args:
+            compile_function(callable): Function that compiles ``func`` and returns the function to use
+            func(function): The decorated Python function
+        """
+        functools.update_wrapper(self, func)
+        self._py_function = func
+        self._function = func
+        self._error = None
+        self.ready = threading.Event()
+
+        thread = threading.Thread(target=self._bind, args=(compile_function, ),
+                                  name='pyinline-build-' + func.__name__, daemon=True)
+        thread.start()
+
+    def _bind(self, compile_function):
+        """Compile the function and switch to it
+        """
+        try:
+            function = compile_function(self._py_function)
+            _replace_in_globals(self._py_function, self, function)
+            self._function = function
+        except Exception as error:
+            self._error = error
+        finally:
+            self.ready.set()
+
+    def wait(self, timeout=None):
+        """Wait the end of the compilation
+
+        Keyword Args:
+            timeout(float): Maximum time to wait in seconds. Default ``None`` to wait without a limit.
+
+        Returns:
+            bool: ``True`` if the compilation ended, ``False`` if the timeout expired
+
+        Raises:
+            RuntimeError: if the C extension could not be built and ``no_python`` is enabled
+        """
+        if not self.ready.wait(timeout):
+            return False
+        if self._error is not None:
+            raise self._error
+        return True
+
+    def __call__(self, *args, **kwargs):
+        return self._function(*args, **kwargs)
+
+
+class _CppGroup(object):
+    """Group of decorated functions of a Python module compiled in a single extension
+
+    The extension is built when one of the functions is called for the first time and it contains
+    all the functions added to the group up to that moment. If a function is added to the group
+    after the build, the extension is built again with all the functions.
+    """
+
+    def __init__(self, name):
+        """Constructor
+
+        Args:
+            name(str): Name of the extension module.
+        """
+        self._name = name
+        self._functions = list()
+        self._enable_numpy = False
+        self._enable_openmp = False
+        self._profile = False
+        self._module = None
+        self._lock = threading.Lock()
+
+    def add_function(self, func, enable_numpy=False, enable_openmp=False, nogil=False, profile=False, ufunc=False,
+                     identity=None, batched=False):
+        """Add a function to the group
+
+        Args:
+            func(function): The decorated Python function
+
+        Keyword Args:
+            enable_numpy(bool): Enable numpy support in the extension.
+            enable_openmp(bool): Enable OpenMP in the extension.
+            nogil(bool): Execute the C++ code of the function with the GIL released.
+            profile(bool): Profile the functions of the extension.
+            ufunc(bool): Compile the function as a `numpy` ufunc.
+            identity(int): Identity value of the ufunc.
+            batched(bool): Add the batched variant of the function to the extension.
+        """
+        with self._lock:
+            # The functions are created only if the extension is not found in the build cache
+            self._functions.append((func, nogil, ufunc, identity, batched))
+            self._enable_numpy = self._enable_numpy or enable_numpy
+            self._enable_openmp = self._enable_openmp or enable_openmp
+            self._profile = self._profile or profile
+
+    def get_function(self, func, silent=True, isolated=False):
+        """Compiled function of the group, building the extension if required
+
+        Args:
+            func(function): The decorated Python function
+
+        Returns:
+            The compiled function
+
+        Raises:
+            ImportError: if the extension could not be built
+        """
+        with self._lock:
+            if self._module is None:
+                self._module = load_function_module(self._name, self._function_key())
+            if self._module is None or not hasattr(self._module, func.__name__):
+                self._module = self.create_module().import_module(silent=silent, isolated=isolated)
+
+            return getattr(self._module, func.__name__)
+
+    def create_module(self):
+        """Module with all the functions of the group
+
+        Returns:
+            InlineModule: The module of the group
+        """
+        inline_module = InlineModule(self._name, enable_numpy=self._enable_numpy,
+                                     enable_openmp=self._enable_openmp, profile=self._profile)
+        for options in self._functions:
+            inline_module.add_function(_create_function(*options))
+        inline_module._function_key = self._function_key()
+        return inline_module
+
+    def _function_key(self):
+        """Key of the extension in the build cache computed from the decorated functions
+        """
+        key_extra = _options_key(self._enable_numpy, self._enable_openmp, self._profile)
+        for _, nogil, ufunc, identity, batched in self._functions:
+            key_extra.extend(_function_options_key(nogil, ufunc, identity, batched))
+        return inline.function_cache_key([options[0] for options in self._functions], key_extra)
+
+
+def _options_key(enable_numpy, enable_openmp, profile):
+    """Options of an extension module in the key of its functions
+    """
+    return ['numpy=%s' % enable_numpy, 'openmp=%s' % enable_openmp, 'profile=%s' % profile]
+
+
+def _function_options_key(nogil, ufunc, identity, batched):
+    """Options of a decorated function in the key of its extension module
+    """
+    return ['nogil=%s' % nogil, 'ufunc=%s' % ufunc, 'identity=%s' % identity, 'batched=%s' % batched]
+
+
+def _create_function(func, nogil, ufunc, identity, batched):
+    """Function of the extension module of a decorated function
+    """
+    if ufunc:
+        return UFunction(func, identity=identity)
+    return InlineFunction(func, nogil=nogil, batched=batched)
+
+
+def _get_group(func, group):
+    """Group of a decorated function, created if it does not exist
+    """
+    key = (func.__module__, group)
+    with _GROUPS_LOCK:
+        if key not in _GROUPS:
+            _GROUPS[key] = _CppGroup(_extension_name(func, group))
+        return _GROUPS[key]
 
 
 class Cpp(object):
@@ -10,7 +243,9 @@ class Cpp(object):
     to it with the C++ code that should be executed.
     """
 
-    def __init__(self, verbose=False, no_cpp=False, no_python=False, enable_numpy=False):
+    def __init__(self, verbose=False, no_cpp=False, no_python=False, enable_numpy=False, lazy=False,
+                 background=False, group=None, nogil=False, enable_openmp=False, profile=False, ufunc=False,
+                 identity=None, batched=False):
         """Constructor of the decorator:
 
         Keyword Args:
@@ -19,11 +254,45 @@ class Cpp(object):
                 Default ``False``.
             no_python(bool): Do not use Python code. If C code can't be compiled, raise an exception.
             enable_numpy(bool): Enable numpy support. Default ``False``.
+            lazy(bool): Compile the function on its first call instead of when it is decorated. Default ``False``.
+            background(bool): Compile the function in a background thread and use the Python code until the
+                compiled function is ready. The returned function has a ``ready`` event and a ``wait()`` method
+                to wait for the end of the compilation. Default ``False``.
+            group(str): Compile all the functions of the Python module decorated with the same group in a single
+                extension, built when one of them is called for the first time (implies ``lazy``). If the build
+                fails, all the functions of the group use the Python code. Default ``None``.
+            nogil(bool): Execute the C++ code with the GIL released. The function must have a native return
+                annotation and the C++ code must not use the Python C API. Default ``False``.
+            enable_openmp(bool): Enable OpenMP support. Default ``False``.
+            profile(bool): Profile the compiled function. The counters are returned by the ``__pyinline_stats__()``
+                function of the extension module, available as ``function.__self__``. Default ``False``.
+            ufunc(bool): Compile the function as a `numpy` ufunc, with the scalar C++ code executed for each
+                element of the arrays (see :class:`pyinlinemodule.UFunction`). Default ``False``.
+            identity(int): Identity value of the ufunc (``0``, ``1`` or ``-1``), used by the reductions of empty
+                arrays. Default ``None``.
+            batched(bool): Add the batched variant ``<name>_many(items)`` of the function to the extension module,
+                available as ``function.__self__.<name>_many`` (see :class:`pyinlinemodule.BatchedFunction`).
+                Default ``False``.
+
+        Raises:
+            ValueError: if ``background`` is combined with ``lazy`` or ``group``
         """
+        if background and (lazy or group is not None):
+            raise ValueError('The background compilation can not be combined with the lazy or the group compilation')
+
         self._verbose = verbose
         self._no_cpp = no_cpp
         self._enable_numpy = enable_numpy
         self._no_python = no_python
+        self._lazy = lazy
+        self._background = background
+        self._group = group
+        self._nogil = nogil
+        self._enable_openmp = enable_openmp
+        self._profile = profile
+        self._ufunc = ufunc
+        self._identity = identity
+        self._batched = batched
 
     def __call__(self, func):
         """Decorate the Python function
@@ -32,13 +301,67 @@ class Cpp(object):
         if self._no_cpp:
             return func
 
-        name = func.__module__ + '_' + func.__name__
+        if self._group is not None:
+            group = _get_group(func, self._group)
+            group.add_function(func, enable_numpy=self._enable_numpy, enable_openmp=self._enable_openmp,
+                               nogil=self._nogil, profile=self._profile, ufunc=self._ufunc, identity=self._identity,
+                               batched=self._batched)
+            if prebuilt.is_collecting():
+                prebuilt.collect(group)
+                return func
+            return _LazyFunction(self._compile, func)
+
+        if prebuilt.is_collecting():
+            # Ahead-of-time build: the function is built later and its Python code is used in the meantime
+            prebuilt.collect(self._create_module(func))
+            return func
+
+        if self._lazy:
+            return _LazyFunction(self._compile, func)
+
+        if self._background:
+            return _BackgroundFunction(functools.partial(self._compile, isolated=True), func)
+
+        return self._compile(func)
+
+    def _create_module(self, func):
+        """Module with the decorated function
+
+        Returns:
+            InlineModule: The module of the function
+        """
+        inline_module = InlineModule(_extension_name(func, func.__name__), enable_numpy=self._enable_numpy,
+                                     enable_openmp=self._enable_openmp, profile=self._profile)
+        inline_module.add_function(_create_function(func, self._nogil, self._ufunc, self._identity, self._batched))
+        inline_module._function_key = self._function_key(func)
+        return inline_module
+
+    def _function_key(self, func):
+        """Key of the extension module of the decorated function in the build cache
+        """
+        key_extra = _options_key(self._enable_numpy, self._enable_openmp, self._profile) + \
+            _function_options_key(self._nogil, self._ufunc, self._identity, self._batched)
+        return inline.function_cache_key([func], key_extra)
+
+    def _compile(self, func, isolated=False):
+        """Compile the Python function
+
+        Keyword Args:
+            isolated(bool): Build the module in a separate process.
+
+        Returns:
+            The compiled function or the Python function if the compilation fails
+        """
+        silent = not self._verbose
         try:
-            inline_module = InlineModule(name, enable_numpy=self._enable_numpy)
-            inline_module.add_function(func)
-            silent = not self._verbose
-            loaded = inline_module.import_module(silent=silent)
-            out_function = getattr(loaded, func.__name__)
+            if self._group is None:
+                # Cache hit without generating the C++ code of the function
+                loaded = load_function_module(_extension_name(func, func.__name__), self._function_key(func))
+                if loaded is None:
+                    loaded = self._create_module(func).import_module(silent=silent, isolated=isolated)
+                out_function = getattr(loaded, func.__name__)
+            else:
+                out_function = _get_group(func, self._group).get_function(func, silent=silent, isolated=isolated)
         except:
             out_function = func
             if self._no_python:
@@ -5,20 +5,57 @@ All rights reserved. Use of this source code is governed by a
 MIT license that can be found in the LICENSE file.
 """
 
-import inspect
-import dis
 import os
+import re
 from textwrap import dedent, indent
 
-
-STORE_FAST = dis.opmap['STORE_FAST']
-LOAD_CONST = dis.opmap['LOAD_CONST']
-LOAD_GLOBAL = dis.opmap['LOAD_GLOBAL']
-
 METH_NOARGS = 'METH_NOARGS'
 METH_O = 'METH_O'
 METH_VARARGS = 'METH_VARARGS'
 METH_KEYWORDS = 'METH_VARARGS | METH_KEYWORDS'
+METH_FASTCALL = 'METH_FASTCALL'
+METH_FASTCALL_KEYWORDS = 'METH_FASTCALL | METH_KEYWORDS'
+
+# Native C++ types of the annotations of the arguments and of the return value:
+# name of the annotation -> (C++ type, conversion from PyObject*, conversion to PyObject*)
+NATIVE_TYPES = {
+    'int': ('long', 'PyLong_AsLong({0})', 'PyLong_FromLong({0})'),
+    'float': ('double', '(PyFloat_CheckExact({0}) ? PyFloat_AS_DOUBLE({0}) : PyFloat_AsDouble({0}))',
+              'PyFloat_FromDouble({0})'),
+    'bool': ('bool', '({0} == Py_True ? 1 : ({0} == Py_False ? 0 : PyObject_IsTrue({0})))', 'PyBool_FromLong({0})'),
+}
+
+# numpy types of the array annotations: dtype -> (numpy type number, C++ type of the elements)
+ARRAY_TYPES = {
+    'bool': ('NPY_BOOL', 'npy_bool'),
+    'int8': ('NPY_INT8', 'npy_int8'),
+    'int16': ('NPY_INT16', 'npy_int16'),
+    'int32': ('NPY_INT32', 'npy_int32'),
+    'int64': ('NPY_INT64', 'npy_int64'),
+    'uint8': ('NPY_UINT8', 'npy_uint8'),
+    'uint16': ('NPY_UINT16', 'npy_uint16'),
+    'uint32': ('NPY_UINT32', 'npy_uint32'),
+    'uint64': ('NPY_UINT64', 'npy_uint64'),
+    'float32': ('NPY_FLOAT32', 'npy_float32'),
+    'float64': ('NPY_FLOAT64', 'npy_float64'),
+}
+
+# dtypes of the native annotations of the arguments and of the return value of the ufuncs
+UFUNC_NATIVE_TYPES = {
+    'int': 'int64',
+    'float': 'float64',
+    'bool': 'bool',
+}
+
+# Identities of the ufuncs: identity value -> numpy identity constant
+UFUNC_IDENTITIES = {
+    None: 'PyUFunc_None',
+    0: 'PyUFunc_Zero',
+    1: 'PyUFunc_One',
+    -1: 'PyUFunc_MinusOne',
+}
+
+_ARRAY_ANNOTATION = re.compile(r'^\s*(\w+)\s*\[(.*)\]\s*$')
 
 
 class IFunction(object):
@@ -71,6 +108,72 @@ class IFunction(object):
         """
         return ''
 
+    def get_declaration(self):
+        """C++ declarations required to use the function from another translation unit
+
+        A function with a declaration can be compiled in its own translation unit by the incremental builds
+        of :class:`InlineModule`.
+
+        Returns:
+            str: The declarations of the function or an empty string if the function must be compiled
+                with the rest of the module
+        """
+        return ''
+
+    def requires_numpy(self):
+        """Whether the function uses the `numpy` C API
+
+        Returns:
+            bool: ``True`` if the module of the function must enable the `numpy` support
+        """
+        return False
+
+
+class CodeFunction(IFunction):
+    """Function written directly in C++, including its signature
+
+    ::
+
+       CodeFunction('answer', '''
+       extern "C" PyObject* answer(PyObject* self)
+       {
+           return PyLong_FromLong(42);
+       }
+       ''')
+    """
+
+    def __init__(self, name, code, flags=METH_NOARGS, c_name=None):
+        """Constructor
+
+        Args:
+            name(str): Name of the function in the module
+            code(str): C++ code of the function
+
+        Keyword Args:
+            flags(str): Call flags of the function. Default ``METH_NOARGS``.
+            c_name(str): Name of the C++ function, if different from ``name``.
+        """
+        super().__init__()
+        self._name = name
+        self._code = code
+        self._flags = flags
+        self._c_name = name if c_name is None else c_name
+
+    def get_name(self):
+        return self._name
+
+    def get_code(self):
+        return self._code
+
+    def get_function_def(self):
+        function_def = [
+            '"%s"' % self._name,
+            'reinterpret_cast<PyCFunction>(%s)' % self._c_name,
+            self._flags,
+            "nullptr"
+        ]
+        return '{' + ','.join(function_def) + '}'
+
 
 class InlineFunction(IFunction):
     """Function that can be compiled in an C extension.
@@ -92,50 +195,209 @@ class InlineFunction(IFunction):
            return a + b
 
     The C++ code can assume that the argument of the function exists even within the C++ code.
+
+    The arguments and the return value annotated with ``int``, ``float`` or ``bool`` are converted
+    to native C++ variables (``long``, ``double`` and ``bool``): the arguments are converted before the
+    execution of the C++ code and the C++ code returns a native value that is converted to a Python object.
+    A function annotated with ``-> None`` returns ``None`` and its C++ code must not return a value.
+    The C++ code can raise an exception setting the Python error indicator.
+
+    ::
+
+       def a_typed_function(a: int, x: float) -> float:
+           __cpp__ = '''
+           return a * x;
+           '''
+           return a * x
+
+    The arguments annotated with a `numpy` array type, as ``'float64[:, :]'`` or ``'int32[::1]'``, must be
+    arrays with the given dtype and number of dimensions. A ``::1`` in the last (first) dimension requires
+    a C-contiguous (Fortran-contiguous) array. The C++ code receives a pointer to the typed data of the array
+    with the name of the argument, the ``PyArrayObject*`` in ``<name>_array`` and the shape and the strides
+    (in bytes) in ``<name>_shape`` and ``<name>_strides``. The arrays must be writeable, since the C++ code
+    can modify their data.
+
+    The function can declare a ``__cpp_nogil__`` variable with C++ code executed with the GIL released,
+    after the conversion of the arguments and before the code of ``__cpp__``. The variables declared
+    in ``__cpp_nogil__`` are visible in ``__cpp__``. The code of ``__cpp_nogil__`` must not use the
+    Python C API and must not return.
+
+    ::
+
+       def a_function_releasing_the_gil(values: 'float64[::1]') -> float:
+           __cpp_nogil__ = '''
+           double total = 0.0;
+           for(npy_intp i = 0; i < values_shape[0]; ++i)
+               total += values[i];
+           '''
+           __cpp__ = '''
+           return total;
+           '''
+           return sum(values)
     """
 
-    def __init__(self, py_function):
+    def __init__(self, py_function, nogil=False, batched=False):
         """Constructor
 
         Args:
             py_function(function): The Python function with C++ code
+
+        Keyword Args:
+            nogil(bool): Execute all the code of ``__cpp__`` with the GIL released. The function must
+                have a native return annotation (``int``, ``float``, ``bool`` or ``None``) and the C++ code
+                must not use the Python C API. Default ``False``.
+            batched(bool): Add to the module the batched variant of the function (see :class:`BatchedFunction`).
+                Default ``False``.
+
+        Raises:
+            ValueError: if ``nogil`` is enabled and the function has not a native return annotation
         """
+        # The code generation modules are imported only when a module is not found in the build cache
+        import inspect
+
         super().__init__()
         self._py_function = py_function
         self._signature = inspect.signature(py_function)
+        self._nogil = nogil
+        self._cpp_signature = ''
         self._cpp_header_code = ''
+        self._profile = False
+        self._cpp_conversion_code = ''
+        self._cpp_nogil_code = ''
         self._cpp_code = ''
+        self._arg_types = dict()
+        self._array_types = dict()
+        self._return_type = None
         self._function_def = ''
+        self._flags = None
         self._module_init_code = ''
         self._module_header_code = ''
 
         self._parse_signature()
         self._create_cpp()
+        self._batched_function = BatchedFunction(self) if batched else None
+
+        if self._nogil and self._return_type is None:
+            raise ValueError('Function %s must have a native return annotation to release the GIL' %
+                             py_function.__name__)
 
     def _parse_signature(self):
         """Parse the signature of the function
         """
-        format_string = ''
         default_values = dict()
-        is_parsing_kwargs = False
         variable_names = list()
 
         for arg in self._signature.parameters.values():
             var_name = arg.name
             variable_names.append(var_name)
 
-            if arg.default is arg.empty:
-                format_string += 'O'
-            else:
-                if not is_parsing_kwargs:
-                    format_string += '|'
-                is_parsing_kwargs = True
-                format_string += 'O'
+            if arg.default is not arg.empty:
                 default_values[var_name] = repr(arg.default)
 
-        self._create_header(variable_names, format_string, default_values)
+            native_type = _native_type_name(arg.annotation)
+            array_type = _array_type(arg.annotation)
+            if native_type is not None:
+                self._arg_types[var_name] = native_type
+            elif array_type is not None:
+                self._array_types[var_name] = array_type
+
+        return_annotation = self._signature.return_annotation
+        if return_annotation is None or return_annotation == 'None':
+            self._return_type = 'None'
+        else:
+            self._return_type = _native_type_name(return_annotation)
+
+        self._create_header(variable_names, default_values)
+        self._create_conversion(variable_names)
+
+    def _object_name(self, var_name):
+        """Name of the C++ `PyObject*` variable of an argument
+
+        The arguments converted to native types keep their name for the native variable.
+        """
+        if var_name in self._arg_types or var_name in self._array_types:
+            return '__py_' + var_name
+        return var_name
+
+    def _create_conversion(self, variable_names):
+        """Create the code that converts the arguments with native types
+        """
+        conversion_code = ''
+        for var_name in variable_names:
+            if var_name in self._array_types:
+                conversion_code += indent(self._create_array_conversion(var_name), '    ')
+            if var_name not in self._arg_types:
+                continue
+
+            cpp_type, from_python, _ = NATIVE_TYPES[self._arg_types[var_name]]
+            conversion = dedent('''
+            {0} {1};
+            {{
+                auto __value = {2};
+                if(__value == -1 && PyErr_Occurred())
+                    return nullptr;
+                {1} = __value;
+            }}
+            ''').format(cpp_type, var_name, from_python.format(self._object_name(var_name)))
+            conversion_code += indent(conversion, '    ')
+
+        self._cpp_conversion_code = conversion_code
+
+    def _create_array_conversion(self, var_name):
+        """Create the code that validates a `numpy` array argument and exposes its data
+        """
+        dtype, ndim, contiguous = self._array_types[var_name]
+        type_num, cpp_type = ARRAY_TYPES[dtype]
+        function_name = self._py_function.__name__
 
-    def _create_header(self, variable_names, format_string, default_values):
+        conversion = dedent('''
+        if(!PyArray_Check({2}))
+        {{
+            PyErr_SetString(PyExc_TypeError, "{0}() argument '{1}' must be a numpy.ndarray");
+            return nullptr;
+        }}
+        PyArrayObject* {1}_array = reinterpret_cast<PyArrayObject*>({2});
+        if(PyArray_TYPE({1}_array) != {3} || !PyArray_ISBEHAVED_RO({1}_array))
+        {{
+            PyErr_SetString(PyExc_TypeError,
+                            "{0}() argument '{1}' must be an aligned array of {4} in native byte order");
+            return nullptr;
+        }}
+        if(!PyArray_ISWRITEABLE({1}_array))
+        {{
+            PyErr_SetString(PyExc_ValueError, "{0}() argument '{1}' must be a writeable array");
+            return nullptr;
+        }}
+        if(PyArray_NDIM({1}_array) != {5})
+        {{
+            PyErr_Format(PyExc_ValueError, "{0}() argument '{1}' must have {5} dimensions (%d given)",
+                         PyArray_NDIM({1}_array));
+            return nullptr;
+        }}
+        ''').format(function_name, var_name, self._object_name(var_name), type_num, dtype, ndim)
+
+        if contiguous is not None:
+            check_flag = 'PyArray_IS_C_CONTIGUOUS' if contiguous == 'C' else 'PyArray_IS_F_CONTIGUOUS'
+            conversion += dedent('''
+            if(!{2}({1}_array))
+            {{
+                PyErr_SetString(PyExc_ValueError, "{0}() argument '{1}' must be {3}-contiguous");
+                return nullptr;
+            }}
+            ''').format(function_name, var_name, check_flag, contiguous)
+
+        conversion += dedent('''
+        {2}* {1} = reinterpret_cast<{2}*>(PyArray_DATA({1}_array));
+        const npy_intp* {1}_shape = PyArray_SHAPE({1}_array);
+        const npy_intp* {1}_strides = PyArray_STRIDES({1}_array);
+        // Not used by all the functions
+        (void){1}_shape;
+        (void){1}_strides;
+        ''').format(function_name, var_name, cpp_type)
+
+        return conversion
+
+    def _create_header(self, variable_names, default_values):
         """Create the signature and argument parsing code of the C++ function
         """
         num_variable = len(variable_names)
@@ -146,18 +408,16 @@ class InlineFunction(IFunction):
         elif num_variable == 1 and num_keyword_args == 0:
             self._create_header_single_arg(variable_names[0])
         elif num_variable > 1 and num_keyword_args == 0:
-            self._create_header_varargs(variable_names, format_string)
+            self._create_header_varargs(variable_names)
         else:
-            self._create_header_keywords(variable_names, format_string, default_values)
+            self._create_header_keywords(variable_names, default_values)
 
     def _create_header_noargs(self):
         function_name = self._py_function.__name__
 
         # Function signature
-        function_boilerplate = 'extern "C" PyObject* {0}(PyObject* self)\n'.format(function_name)
-        function_boilerplate += '{\n'
-
-        self._cpp_header_code = function_boilerplate
+        self._cpp_signature = 'extern "C" PyObject* {0}(PyObject* self)'.format(function_name)
+        self._cpp_header_code = ''
 
         function_def = [
             '"%s"' % function_name,
@@ -165,6 +425,7 @@ class InlineFunction(IFunction):
             METH_NOARGS,
             "nullptr"
         ]
+        self._flags = METH_NOARGS
 
         self._function_def = '{' + ','.join(function_def) + '}'
 
@@ -172,11 +433,9 @@ class InlineFunction(IFunction):
         function_name = self._py_function.__name__
 
         # Function signature
-        function_boilerplate = 'extern "C" ' \
-            'PyObject* {0}(PyObject* self, PyObject* {1})\n'.format(function_name, variable_name)
-        function_boilerplate += '{\n'
-
-        self._cpp_header_code = function_boilerplate
+        self._cpp_signature = 'extern "C" ' \
+            'PyObject* {0}(PyObject* self, PyObject* {1})'.format(function_name, self._object_name(variable_name))
+        self._cpp_header_code = ''
 
         function_def = [
             '"%s"' % function_name,
@@ -184,81 +443,134 @@ class InlineFunction(IFunction):
             METH_O,
             "nullptr"
         ]
+        self._flags = METH_O
 
         self._function_def = '{' + ','.join(function_def) + '}'
 
-    def _create_header_varargs(self, variable_names, format_string):
+    def _create_header_varargs(self, variable_names):
         function_name = self._py_function.__name__
+        num_variables = len(variable_names)
 
         # Function signature
-        function_boilerplate = 'extern "C" PyObject* {0}(PyObject* self, PyObject* args)\n'.format(function_name)
-        function_boilerplate += '{\n'
+        self._cpp_signature = 'extern "C" ' \
+            'PyObject* {0}(PyObject* self, PyObject* const* args, Py_ssize_t nargs)'.format(function_name)
+        function_boilerplate = ''
+
+        # Arguments parsing
+        check_nargs = dedent('''
+        if(nargs != {1})
+        {{
+            PyErr_Format(PyExc_TypeError, "{0}() takes exactly {1} arguments (%zd given)", nargs);
+            return nullptr;
+        }}
+
+        ''').format(function_name, num_variables)
+        function_boilerplate += indent(check_nargs, '    ')
 
         # Variable arguments declaration
-        variable_declaration = ('PyObject* %s = nullptr;' % var_name for var_name in variable_names)
+        variable_declaration = ('PyObject* %s = args[%d];' % (self._object_name(var_name), i)
+                                for i, var_name in enumerate(variable_names))
         function_boilerplate += indent('\n'.join(variable_declaration), '    ')
         function_boilerplate += '\n\n'
 
-        # Arguments parsing
-        parsing_args = ('&' + var_name for var_name in variable_names)
-        parsing_args = ', '.join(parsing_args)
-        parsetuple = dedent('''
-        if(!PyArg_ParseTuple(args, "{0}", {1}))
-            return nullptr;
-        ''').format(format_string, parsing_args)
-        function_boilerplate += indent(parsetuple, '    ')
-        function_boilerplate += '\n'
-
         self._cpp_header_code = function_boilerplate
 
         function_def = [
             '"%s"' % function_name,
             'reinterpret_cast<PyCFunction>(%s)' % function_name,
-            METH_VARARGS,
+            METH_FASTCALL,
             "nullptr"
         ]
+        self._flags = METH_FASTCALL
 
         self._function_def = '{' + ','.join(function_def) + '}'
 
-    def _create_header_keywords(self, variable_names, format_string, default_values):
+    def _create_header_keywords(self, variable_names, default_values):
         function_name = self._py_function.__name__
+        num_variables = len(variable_names)
 
         # Function signature
-        keyword_names = ('"%s"' % arg for arg in variable_names)
-        func_signature = dedent('''
-        extern "C" PyObject* %s(PyObject* self, PyObject* args, PyObject* kwargs)
-        {
-            static char* _keywords_[] = {%s,nullptr};
-        ''') % (function_name, ','.join(keyword_names))
-
-        function_boilerplate = func_signature
+        self._cpp_signature = 'extern "C" ' \
+            'PyObject* {0}(PyObject* self, PyObject* const* args, Py_ssize_t nargs, PyObject* kwnames)'.format(
+                function_name)
+        function_boilerplate = ''
 
         # Variable arguments declaration
         for var_name in variable_names:
             if var_name in default_values.keys():
-                dec = 'PyObject* {0} = __{1}_{0};\n'.format(var_name, function_name)
+                dec = 'PyObject* {2} = __{1}_{0};\n'.format(var_name, function_name, self._object_name(var_name))
             else:
-                dec = 'PyObject* {0} = nullptr;\n'.format(var_name)
+                dec = 'PyObject* {0} = nullptr;\n'.format(self._object_name(var_name))
             function_boilerplate += indent(dec, '    ')
 
         function_boilerplate += '\n'
 
-        # Arguments parsing
-        parsing_args = ('&' + var_name for var_name in variable_names)
-        parsing_args = ', '.join(parsing_args)
-        parsetuplekewords = dedent('''
-        if(!PyArg_ParseTupleAndKeywords(args, kwargs, "{0}", _keywords_, {1}))
-            return nullptr;
-        ''').format(format_string, parsing_args)
-        function_boilerplate += indent(parsetuplekewords, '    ')
+        # Arguments parsing: the positional arguments are taken from the args array, the keyword
+        # arguments are matched by identity with the interned names and then by value
+        variable_addresses = ', '.join('&' + self._object_name(var_name) for var_name in variable_names)
+        parse_arguments = dedent('''
+        {{
+            PyObject** _variables_[] = {{{2}}};
+
+            if(nargs > {1})
+            {{
+                PyErr_Format(PyExc_TypeError, "{0}() takes at most {1} positional arguments (%zd given)", nargs);
+                return nullptr;
+            }}
+
+            for(Py_ssize_t i = 0; i < nargs; ++i)
+                *_variables_[i] = args[i];
+
+            Py_ssize_t num_kwargs = kwnames == nullptr ? 0 : PyTuple_GET_SIZE(kwnames);
+            for(Py_ssize_t k = 0; k < num_kwargs; ++k)
+            {{
+                PyObject* keyword = PyTuple_GET_ITEM(kwnames, k);
+                Py_ssize_t i = 0;
+                while(i < {1} && keyword != __{0}_kwnames[i])
+                    ++i;
+                if(i == {1})
+                {{
+                    i = 0;
+                    while(i < {1} && PyUnicode_Compare(keyword, __{0}_kwnames[i]) != 0)
+                        ++i;
+                }}
+
+                if(i == {1})
+                {{
+                    PyErr_Format(PyExc_TypeError, "{0}() got an unexpected keyword argument '%U'", keyword);
+                    return nullptr;
+                }}
+                if(i < nargs)
+                {{
+                    PyErr_Format(PyExc_TypeError, "{0}() got multiple values for argument '%U'", keyword);
+                    return nullptr;
+                }}
+                *_variables_[i] = args[nargs + k];
+            }}
+        }}
+        ''').format(function_name, num_variables, variable_addresses)
+        function_boilerplate += indent(parse_arguments, '    ')
+
+        for var_name in variable_names:
+            if var_name not in default_values.keys():
+                check_required = dedent('''
+                if({2} == nullptr)
+                {{
+                    PyErr_SetString(PyExc_TypeError, "{0}() missing required argument '{1}'");
+                    return nullptr;
+                }}
+                ''').format(function_name, var_name, self._object_name(var_name))
+                function_boilerplate += indent(check_required, '    ')
+
         function_boilerplate += '\n'
 
         self._cpp_header_code = function_boilerplate
 
-        kwargs_header_def = (
+        kwargs_header_def = [
             'static PyObject* __{0}_{1} = nullptr;'.format(function_name, arg)
             for arg in default_values.keys()
-        )
+        ]
+        kwargs_header_def.append('static PyObject* __{0}_kwnames[{1}];'.format(function_name, num_variables))
         self._module_header_code = '\n'.join(kwargs_header_def)
 
         # Add default values of keyword arguments to static PyObject variables
@@ -272,6 +584,11 @@ class InlineFunction(IFunction):
             PyModule_AddObject(module, "__{1}_{2}", __{1}_{2});
             ''').format(default_value, function_name, var_name)
             module_init += '{\n%s\n}\n' % indent(kwarg_init_default, '    ')
+
+        # Intern the names of the arguments once, so that the keywords of the calls are matched by identity
+        for i, var_name in enumerate(variable_names):
+            module_init += '__{0}_kwnames[{1}] = PyUnicode_InternFromString("{2}");\n'.format(function_name, i,
+                                                                                              var_name)
         module_init += '}\n'
 
         self._module_init_code = indent(module_init, '    ')
@@ -279,32 +596,113 @@ class InlineFunction(IFunction):
         function_def = [
             '"%s"' % function_name,
             'reinterpret_cast<PyCFunction>(%s)' % function_name,
-            METH_KEYWORDS,
+            METH_FASTCALL_KEYWORDS,
             "nullptr"
         ]
+        self._flags = METH_FASTCALL_KEYWORDS
         self._function_def = '{' + ','.join(function_def) + '}'
 
     def _create_cpp(self):
-        """Extract the C++ code from the function
+        """Extract the C++ code (and the optional code without GIL) from the function
         """
-        cpp_code = None
-
-        for instruction in dis.get_instructions(self._py_function):
-            opcode = instruction.opcode
-            if opcode == LOAD_CONST:
-                cpp_code = instruction.argval
-            elif opcode == LOAD_GLOBAL:
-                cpp_code = self._py_function.__globals__[instruction.argval]
-            elif opcode == STORE_FAST and instruction.argval == '__cpp__':
-                break
+        cpp_code, cpp_nogil_code = _extract_cpp_code(self._py_function)
 
         self._cpp_code = cpp_code
+        if cpp_nogil_code is not None:
+            self._cpp_nogil_code = '    PyThreadState* _save;\n'
+            self._cpp_nogil_code += '    Py_UNBLOCK_THREADS\n'
+            self._cpp_nogil_code += cpp_nogil_code
+            self._cpp_nogil_code += '\n    Py_BLOCK_THREADS\n'
 
     def get_name(self):
         return self._py_function.__name__
 
+    def set_profile(self, enable=True):
+        """Enable the profiling of the function
+
+        A profiled function counts its calls and measures the time spent converting the arguments and
+        executing the C++ code in the ``__pyinline_profile_<name>`` variable, of type ``__pyinline_profile_t``
+        that must be defined by the module.
+
+        Keyword Args:
+            enable(bool): ``True`` for enabling the profiling, ``False`` to disable it.
+        """
+        self._profile = enable
+
+    def get_batched_function(self):
+        """Batched variant of the function
+
+        Returns:
+            BatchedFunction: The batched variant of the function or ``None`` if it is not enabled
+        """
+        return self._batched_function
+
+    def is_profiled(self):
+        """Whether the function is profiled
+
+        Returns:
+            bool: ``True`` if the profiling of the function is enabled
+        """
+        return self._profile
+
+    def _get_body_code(self):
+        """C++ code that executes the code of the function and returns its result
+        """
+        if self._return_type is None and not self._profile:
+            return '\n    {\n' + self._cpp_code + '\n    }\n'
+
+        if self._return_type is None:
+            cpp_type = 'PyObject*'
+            return_code = 'return __result;'
+        elif self._return_type == 'None':
+            cpp_type = 'void'
+            return_code = 'Py_RETURN_NONE;'
+        else:
+            cpp_type, _, to_python = NATIVE_TYPES[self._return_type]
+            return_code = 'return %s;' % to_python.format('__result')
+
+        result = '' if cpp_type == 'void' else '__result = '
+        body_code = '\n    {\n'
+        if cpp_type != 'void':
+            body_code += '        %s __result;\n' % cpp_type
+        if self._nogil:
+            body_code += '        Py_BEGIN_ALLOW_THREADS\n'
+        body_code += '        %s[&]() -> %s {\n' % (result, cpp_type)
+        body_code += self._cpp_code
+        body_code += '\n        }();\n'
+        if self._nogil:
+            body_code += '        Py_END_ALLOW_THREADS\n'
+        if self._profile:
+            body_code += '        __pyinline_profile_%s.body_ns += ' % self.get_name()
+            body_code += 'std::chrono::duration_cast<std::chrono::nanoseconds>(' \
+                'std::chrono::steady_clock::now() - __pyinline_body_start).count();\n'
+        if self._return_type is not None:
+            body_code += '        if(PyErr_Occurred())\n'
+            body_code += '            return nullptr;\n'
+        body_code += '        %s\n' % return_code
+        body_code += '    }\n'
+        return body_code
+
     def get_code(self):
-        return self._cpp_header_code + '\n    {\n' + self._cpp_code + '\n    }\n}\n'
+        if not self._profile:
+            return self._cpp_signature + '\n{\n' + self._cpp_header_code + self._cpp_conversion_code + \
+                self._cpp_nogil_code + self._get_body_code() + '}\n'
+
+        # The conversion time includes the parsing and the conversion of the arguments,
+        # the body time includes the code without GIL and the C++ code
+        profile_start = dedent('''
+        auto __pyinline_call_start = std::chrono::steady_clock::now();
+        __pyinline_profile_{0}.calls += 1;
+        ''').format(self.get_name())
+        profile_body_start = dedent('''
+        auto __pyinline_body_start = std::chrono::steady_clock::now();
+        __pyinline_profile_{0}.conversion_ns += std::chrono::duration_cast<std::chrono::nanoseconds>(
+            __pyinline_body_start - __pyinline_call_start).count();
+        ''').format(self.get_name())
+
+        return self._cpp_signature + '\n{\n' + indent(profile_start, '    ') + self._cpp_header_code + \
+            self._cpp_conversion_code + indent(profile_body_start, '    ') + self._cpp_nogil_code + \
+            self._get_body_code() + '}\n'
 
     def get_function_def(self):
         return self._function_def
@@ -313,4 +711,381 @@ class InlineFunction(IFunction):
         return self._module_init_code
 
     def get_module_header_code(self):
+        if self._profile:
+            profile_def = '__pyinline_profile_t __pyinline_profile_%s = {0, 0, 0};\n' % self.get_name()
+            return profile_def + self._module_header_code
         return self._module_header_code
+
+    def get_declaration(self):
+        declaration = self._cpp_signature + ';\n'
+        if self._profile:
+            declaration += 'extern __pyinline_profile_t __pyinline_profile_%s;\n' % self.get_name()
+        return declaration
+
+    def requires_numpy(self):
+        return len(self._array_types) > 0
+
+
+class BatchedFunction(IFunction):
+    """Batched variant ``<name>_many(items)`` of an :class:`InlineFunction`
+
+    The batched variant calls the function for each tuple of arguments of ``items`` and returns the
+    list of the results, so that ``f_many(items)`` is equivalent to ``[f(*args) for args in items]``.
+    The function is called directly from the C++ loop, without the overhead of a call from Python
+    for each tuple of arguments.
+    """
+
+    def __init__(self, function):
+        """Constructor
+
+        Args:
+            function(InlineFunction): The function called for each tuple of arguments
+        """
+        super().__init__()
+        self._function = function
+        self._cpp_signature = self._signature(self.get_name())
+
+    def _signature(self, c_name):
+        return 'extern "C" PyObject* %s(PyObject* self, PyObject* items)' % c_name
+
+    def get_name(self):
+        return self._function.get_name() + '_many'
+
+    def _create_code(self, c_name, target_name):
+        """C++ code of the batched function
+
+        Args:
+            c_name(str): Name of the C++ function.
+            target_name(str): Name of the C++ function called for each tuple of arguments.
+        """
+        flags = self._function._flags
+        if flags == METH_NOARGS:
+            call = '{0}(self)'
+        elif flags == METH_O:
+            call = '{0}(self, arguments[0])'
+        elif flags == METH_FASTCALL:
+            call = '{0}(self, arguments, nargs)'
+        else:
+            call = '{0}(self, arguments, nargs, nullptr)'
+
+        arguments = ''
+        if flags != METH_NOARGS:
+            arguments = 'PyObject* const* arguments = &PyTuple_GET_ITEM(item, 0);\n'
+        arguments += 'const Py_ssize_t nargs = PyTuple_GET_SIZE(item);\n'
+
+        check_nargs = ''
+        if flags in (METH_NOARGS, METH_O):
+            num_args = 0 if flags == METH_NOARGS else 1
+            check_nargs = dedent('''
+            if(nargs != {1})
+            {{
+                PyErr_Format(PyExc_TypeError, "{0}() takes exactly {1} arguments (%zd given)", nargs);
+                break;
+            }}
+            ''').format(self._function.get_name(), num_args)
+
+        code = dedent('''
+        {0}
+        {{
+            PyObject* sequence = PySequence_Fast(items, "{1}() argument must be iterable");
+            if(sequence == nullptr)
+                return nullptr;
+
+            const Py_ssize_t size = PySequence_Fast_GET_SIZE(sequence);
+            PyObject* results = PyList_New(size);
+            if(results == nullptr)
+            {{
+                Py_DECREF(sequence);
+                return nullptr;
+            }}
+
+            Py_ssize_t i = 0;
+            for(; i < size; ++i)
+            {{
+                if(PySequence_Fast_GET_SIZE(sequence) != size)
+                {{
+                    PyErr_SetString(PyExc_RuntimeError, "{1}() argument changed size during iteration");
+                    break;
+                }}
+                PyObject* item = PySequence_Fast_GET_ITEM(sequence, i);
+                if(!PyTuple_Check(item))
+                {{
+                    PyErr_Format(PyExc_TypeError, "{1}() items must be tuples of arguments, not %.200s",
+                                 Py_TYPE(item)->tp_name);
+                    break;
+                }}
+
+        {2}
+                // The item is kept alive while the function is executed, the function could change the sequence
+                Py_INCREF(item);
+                PyObject* result = {3};
+                Py_DECREF(item);
+                if(result == nullptr)
+                    break;
+                PyList_SET_ITEM(results, i, result);
+            }}
+
+            Py_DECREF(sequence);
+            if(i < size)
+            {{
+                Py_DECREF(results);
+                return nullptr;
+            }}
+            return results;
+        }}
+        ''').format(self._signature(c_name), self.get_name(), indent(arguments + check_nargs, '        ').rstrip('\n'),
+                    call.format(target_name))
+        return code
+
+    def get_code(self):
+        return self._create_code(self.get_name(), self._function.get_name())
+
+    def get_function_def(self):
+        function_def = [
+            '"%s"' % self.get_name(),
+            'reinterpret_cast<PyCFunction>(%s)' % self.get_name(),
+            METH_O,
+            "nullptr"
+        ]
+        return '{' + ','.join(function_def) + '}'
+
+    def get_module_header_code(self):
+        # The function can be compiled in another translation unit
+        return self._function._cpp_signature + ';\n'
+
+    def get_declaration(self):
+        return self._cpp_signature + ';\n'
+
+
+class UFunction(IFunction):
+    """`numpy` universal function with the inner loop compiled from a scalar C++ kernel
+
+    All the arguments and the return value of the Python function must be annotated with a scalar type:
+    ``int``, ``float`` and ``bool`` (as ``int64``, ``float64`` and ``bool``) or a `numpy` dtype name, as
+    ``'float32'``. The C++ code receives the arguments as native values and returns the result for a
+    single element; it is executed in a loop over the elements of the arrays, so it must not use the
+    Python C API.
+
+    ::
+
+       def hypot(x: float, y: float) -> float:
+           __cpp__ = '''
+           return std::sqrt(x * x + y * y);
+           '''
+           return math.hypot(x, y)
+
+    The compiled function is a ``numpy.ufunc``, with broadcasting, the ``out`` argument, the casting of
+    the inputs to the types of the kernel and, for the functions with two arguments, the reductions
+    (i.e. ``hypot.reduce(values)``).
+    """
+
+    def __init__(self, py_function, identity=None):
+        """Constructor
+
+        Args:
+            py_function(function): The Python function with the C++ code of the kernel
+
+        Keyword Args:
+            identity(int): Identity value of the function (``0``, ``1`` or ``-1``), used by the reductions
+                of empty arrays. Default ``None`` for a function without identity.
+
+        Raises:
+            ValueError: if an argument or the return value has not a scalar type annotation or the
+                identity is not valid
+        """
+        super().__init__()
+        if identity not in UFUNC_IDENTITIES:
+            raise ValueError('Invalid identity %r of ufunc %s' % (identity, py_function.__name__))
+
+        self._py_function = py_function
+        self._identity = identity
+        self._cpp_code, _ = _extract_cpp_code(py_function)
+
+        import inspect
+        signature = inspect.signature(py_function)
+        self._arg_names = list(signature.parameters.keys())
+        self._arg_types = [_ufunc_type(py_function, arg.name, arg.annotation)
+                           for arg in signature.parameters.values()]
+        self._return_type = _ufunc_type(py_function, 'return', signature.return_annotation)
+
+    def get_name(self):
+        return self._py_function.__name__
+
+    def _kernel_name(self):
+        return '__pyinline_ufunc_%s' % self.get_name()
+
+    def get_code(self):
+        name = self._kernel_name()
+        return_type = ARRAY_TYPES[self._return_type][1]
+        arg_types = [ARRAY_TYPES[dtype][1] for dtype in self._arg_types]
+        num_args = len(arg_types)
+
+        arguments = ', '.join('%s %s' % (cpp_type, var_name) for cpp_type, var_name in zip(arg_types, self._arg_names))
+        kernel = 'static inline %s %s(%s)\n{\n%s\n}\n' % (return_type, name, arguments, self._cpp_code)
+
+        # The loop over contiguous arrays accesses the elements by index, so that it can be vectorized
+        # by the compiler, the other loops (i.e. the reductions and the broadcasting) use the steps
+        contiguous = ' && '.join('steps[%d] == sizeof(%s)' % (i, cpp_type)
+                                 for i, cpp_type in enumerate(arg_types + [return_type]))
+        contiguous_pointers = ''.join('    const {0}* __in{1} = reinterpret_cast<const {0}*>(args[{1}]);\n'.format(
+            cpp_type, i) for i, cpp_type in enumerate(arg_types))
+        contiguous_call = '%s(%s)' % (name, ', '.join('__in%d[i]' % i for i in range(num_args)))
+        strided_pointers = ''.join('    char* __in%d = args[%d];\n' % (i, i) for i in range(num_args))
+        strided_call = '%s(%s)' % (name, ', '.join('*reinterpret_cast<const %s*>(__in%d)' % (cpp_type, i)
+                                                   for i, cpp_type in enumerate(arg_types)))
+        strided_steps = ''.join(' __in%d += steps[%d];' % (i, i) for i in range(num_args))
+
+        loop = dedent('''
+        static void {0}_loop(char** args, const npy_intp* dimensions, const npy_intp* steps, void* data)
+        {{
+            const npy_intp n = dimensions[0];
+            if({1})
+            {{
+        {2}
+                {3}* __out = reinterpret_cast<{3}*>(args[{4}]);
+                for(npy_intp i = 0; i < n; ++i)
+                    __out[i] = {5};
+            }}
+            else
+            {{
+        {6}
+                char* __out = args[{4}];
+                for(npy_intp i = 0; i < n; ++i)
+                {{
+                    *reinterpret_cast<{3}*>(__out) = {7};
+                   {8} __out += steps[{4}];
+                }}
+            }}
+        }}
+        ''').format(name, contiguous, indent(contiguous_pointers, '    ').rstrip('\n'), return_type, num_args,
+                    contiguous_call, indent(strided_pointers, '    ').rstrip('\n'), strided_call, strided_steps)
+
+        return kernel + loop
+
+    def get_function_def(self):
+        # The ufunc is not a method of the module, it is added to the module by the init code
+        return ''
+
+    def get_module_init_code(self):
+        types = ', '.join(ARRAY_TYPES[dtype][0] for dtype in self._arg_types + [self._return_type])
+        module_init = dedent('''
+        {{
+            static PyUFuncGenericFunction functions[] = {{{0}_loop}};
+            static void* data[] = {{nullptr}};
+            static char types[] = {{{1}}};
+            PyObject* ufunc = PyUFunc_FromFuncAndData(functions, data, types, 1, {2}, 1, {3}, "{4}", nullptr, 0);
+            if(ufunc == nullptr || PyModule_AddObject(module, "{4}", ufunc) < 0)
+            {{
+                Py_XDECREF(ufunc);
+                Py_DECREF(module);
+                return nullptr;
+            }}
+        }}
+        ''').format(self._kernel_name(), types, len(self._arg_types), UFUNC_IDENTITIES[self._identity],
+                    self.get_name())
+        return indent(module_init, '    ')
+
+    def requires_numpy(self):
+        return True
+
+
+def _ufunc_type(py_function, var_name, annotation):
+    """dtype of the annotation of an argument or of the return value of a :class:`UFunction`
+
+    Returns:
+        str: The key in :data:`ARRAY_TYPES`
+
+    Raises:
+        ValueError: if the annotation is not a scalar type
+    """
+    native_type = _native_type_name(annotation)
+    if native_type is not None:
+        return UFUNC_NATIVE_TYPES[native_type]
+
+    name = annotation if isinstance(annotation, str) else getattr(annotation, '__name__', None)
+    if name in ARRAY_TYPES:
+        return name
+    if name == 'bool_':
+        return 'bool'
+    raise ValueError('%s() %s must be annotated with a scalar type to build a ufunc' % (py_function.__name__,
+                                                                                       var_name))
+
+
+def _extract_cpp_code(py_function):
+    """C++ code assigned to the ``__cpp__`` and ``__cpp_nogil__`` variables of a Python function
+
+    Returns:
+        tuple[str,str]: The code of ``__cpp__`` and the code of ``__cpp_nogil__`` or ``None`` if
+            ``__cpp_nogil__`` is not assigned
+    """
+    import dis
+
+    cpp_code = None
+    cpp_nogil_code = None
+
+    for instruction in dis.get_instructions(py_function):
+        opname = instruction.opname
+        if opname == 'LOAD_CONST':
+            cpp_code = instruction.argval
+        elif opname == 'LOAD_GLOBAL':
+            cpp_code = py_function.__globals__.get(instruction.argval)
+        elif opname == 'STORE_FAST' and instruction.argval == '__cpp_nogil__' and cpp_nogil_code is None:
+            cpp_nogil_code = cpp_code
+        elif opname == 'STORE_FAST' and instruction.argval == '__cpp__':
+            break
+
+    return cpp_code, cpp_nogil_code
+
+
+def _native_type_name(annotation):
+    """Name of the native type of an annotation
+
+    Returns:
+        str,None: The key in :data:`NATIVE_TYPES` or ``None`` if the annotation has not a native type
+    """
+    if isinstance(annotation, str):
+        name = annotation
+    else:
+        name = getattr(annotation, '__name__', None)
+
+    if name in NATIVE_TYPES and (isinstance(annotation, str) or annotation in (int, float, bool)):
+        return name
+    return None
+
+
+def _array_type(annotation):
+    """Type of a `numpy` array annotation, as ``'float64[:, ::1]'``
+
+    Returns:
+        tuple[str,int,str],None: The dtype, the number of dimensions and the required contiguity
+            (``'C'``, ``'F'`` or ``None``) of the array or ``None`` if the annotation is not an array type,
+            including the annotations with brackets whose type is not a dtype of :data:`ARRAY_TYPES`
+
+    Raises:
+        ValueError: if the array annotation is not valid
+    """
+    if not isinstance(annotation, str):
+        return None
+
+    match = _ARRAY_ANNOTATION.match(annotation)
+    if match is None:
+        return None
+
+    # Other generic annotations (i.e. 'list[int]' with postponed evaluation) are Python objects
+    dtype = match.group(1)
+    if dtype not in ARRAY_TYPES:
+        return None
+    dimensions = [dimension.replace(' ', '') for dimension in match.group(2).split(',')]
+    if any(dimension not in (':', '::1') for dimension in dimensions):
+        raise ValueError('Invalid dimensions in array annotation %s' % annotation)
+
+    contiguous = None
+    if dimensions[-1] == '::1' and dimensions.count('::1') == 1:
+        contiguous = 'C'
+    elif dimensions[0] == '::1' and dimensions.count('::1') == 1:
+        contiguous = 'F'
+    elif '::1' in dimensions:
+        raise ValueError('Only the first or the last dimension can be contiguous in array annotation %s' %
+                         annotation)
+
+    return dtype, len(dimensions), contiguous
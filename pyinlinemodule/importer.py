@@ -0,0 +1,124 @@
+"""
+Import hook that resolves the names of the compiled modules to their extension files.
+
+The modules built by :class:`pyinlinemodule.InlineModule` are loaded directly from their extension
+files and stored in ``sys.modules``, and the finder resolves their names for the next imports.
+"""
+
+import importlib.util
+import os
+import sys
+import threading
+from importlib.machinery import ExtensionFileLoader
+
+from . import inline
+
+
+class InlineModuleFinder(object):
+    """Finder of the compiled modules, to be placed in ``sys.meta_path``
+
+    The finder implements the ``importlib.abc.MetaPathFinder`` protocol, without importing ``importlib.abc``
+    that is slow to import.
+
+    A name is resolved only to the extension file registered with :meth:`register`, the build of the
+    module with the key of its current code. The other names are never searched in the file system.
+    """
+
+    def __init__(self):
+        self._modules = dict()
+        self._lock = threading.Lock()
+
+    def register(self, name, filename):
+        """Register the extension file of a module
+
+        Args:
+            name(str): Name of the module.
+            filename(str): Extension file of the module.
+        """
+        with self._lock:
+            self._modules[name] = filename
+
+    def find_spec(self, fullname, path=None, target=None):
+        # The compiled modules are always top level modules
+        if path is not None or '.' in fullname:
+            return None
+
+        # Only a dictionary lookup: the finder is called for every failed import of the process
+        with self._lock:
+            filename = self._modules.get(fullname)
+        if filename is None:
+            return None
+
+        return importlib.util.spec_from_file_location(fullname, filename,
+                                                      loader=ExtensionFileLoader(fullname, filename))
+
+
+FINDER = InlineModuleFinder()
+
+# Extension files loaded by load_extension()
+_LOADED_FILES = set()
+_LOADED_LOCK = threading.Lock()
+
+
+def install():
+    """Add the finder of the compiled modules at the end of ``sys.meta_path``
+    """
+    if FINDER not in sys.meta_path:
+        sys.meta_path.append(FINDER)
+
+
+def load_extension(name, filename):
+    """Import a compiled module from its extension file
+
+    The module is loaded directly from the file, so a module with the same name on ``sys.path`` never
+    replaces it. A module already imported from the same file is returned from ``sys.modules``; the
+    module is stored in ``sys.modules`` only if the name is free or used by another build of the same
+    module (i.e. an older build), so an unrelated module with the same name is left untouched.
+
+    Args:
+        name(str): Name of the module.
+        filename(str): Extension file of the module.
+
+    Returns:
+        The imported module
+    """
+    install()
+    FINDER.register(name, filename)
+
+    current = sys.modules.get(name)
+    if current is not None and getattr(current, '__file__', None) == filename:
+        return current
+
+    spec = importlib.util.spec_from_file_location(name, filename, loader=ExtensionFileLoader(name, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _loaded(filename)
+
+    # The initialization of a single-phase extension stores it in sys.modules
+    if current is None or _is_compiled_module(current):
+        sys.modules[name] = module
+    else:
+        sys.modules[name] = current
+    return module
+
+
+def _is_compiled_module(module):
+    """Whether a module was loaded by :func:`load_extension` or from the prebuilt modules or the build cache
+    """
+    filename = getattr(module, '__file__', None)
+    if filename is None:
+        return False
+    with _LOADED_LOCK:
+        if filename in _LOADED_FILES:
+            return True
+    for path in (inline.prebuilt_dir(), inline.cache_dir()):
+        if path is not None and os.path.abspath(filename).startswith(os.path.join(os.path.abspath(path), '')):
+            return True
+    return False
+
+
+def _loaded(filename):
+    """Record an extension file loaded by :func:`load_extension`
+    """
+    with _LOADED_LOCK:
+        _LOADED_FILES.add(filename)
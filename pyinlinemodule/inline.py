@@ -1,9 +1,22 @@
 import os
+import platform
+import sys
 import tempfile
 import atexit
 import shutil
 import glob
 import stat
+import hashlib
+import shlex
+import sysconfig
+from contextlib import contextmanager, ExitStack
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+from .stats import BuildReport, record_build
 
 
 if 'PY_INLINE_TEMP' in os.environ:
@@ -11,7 +24,41 @@ if 'PY_INLINE_TEMP' in os.environ:
 else:
     _PATH = tempfile.mkdtemp(prefix='pyinline_tmp_')
 
+if 'PY_INLINE_CACHE' in os.environ:
+    _CACHE_PATH = os.environ['PY_INLINE_CACHE'] or None
+else:
+    _CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                               'pyinlinemodule')
+
+
+def _parse_size(value):
+    """Size in bytes of a string with an optional ``K``, ``M`` or ``G`` suffix, as ``'512M'``
+
+    Returns:
+        int,None: The size in bytes or ``None`` for an empty string
+
+    Raises:
+        ValueError: if the string is not a valid size
+    """
+    value = value.strip().upper()
+    if not value:
+        return None
+    multiplier = 1
+    if value[-1] in 'KMG':
+        multiplier = 1024 ** ('KMG'.index(value[-1]) + 1)
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+# Limits of the size (in bytes) and of the number of entries of the build cache, None for no limit
+_CACHE_MAX_SIZE = _parse_size(os.environ.get('PY_INLINE_CACHE_SIZE', '1G'))
+_CACHE_MAX_ENTRIES = int(os.environ['PY_INLINE_CACHE_ENTRIES']) if os.environ.get('PY_INLINE_CACHE_ENTRIES') else None
+
+# Folder of the modules built ahead of time with ``python -m pyinlinemodule build``
+_PREBUILT_PATH = os.environ.get('PY_INLINE_PREBUILT') or None
+
 _EXTRA_COMPILE_ARGS = []
+_EXTRA_LINK_ARGS = []
 _MOD_EXTENSION = '.pyd'
 
 
@@ -28,6 +75,13 @@ if os.name == 'posix':
     # Compile args for Linux systems, in particular GCC
     _EXTRA_COMPILE_ARGS += ['-O3', '-march=native', '-std=c++11']
     _MOD_EXTENSION = '.so'
+    if sys.platform == 'darwin':
+        # Apple clang needs the OpenMP runtime of Homebrew (libomp)
+        OPENMP_COMPILE_ARGS = ['-Xpreprocessor', '-fopenmp']
+        OPENMP_LINK_ARGS = ['-lomp']
+    else:
+        OPENMP_COMPILE_ARGS = ['-fopenmp']
+        OPENMP_LINK_ARGS = ['-fopenmp']
     _PERMISSIONS = stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR | \
         stat.S_IRGRP | stat.S_IWGRP | stat.S_IXGRP | \
         stat.S_IROTH | stat.S_IWOTH | stat.S_IXOTH
@@ -36,10 +90,46 @@ elif os.name == 'nt':
     # Compile args for Windows systems, in particular MSVC
     _EXTRA_COMPILE_ARGS = ['/O2', ' /GL-', '/MP', '/LTCG:OFF']
     _MOD_EXTENSION = '.pyd'
+    OPENMP_COMPILE_ARGS = ['/openmp']
+    OPENMP_LINK_ARGS = []
     _PERMISSIONS = stat.S_IWRITE | stat.S_IREAD
 
 os.chmod(_PATH, _PERMISSIONS)
 
+# Build the modules calling directly the compiler (`compiler`) or with setuptools (`setuptools`).
+# The direct compiler driver supports only GCC-like compilers, so MSVC always uses setuptools.
+BUILD_BACKENDS = ('compiler', 'setuptools')
+if 'PY_INLINE_BACKEND' in os.environ:
+    _BUILD_BACKEND = os.environ['PY_INLINE_BACKEND']
+    if _BUILD_BACKEND not in BUILD_BACKENDS:
+        raise ValueError('Unknown build backend %s in PY_INLINE_BACKEND, expected one of %s' %
+                         (_BUILD_BACKEND, ', '.join(BUILD_BACKENDS)))
+elif os.name == 'posix':
+    _BUILD_BACKEND = 'compiler'
+else:
+    _BUILD_BACKEND = 'setuptools'
+
+# Precompile the headers included at the beginning of the modules (compiler backend only)
+_PRECOMPILED_HEADERS = os.environ.get('PY_INLINE_PCH', '1') != '0'
+
+# x86-64 ISA levels of the portable builds, from the baseline. Empty for the builds for the native CPU.
+_ISA_LEVELS = [level for level in os.environ.get('PY_INLINE_ISA', '').split(',') if level]
+
+# File of the folders of prebuilt modules with their build configuration (see prebuilt_config())
+PREBUILT_MARKER = '.prebuilt'
+_PREBUILT_CONFIGS = dict()
+_PREBUILT_MISMATCHES = set()
+
+# CPU and compiler version of the builds for the native CPU (see _native_build_identity())
+_CPU_IDENTITY = None
+_COMPILER_VERSION = None
+
+# Version of GCC detected by _gcc_version(), an empty tuple if the compiler is not GCC
+_GCC_VERSION = None
+
+# x86-64 psABI levels supported by the portable builds
+ISA_LEVELS = ('x86-64', 'x86-64-v2', 'x86-64-v3', 'x86-64-v4')
+
 
 def extra_compile_args():
     """Extra compilation flags passed to the compiler
@@ -57,9 +147,711 @@ def set_extra_compile_args(compile_args):
     _EXTRA_COMPILE_ARGS = list(compile_args)
 
 
-def build_install_module(module_src, mod_name, extension_kwargs=None, module_dir=None, silent=True):
+def extra_link_args():
+    """Extra link flags passed to the linker
+    """
+    return _EXTRA_LINK_ARGS[::]
+
+
+def set_extra_link_args(link_args):
+    """Set the extra link flags passed to the linker
+
+    Args:
+        link_args(list[str]): List of arguments for the linker
+    """
+    global _EXTRA_LINK_ARGS
+    _EXTRA_LINK_ARGS = list(link_args)
+
+
+def build_backend():
+    """Backend used for building the modules
+
+    Returns:
+        str: ``compiler`` if the C++ compiler is called directly, ``setuptools`` if the modules are built
+            with setuptools
+    """
+    return _BUILD_BACKEND
+
+
+def set_build_backend(backend):
+    """Set the backend used for building the modules
+
+    The default backend can be set with the ``PY_INLINE_BACKEND`` environment variable.
+
+    Args:
+        backend(str): ``compiler`` to call directly the C++ compiler (GCC-like compilers only),
+            ``setuptools`` to build the modules with setuptools.
+
+    Raises:
+        ValueError: if the backend is not one of :data:`BUILD_BACKENDS`
+    """
+    global _BUILD_BACKEND
+    if backend not in BUILD_BACKENDS:
+        raise ValueError('Unknown build backend %s, expected one of %s' % (backend, ', '.join(BUILD_BACKENDS)))
+    _BUILD_BACKEND = backend
+
+
+def isa_levels():
+    """x86-64 ISA levels of the portable builds
+
+    Returns:
+        list[str]: The ISA levels, from the baseline, or an empty list if the modules are built for the native CPU
+    """
+    return _ISA_LEVELS[::]
+
+
+def set_isa_levels(levels):
+    """Set the x86-64 ISA levels of the portable builds
+
+    The modules are built for the first (baseline) level instead of the native CPU (``-march=native``) and
+    each :class:`InlineFunction` is compiled also for the other levels. The module selects at import
+    the variant of the functions for the best level supported by the CPU, so the same module runs on
+    all the CPUs with the baseline level. The levels can be set with the ``PY_INLINE_ISA`` environment
+    variable, as ``PY_INLINE_ISA=x86-64,x86-64-v3,x86-64-v4`` (baseline, AVX2 and AVX-512).
+    The portable builds require GCC.
+
+    Args:
+        levels(list[str]): The levels, from :data:`ISA_LEVELS`, or an empty list to build the modules for the
+            native CPU
+
+    Raises:
+        ValueError: if a level is not valid, the platform is not x86-64 or the compiler is not GCC 12 or newer
+    """
+    global _ISA_LEVELS
+    levels = list(levels)
+    for level in levels:
+        if level not in ISA_LEVELS:
+            raise ValueError('Unknown ISA level %s' % level)
+    if levels:
+        _check_isa_levels_support()
+    _ISA_LEVELS = levels
+
+
+def _check_isa_levels_support():
+    """Verify that the platform and the compiler support the portable builds
+
+    Raises:
+        ValueError: if the platform is not x86-64 or the compiler is not GCC 12 or newer
+    """
+    if os.name != 'posix' or platform.machine().lower() not in ('x86_64', 'amd64'):
+        raise ValueError('The portable builds are available only for x86-64 POSIX systems')
+    # -march=x86-64-v<N> requires GCC 11, __builtin_cpu_supports("x86-64-v<N>") GCC 12
+    _require_gcc((12, 0), 'The portable builds')
+
+
+def precompiled_headers():
+    """Whether the headers of the modules are precompiled
+
+    Returns:
+        bool: ``True`` if the precompiled headers are enabled
+    """
+    return _PRECOMPILED_HEADERS
+
+
+def set_precompiled_headers(enable=True):
+    """Enable the precompiled headers
+
+    The preprocessor directives at the beginning of the source of a module (i.e. the inclusion of
+    ``Python.h`` and of the `numpy` headers) are compiled once in a precompiled header, stored in
+    the ``pch`` folder of the build cache, and reused by the next builds with the same compiler,
+    flags and headers. The precompiled headers are used only by the ``compiler`` backend and can also
+    be disabled with ``PY_INLINE_PCH=0``.
+
+    Keyword Args:
+        enable(bool): ``True`` to enable the precompiled headers, ``False`` to disable them
+    """
+    global _PRECOMPILED_HEADERS
+    _PRECOMPILED_HEADERS = enable
+
+
+def cache_dir():
+    """Folder of the persistent build cache
+
+    The default location is ``$XDG_CACHE_HOME/pyinlinemodule`` (``~/.cache/pyinlinemodule``) and it
+    can be changed with the ``PY_INLINE_CACHE`` environment variable. An empty ``PY_INLINE_CACHE``
+    disables the cache.
+
+    Returns:
+        str,None: The cache folder or ``None`` if the cache is disabled
+    """
+    return _CACHE_PATH
+
+
+def set_cache_dir(path):
+    """Set the folder of the persistent build cache
+
+    Args:
+        path(str,None): The cache folder or ``None`` to disable the cache and build the modules
+            in a temporary folder removed at exit.
+    """
+    global _CACHE_PATH
+    _CACHE_PATH = path
+
+
+def cache_limits():
+    """Limits of the build cache
+
+    When a module is added to the cache, the least recently used entries are removed until the cache
+    is within the limits (see :func:`pyinlinemodule.cache.prune_cache`). The default limits are 1 GiB
+    and no limit of entries, and they can be changed with the ``PY_INLINE_CACHE_SIZE`` (i.e. ``512M``)
+    and ``PY_INLINE_CACHE_ENTRIES`` environment variables. An empty value disables the limit.
+
+    Returns:
+        tuple[int,int]: The maximum size in bytes and the maximum number of entries, ``None`` for no limit
+    """
+    return _CACHE_MAX_SIZE, _CACHE_MAX_ENTRIES
+
+
+def set_cache_limits(max_size=None, max_entries=None):
+    """Set the limits of the build cache
+
+    Keyword Args:
+        max_size(int,str): Maximum size in bytes, as number or as string with a ``K``, ``M`` or ``G``
+            suffix. Default ``None`` for no limit.
+        max_entries(int): Maximum number of entries. Default ``None`` for no limit.
+    """
+    global _CACHE_MAX_SIZE, _CACHE_MAX_ENTRIES
+    _CACHE_MAX_SIZE = _parse_size(max_size) if isinstance(max_size, str) else max_size
+    _CACHE_MAX_ENTRIES = max_entries
+
+
+def _mark_used(path):
+    """Record the use of an entry of the build cache, for the least recently used eviction
+
+    The access time of the files is not reliable (i.e. ``noatime`` mounts), so the modification
+    time of the entry is updated.
+    """
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def prebuilt_dir():
+    """Folder of the modules built ahead of time
+
+    The modules in this folder, built by ``python -m pyinlinemodule build``, are loaded before searching
+    the build cache, so that no compiler is required. The folder can be set with the ``PY_INLINE_PREBUILT``
+    environment variable.
+
+    Returns:
+        str,None: The folder of the prebuilt modules or ``None`` if it is not set
+    """
+    return _PREBUILT_PATH
+
+
+def set_prebuilt_dir(path):
+    """Set the folder of the modules built ahead of time
+
+    The process uses the compile flags and the ISA levels of the prebuilt modules (see :func:`prebuilt_config`),
+    so it generates the same C++ code and it finds the prebuilt modules.
+
+    Args:
+        path(str,None): The folder of the prebuilt modules or ``None`` to disable them
+    """
+    global _PREBUILT_PATH
+    _PREBUILT_PATH = path
+    _use_prebuilt_target(path)
+
+
+def profile_data_dir(mod_name, cache_key):
+    """Folder of the profile data of a module built with the profile guided optimization
+
+    The folder is next to the module in the build cache (or in the temporary folder if the cache is disabled).
+
+    Args:
+        mod_name(str): Name of the module.
+        cache_key(str): Key of the module without the profile guided optimization.
+
+    Returns:
+        str: The folder of the profile data
+    """
+    return os.path.join(_CACHE_PATH or _PATH, '%s-%s.pgo' % (mod_name, cache_key))
+
+
+def profile_guided_flags(profile_dir, generate):
+    """Compile and link flags of the profile guided optimization with GCC
+
+    Args:
+        profile_dir(str): Folder of the profile data.
+        generate(bool): ``True`` for the flags of the instrumented build that writes the profile data,
+            ``False`` for the flags of the build optimized with the profile data.
+
+    Returns:
+        tuple[list[str],list[str]]: The compile flags and the link flags
+
+    Raises:
+        ValueError: if the build backend is not ``compiler`` or the compiler is not GCC 11 or newer
+    """
+    if _BUILD_BACKEND != 'compiler' or os.name != 'posix' or sys.platform == 'darwin':
+        raise ValueError('The profile guided optimization requires the compiler backend with GCC')
+    # The profile data of the builds in different folders is shared with -fprofile-prefix-path (GCC 11)
+    _require_gcc((11, 0), 'The profile guided optimization')
+
+    if generate:
+        # The counters are updated atomically, the functions could be executed by many threads
+        compile_flags = ['-fprofile-generate=' + profile_dir, '-fprofile-update=atomic']
+        return compile_flags, ['-fprofile-generate=' + profile_dir]
+    # The module init function, after the function that writes the profile data, is built without its profile
+    _mark_used(profile_dir)
+    return ['-fprofile-use=' + profile_dir, '-fprofile-correction', '-Wno-error=coverage-mismatch'], []
+
+
+def _compiler_identity():
+    """Identity of the compiler used for the build
+
+    Only the configuration is used (no compiler is executed), so that the same identity is computed
+    on machines without a compiler.
+    """
+    return os.environ.get('CXX') or sysconfig.get_config_var('CXX') or sysconfig.get_config_var('CC') or ''
+
+
+def _native_build_identity():
+    """Identity of the CPU and of the compiler version of the builds for the native CPU (``-march=native``)
+
+    A module built for the native CPU could use instructions not available on another CPU, and the build
+    cache could be shared by different hosts (i.e. a home folder on NFS), so these builds are identified
+    by the CPU model and features and by the version of the compiler.
+
+    Returns:
+        tuple[str,str]: The identity of the CPU and the version of the compiler
+    """
+    return _cpu_identity(), _compiler_version()
+
+
+def _cpu_identity():
+    """Model and features of the CPU, from ``/proc/cpuinfo`` on Linux, computed once by process
+    """
+    global _CPU_IDENTITY
+    if _CPU_IDENTITY is None:
+        cpu = [platform.machine()]
+        try:
+            with open('/proc/cpuinfo') as cpuinfo:
+                for line in cpuinfo:
+                    if not line.strip():
+                        # Only the first processor
+                        break
+                    name, _, value = line.partition(':')
+                    if name.strip() in ('vendor_id', 'cpu family', 'model', 'flags', 'CPU implementer',
+                                        'CPU part', 'Features'):
+                        cpu.append(value.strip())
+        except OSError:
+            cpu.append(platform.processor())
+        _CPU_IDENTITY = ' '.join(cpu)
+    return _CPU_IDENTITY
+
+
+def _compiler_version():
+    """First line of the ``--version`` output of the compiler, computed once by process
+    """
+    global _COMPILER_VERSION
+    if _COMPILER_VERSION is None:
+        import subprocess
+
+        try:
+            result = subprocess.run(shlex.split(_compiler_identity()) + ['--version'], stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, universal_newlines=True)
+            _COMPILER_VERSION = result.stdout.strip().split('\n')[0]
+        except OSError:
+            _COMPILER_VERSION = ''
+    return _COMPILER_VERSION
+
+
+def _native_build_key_parts(compile_args, with_compiler=True):
+    """Parts of the cache key that identify the builds for the native CPU, empty for the portable builds
+
+    Args:
+        compile_args(list[str]): All the compile flags of the build.
+    """
+    if '-march=native' not in compile_args:
+        return []
+    return list(_native_build_identity()) if with_compiler else [_cpu_identity()]
+
+
+def prebuilt_config(path):
+    """Build configuration of a folder of prebuilt modules
+
+    The keys of the prebuilt modules are computed with this configuration instead of the configuration
+    of the current process, so the modules are found also where the compile flags or the ISA levels are
+    not configured as in the ahead-of-time build.
+
+    Args:
+        path(str): The folder of the prebuilt modules.
+
+    Returns:
+        dict,None: The compile and link flags (``compile_args`` and ``link_args``), the ISA levels
+            (``isa_levels``), the build backend (``backend``), the architecture of the build machine
+            (``machine``) and, for the builds for the native CPU, its identity (``cpu``). ``None`` if the
+            folder does not contain prebuilt modules.
+    """
+    config_filename = os.path.join(path, PREBUILT_MARKER)
+    try:
+        mtime = os.path.getmtime(config_filename)
+    except OSError:
+        return None
+
+    cached = _PREBUILT_CONFIGS.get(config_filename)
+    if cached is None or cached[0] != mtime:
+        import json
+        try:
+            with open(config_filename) as config_file:
+                config = json.load(config_file)
+        except (OSError, ValueError):
+            # Written by an older version
+            config = dict()
+        cached = _PREBUILT_CONFIGS[config_filename] = (mtime, config)
+    return cached[1]
+
+
+def write_prebuilt_config(path):
+    """Record the build configuration of the current process in a folder of prebuilt modules
+
+    Args:
+        path(str): The folder of the prebuilt modules.
+    """
+    import json
+
+    compile_args = _isa_compile_args(_EXTRA_COMPILE_ARGS)
+    config = dict(
+        compile_args=_EXTRA_COMPILE_ARGS,
+        link_args=_EXTRA_LINK_ARGS,
+        isa_levels=_ISA_LEVELS,
+        backend=_BUILD_BACKEND,
+        machine=platform.machine(),
+        cpu=_cpu_identity() if '-march=native' in compile_args else None,
+    )
+    os.makedirs(path, exist_ok=True)
+    temp_filename = os.path.join(path, '%s.%d.tmp' % (PREBUILT_MARKER, os.getpid()))
+    with open(temp_filename, 'w') as config_file:
+        json.dump(config, config_file, indent=2)
+    os.replace(temp_filename, os.path.join(path, PREBUILT_MARKER))
+
+
+def _use_prebuilt_target(path):
+    """Build the modules of the process for the target of the prebuilt modules of a folder
+
+    The C++ code of the portable builds depends on the ISA levels, so the modules are found in the
+    folder only if the process generates their code as the ahead-of-time build.
+    """
+    global _EXTRA_COMPILE_ARGS, _EXTRA_LINK_ARGS, _ISA_LEVELS
+    config = prebuilt_config(path) if path is not None else None
+    if not config or not _prebuilt_config_matches(path, config):
+        return
+    _EXTRA_COMPILE_ARGS = list(config.get('compile_args', _EXTRA_COMPILE_ARGS))
+    _EXTRA_LINK_ARGS = list(config.get('link_args', _EXTRA_LINK_ARGS))
+    _ISA_LEVELS = list(config.get('isa_levels', _ISA_LEVELS))
+
+
+def _prebuilt_config_matches(path, config):
+    """Whether the prebuilt modules of a folder run on this machine, warning once if they do not
+    """
+    if config.get('machine', platform.machine()) == platform.machine() and \
+            config.get('cpu') in (None, _cpu_identity()):
+        return True
+
+    if path not in _PREBUILT_MISMATCHES:
+        _PREBUILT_MISMATCHES.add(path)
+        import warnings
+        warnings.warn('The prebuilt modules of %s were built for another CPU (%s) and are not used' %
+                      (path, 'native CPU' if config.get('cpu') else config.get('machine')))
+    return False
+
+
+def _gcc_version():
+    """Version of the GCC compiler used for the build, detected once from its predefined macros
+
+    Returns:
+        tuple[int,int],None: The major and minor version or ``None`` if the compiler is not GCC (i.e. clang,
+            that defines the macros of GCC too) or it can not be executed
+    """
+    global _GCC_VERSION
+    if _GCC_VERSION is None:
+        import subprocess
+
+        version = ()
+        try:
+            result = subprocess.run(shlex.split(_compiler_identity()) + ['-dM', '-E', '-x', 'c++', os.devnull],
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+            macros = dict(line.split()[1:3] for line in result.stdout.splitlines() if len(line.split()) >= 3)
+            if result.returncode == 0 and '__clang__' not in macros and '__GNUC__' in macros:
+                version = (int(macros['__GNUC__']), int(macros.get('__GNUC_MINOR__', 0)))
+        except (OSError, ValueError):
+            pass
+        _GCC_VERSION = version
+    return _GCC_VERSION or None
+
+
+def _require_gcc(minimum_version, feature):
+    """Verify that the compiler is GCC with at least the given version
+
+    Raises:
+        ValueError: if the compiler is not GCC or it is older than ``minimum_version``
+    """
+    version = _gcc_version()
+    if version is None or version < minimum_version:
+        found = 'not GCC' if version is None else 'GCC %d.%d' % version
+        raise ValueError('%s require GCC %d.%d or newer, the compiler %s is %s' %
+                         (feature, minimum_version[0], minimum_version[1], _compiler_identity(), found))
+
+
+def module_cache_key(module_src, extension_kwargs=None, key_extra=None, sources=None, build_config=None):
+    """Hash identifying a compiled module in the build cache
+
+    The key covers the source code, the extension arguments, the extra compile and link flags,
+    the build backend, the compiler identity and the Python ABI. The builds for the native CPU are
+    identified also by the CPU and by the compiler version (see :func:`_native_build_identity`).
+
+    Args:
+        module_src(str): C++ source code of the module.
+
+    Keyword Args:
+        extension_kwargs(dict): Extra arguments for the compilation of the extension module.
+        key_extra(iterable[str]): Other values that identify the build (i.e. the numpy version).
+        sources(list[str]): C++ code of the other translation units of the module.
+        build_config(dict): Build configuration of a folder of prebuilt modules (see :func:`prebuilt_config`)
+            used instead of the configuration of the current process. The prebuilt modules are loaded on
+            machines without a compiler, so the builds for the native CPU are identified only by the CPU.
+            Default ``None``.
+
+    Returns:
+        str: The hexadecimal hash of the module
+    """
+    if extension_kwargs is None:
+        extension_kwargs = dict()
+
+    compile_args, link_args, isa_levels, backend = _EXTRA_COMPILE_ARGS, _EXTRA_LINK_ARGS, _ISA_LEVELS, _BUILD_BACKEND
+    if build_config is not None:
+        compile_args = build_config.get('compile_args', compile_args)
+        link_args = build_config.get('link_args', link_args)
+        isa_levels = build_config.get('isa_levels', isa_levels)
+        backend = build_config.get('backend', backend)
+    all_compile_args = list(extension_kwargs.get('extra_compile_args', [])) + \
+        _isa_compile_args(compile_args, isa_levels)
+
+    key_parts = [module_src] + list(sources or ()) + [
+        repr(sorted(extension_kwargs.items())),
+        repr(compile_args),
+        repr(link_args),
+        repr(isa_levels),
+        backend,
+        _compiler_identity(),
+        sys.implementation.cache_tag,
+        str(sysconfig.get_config_var('EXT_SUFFIX')),
+    ] + _native_build_key_parts(all_compile_args, with_compiler=build_config is None)
+    if key_extra is not None:
+        key_parts += [str(value) for value in key_extra]
+
+    hasher = hashlib.sha256()
+    for part in key_parts:
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()[:32]
+
+
+def _code_key_parts(code):
+    """Parts of the key of the bytecode of a function, with the constants of its nested functions
+    """
+    return [code.co_code.hex(), repr(code.co_names), repr(code.co_varnames)] + \
+        [_canonical_repr(const) for const in code.co_consts]
+
+
+def _canonical_repr(value):
+    """Representation of a constant that does not depend on the process
+
+    The order of the items of a set depends on the hash randomization of the strings, so the items
+    are sorted. The nested code objects are represented by their key.
+    """
+    if hasattr(value, 'co_code'):
+        return '<code %s>' % ' '.join(_code_key_parts(value))
+    if isinstance(value, (set, frozenset)):
+        return '%s({%s})' % (type(value).__name__, ', '.join(sorted(_canonical_repr(item) for item in value)))
+    if isinstance(value, (tuple, list)):
+        return '%s(%s)' % (type(value).__name__, ', '.join(_canonical_repr(item) for item in value))
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join('%s: %s' % (_canonical_repr(key), _canonical_repr(item))
+                                  for key, item in value.items())
+    return repr(value)
+
+
+def function_cache_key(py_functions, key_extra=None):
+    """Key of a module computed only from cheap data of its Python functions
+
+    The key depends on the bytecode and the constants (with the C++ code), the defaults and the annotations
+    of the functions, on the strings of the globals they use, on the version of pyinlinemodule and on the
+    build configuration. A module is found by this key (see :func:`find_function_module`) without
+    generating its C++ code.
+
+    Args:
+        py_functions(list[function]): The Python functions of the module.
+
+    Keyword Args:
+        key_extra(iterable[str]): Other values that identify the module (i.e. the options of the functions).
+
+    Returns:
+        str: The hash of the functions and of the build configuration
+    """
+    from . import __version__
+
+    key_parts = list()
+    for py_function in py_functions:
+        code = py_function.__code__
+        key_parts += [py_function.__name__] + _code_key_parts(code)
+        key_parts += [_canonical_repr(py_function.__defaults__), _canonical_repr(py_function.__kwdefaults__),
+                      _canonical_repr(py_function.__annotations__)]
+        # The C++ code can be assigned from a global string
+        key_parts += ['%s=%s' % (name, py_function.__globals__[name]) for name in code.co_names
+                      if isinstance(py_function.__globals__.get(name), str)]
+
+    key_parts += [
+        __version__,
+        repr(_EXTRA_COMPILE_ARGS),
+        repr(_EXTRA_LINK_ARGS),
+        repr(_ISA_LEVELS),
+        _BUILD_BACKEND,
+        os.environ.get('CXX', ''),
+        sys.implementation.cache_tag,
+        # The cache tag does not identify the ABI (i.e. debug or free-threaded builds)
+        str(sysconfig.get_config_var('EXT_SUFFIX')),
+    ] + _native_build_key_parts(_isa_compile_args(_EXTRA_COMPILE_ARGS))
+    if key_extra is not None:
+        key_parts += [str(value) for value in key_extra]
+
+    hasher = hashlib.sha256()
+    for part in key_parts:
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()[:32]
+
+
+def _key_extra_matches(key_extra):
+    """Whether the values of the cache key of a module (i.e. ``numpy=<version>``) match the current environment
+    """
+    for value in key_extra:
+        if value.startswith('numpy='):
+            import numpy
+            if value != 'numpy=' + numpy.__version__:
+                return False
+    return True
+
+
+def find_function_module(mod_name, function_key):
+    """Search a module in the prebuilt modules and in the build cache by the key of its functions
+
+    The index of the modules by :func:`function_cache_key` is in the ``functions`` folder of the cache.
+
+    Args:
+        mod_name(str): Name of the module.
+        function_key(str): Key of the functions of the module.
+
+    Returns:
+        str,None: The filename of the compiled module or ``None`` if the module is not in the index
+    """
+    for cache_path in (_PREBUILT_PATH, _CACHE_PATH):
+        if cache_path is None:
+            continue
+        try:
+            with open(os.path.join(cache_path, 'functions', mod_name + '-' + function_key)) as index_file:
+                lines = index_file.read().splitlines()
+        except (OSError, ValueError):
+            continue
+        # An empty or truncated index (i.e. written by another version) is a cache miss
+        if len(lines) == 0 or not lines[0]:
+            continue
+
+        module_filename = os.path.join(cache_path, lines[0])
+        if os.path.isfile(module_filename) and _key_extra_matches(lines[1:]):
+            if cache_path == _CACHE_PATH:
+                _mark_used(os.path.dirname(module_filename))
+            return module_filename
+    return None
+
+
+def record_function_module(mod_name, function_key, module_filename, key_extra=None):
+    """Add a module of the build cache to the index by the key of its functions
+
+    Args:
+        mod_name(str): Name of the module.
+        function_key(str): Key of the functions of the module.
+        module_filename(str): Filename of the compiled module. A module out of the build cache is not added.
+
+    Keyword Args:
+        key_extra(iterable[str]): Values of the cache key of the module verified when the module is found.
+    """
+    if _CACHE_PATH is None:
+        return
+    relative_filename = os.path.relpath(os.path.abspath(module_filename), os.path.abspath(_CACHE_PATH))
+    if relative_filename.startswith(os.pardir):
+        return
+
+    index_filename = os.path.join(_CACHE_PATH, 'functions', mod_name + '-' + function_key)
+    temp_filename = '%s.%d.tmp' % (index_filename, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(index_filename), exist_ok=True)
+        # The index is renamed when complete, so a reader never finds it partially written
+        with open(temp_filename, 'w') as index_file:
+            index_file.write('\n'.join([relative_filename] + [str(value) for value in key_extra or []]))
+        os.replace(temp_filename, index_filename)
+    except OSError:
+        try:
+            os.remove(temp_filename)
+        except OSError:
+            pass
+
+
+def _find_module_file(module_dir, mod_name):
+    """Search the compiled module in a folder
+
+    Returns:
+        str,None: The filename of the module or ``None`` if the module does not exist
+    """
+    path_to_search = os.path.join(module_dir, mod_name + '.*' + _MOD_EXTENSION)
+    matched_files = glob.glob(path_to_search)
+    if len(matched_files) != 1:
+        return None
+    return matched_files[0]
+
+
+def find_cached_module(module_src, mod_name, extension_kwargs=None, key_extra=None, sources=None):
+    """Search an already built module in the prebuilt modules and in the build cache
+
+    Args:
+        module_src(str): C++ source code of the module.
+        mod_name(str): Name of the module.
+
+    Keyword Args:
+        extension_kwargs(dict): Extra arguments for the compilation of the extension module.
+        key_extra(iterable[str]): Other values that identify the build in the cache.
+        sources(list[str]): C++ code of the other translation units of the module.
+
+    Returns:
+        str,None: The filename of the compiled module or ``None`` if the module is not in the cache
+    """
+    cache_paths = [path for path in (_PREBUILT_PATH, _CACHE_PATH) if path is not None]
+    if len(cache_paths) == 0:
+        return None
+
+    for cache_path in cache_paths:
+        build_config = prebuilt_config(cache_path)
+        if build_config is not None and not _prebuilt_config_matches(cache_path, build_config):
+            continue
+        cache_key = module_cache_key(module_src, extension_kwargs, key_extra, sources, build_config=build_config)
+        module_dir = os.path.join(cache_path, mod_name + '-' + cache_key)
+        module_filename = _find_module_file(module_dir, mod_name)
+        if module_filename is not None:
+            if cache_path == _CACHE_PATH:
+                _mark_used(module_dir)
+            return module_filename
+    return None
+
+
+def build_install_module(module_src, mod_name, extension_kwargs=None, module_dir=None, silent=True,
+                         key_extra=None, report=None, sources=None):
     """Build and install the compiled C Extension in the provided (or default) folder.
 
+    If ``module_dir`` is not provided and the build cache is enabled, the module is built in
+    a folder of the cache identified by :func:`module_cache_key` and the compilation is
+    skipped if the module was already built.
+
     Args:
         module_src(str): C++ source code of the module.
         mod_name(str): Name of the module.
@@ -68,49 +860,235 @@ def build_install_module(module_src, mod_name, extension_kwargs=None, module_dir
         extension_kwargs(dict): Extra arguments for the compilation of the extension module.
             Default ``None`` for no custom args.
         module_dir(str): Folder in which the module must be biult and installed. Default
-            to a temporary folder.
+            to the build cache or to a temporary folder if the cache is disabled.
         silent(bool): Disable verbosity logging. Default ``True``
+        key_extra(iterable[str]): Other values that identify the build in the cache.
+        report(BuildReport): Report where the timings of the build are stored. If not provided, the
+            build is recorded in the build statistics by this function.
+        sources(list[str]): C++ code of other translation units of the module. With the ``compiler``
+            backend, each translation unit is compiled to an object file stored in the ``objects`` folder
+            of the build cache by the hash of its code, and reused by the next builds.
 
     Returns:
         str,None: The filename of the compiled module or ``None`` if errors happens
             during compilation
+
+    Raises:
+        ValueError: if the portable builds are enabled and the compiler does not support them
     """
+    own_report = report is None
+    if own_report:
+        report = BuildReport(mod_name)
 
-    # Save the current path so we can reset at the end of this function.
-    curpath = os.getcwd()
-    mod_name_c = mod_name + '.cpp'
+    module_filename = _build_install_module(module_src, mod_name, extension_kwargs, module_dir, silent,
+                                            key_extra, report, sources or [])
+
+    report.success = module_filename is not None
+    if own_report:
+        record_build(report)
+
+    return module_filename
+
+
+def _build_install_module(module_src, mod_name, extension_kwargs, module_dir, silent, key_extra, report, sources):
+    """Implementation of :func:`build_install_module`
+    """
+    report.backend = _BUILD_BACKEND
+    report.source_size = sum(len(source.encode('utf-8')) for source in [module_src] + sources)
 
     if module_dir is None:
-        module_dir = str(_PATH)
+        with report.phase('cache_lookup'):
+            module_filename = find_cached_module(module_src, mod_name, extension_kwargs, key_extra, sources)
+        if module_filename is not None:
+            report.cache_hit = True
+            report.module_size = os.path.getsize(module_filename)
+            return module_filename
 
-    os.makedirs(module_dir, exist_ok=True)
+    if _ISA_LEVELS:
+        # The levels of PY_INLINE_ISA are verified by the first build, not at import
+        _check_isa_levels_support()
 
-    # Change to the code directory.
-    os.chdir(module_dir)
+    if module_dir is not None:
+        os.makedirs(module_dir, exist_ok=True)
+        return _build_in_folder(module_src, mod_name, extension_kwargs, module_dir, silent, report, sources)
 
-    module_filename = None
+    if _CACHE_PATH is None:
+        # A folder for each build, so the processes sharing the temporary folder never overwrite the modules
+        module_dir = tempfile.mkdtemp(prefix=mod_name + '-', dir=_PATH)
+        return _build_in_folder(module_src, mod_name, extension_kwargs, module_dir, silent, report, sources)
+
+    cache_key = module_cache_key(module_src, extension_kwargs, key_extra, sources,
+                                 build_config=prebuilt_config(_CACHE_PATH))
+    module_dir = os.path.join(_CACHE_PATH, mod_name + '-' + cache_key)
+    os.makedirs(_CACHE_PATH, exist_ok=True)
+
+    # Only one process builds the module, the others wait for the lock and load the module
+    with ExitStack() as stack:
+        with report.phase('lock_wait'):
+            stack.enter_context(_file_lock(module_dir + '.lock'))
+
+        module_filename = _find_module_file(module_dir, mod_name)
+        if module_filename is not None:
+            report.cache_hit = True
+            report.module_size = os.path.getsize(module_filename)
+            return module_filename
+
+        # Build in a temporary folder renamed at the end, so a module in the cache is always complete
+        build_dir = '%s.%d.tmp' % (module_dir, os.getpid())
+        shutil.rmtree(build_dir, ignore_errors=True)
+        os.makedirs(build_dir)
+        module_filename = _build_in_folder(module_src, mod_name, extension_kwargs, build_dir, silent, report,
+                                           sources)
+        if module_filename is None:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            return None
+
+        shutil.rmtree(module_dir, ignore_errors=True)
+        try:
+            os.rename(build_dir, module_dir)
+        except OSError:
+            # The folder of a previous build is still in use: the module is loaded from the build folder
+            return module_filename
+        _mark_used(module_dir)
+
+    # The new module could exceed the limits of the cache
+    with report.phase('cache_prune'):
+        _prune_cache()
+    return os.path.join(module_dir, os.path.basename(module_filename))
+
+
+def _prune_cache():
+    """Remove the least recently used entries of the build cache exceeding the limits, never failing a build
+    """
+    if _CACHE_MAX_SIZE is None and _CACHE_MAX_ENTRIES is None:
+        return
+
+    from . import cache
     try:
-        from setuptools import setup, Extension
+        cache.prune_cache(min_age=cache.MIN_AGE)
+    except OSError:
+        pass
 
-        with open(mod_name_c, 'w') as module_cpp_file:
-            # Write out the code.
-            module_cpp_file.write(module_src)
 
+def _isa_compile_args(compile_args, isa_levels=None):
+    """Compile flags of the portable builds: the native CPU is replaced by the baseline ISA level
+    """
+    isa_levels = _ISA_LEVELS if isa_levels is None else isa_levels
+    if len(isa_levels) == 0:
+        return compile_args
+    return [arg for arg in compile_args if not arg.startswith('-march=')] + ['-march=' + isa_levels[0]]
+
+
+@contextmanager
+def _file_lock(path, blocking=True):
+    """Exclusive lock of a file, shared by the processes and by the threads
+
+    The lock is released by the operating system when the process exits, so a process that crashes
+    during a build never blocks the other processes.
+
+    Args:
+        path(str): The lock file, created if it does not exist
+
+    Keyword Args:
+        blocking(bool): Wait for the lock. Default ``True``.
+
+    Raises:
+        BlockingIOError: if ``blocking`` is ``False`` and the lock is held by another process
+    """
+    with open(path, 'a+') as lock_file:
+        if os.name == 'nt':
+            lock_file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after 10 seconds
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not blocking:
+                        raise BlockingIOError('The lock %s is held by another process' % path)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _build_in_folder(module_src, mod_name, extension_kwargs, module_dir, silent, report, sources):
+    """Build the module in a folder with the selected backend
+
+    Returns:
+        str,None: The filename of the compiled module or ``None`` if errors happens during compilation
+    """
+    module_filename = None
+    try:
         # Ensure the original extension_kwargs will not be modified
         if extension_kwargs is None:
             extension_kwargs = dict()
         else:
             extension_kwargs = extension_kwargs.copy()
 
-        if 'extra_compile_args' not in extension_kwargs:
-            extension_kwargs['extra_compile_args'] = list()
-        extension_kwargs['extra_compile_args'] += _EXTRA_COMPILE_ARGS
+        extension_kwargs['extra_compile_args'] = list(extension_kwargs.get('extra_compile_args', [])) + \
+            _isa_compile_args(_EXTRA_COMPILE_ARGS)
+        extension_kwargs['extra_link_args'] = list(extension_kwargs.get('extra_link_args', [])) + _EXTRA_LINK_ARGS
 
         if 'language' not in extension_kwargs:
             extension_kwargs['language'] = 'c++'
 
+        if _BUILD_BACKEND == 'compiler':
+            module_filename = _build_with_compiler(module_src, mod_name, extension_kwargs, module_dir, silent,
+                                                   report, sources)
+        else:
+            module_filename = _build_with_setuptools(module_src, mod_name, extension_kwargs, module_dir, silent,
+                                                     report, sources)
+
+        os.chmod(module_filename, _PERMISSIONS)
+        report.module_size = os.path.getsize(module_filename)
+    except:
+        module_filename = None
+        if silent is False:
+            import traceback
+            traceback.print_exc()
+
+    return module_filename
+
+
+def _build_with_setuptools(module_src, mod_name, extension_kwargs, module_dir, silent, report, sources):
+    """Build the module with the `build` command of setuptools
+
+    The other translation units are compiled again at each build.
+
+    Returns:
+        str: The filename of the compiled module
+
+    Raises:
+        RuntimeError: if the module could not be built
+    """
+    from setuptools import setup, Extension
+
+    # Save the current path so we can reset at the end of this function.
+    curpath = os.getcwd()
+    mod_name_c = mod_name + '.cpp'
+    sources_c = ['%s_%d.cpp' % (mod_name, index) for index in range(len(sources))]
+
+    # Change to the code directory.
+    os.chdir(module_dir)
+
+    try:
+        with report.phase('write_source'), open(mod_name_c, 'w') as module_cpp_file:
+            # Write out the code.
+            module_cpp_file.write(module_src)
+        for source, source_c in zip(sources, sources_c):
+            with report.phase('write_source'), open(source_c, 'w') as source_file:
+                source_file.write(source)
+
         # Create the extension module object.
-        ext = Extension(mod_name, [mod_name_c], **extension_kwargs)
+        ext = Extension(mod_name, [mod_name_c] + sources_c, **extension_kwargs)
 
         # Build and install the module.
         script_args = ['build', '--build-lib=' + module_dir]
@@ -118,21 +1096,263 @@ def build_install_module(module_src, mod_name, extension_kwargs=None, module_dir
             script_args.append('--quiet')
         else:
             script_args.append('--verbose')
-        setup(ext_modules=[ext], script_args=script_args)
+        with report.phase('compile'):
+            setup(ext_modules=[ext], script_args=script_args)
 
-        path_to_search = os.path.join(module_dir, mod_name + '.*' + _MOD_EXTENSION)
-        matched_files = glob.glob(path_to_search)
-        if len(matched_files) != 1:
-            raise RuntimeError("Unable to load the extension: matched files: %s" % str(matched_files))
+        with report.phase('find_output'):
+            module_filename = _find_module_file(module_dir, mod_name)
+        if module_filename is None:
+            path_to_search = os.path.join(module_dir, mod_name + '.*' + _MOD_EXTENSION)
+            raise RuntimeError("Unable to load the extension: matched files: %s" % str(glob.glob(path_to_search)))
+    finally:
+        os.chdir(curpath)
 
-        module_filename = matched_files[0]
+    return module_filename
 
-        os.chmod(module_filename, _PERMISSIONS)
-    except:
+
+def _compiler_command(extension_kwargs):
+    """Command line of the compiler, without sources and outputs, built from the `sysconfig` configuration
+
+    Returns:
+        tuple[list[str],list[str]]: The compiler command with the compilation flags and the link flags
+    """
+    compiler = shlex.split(_compiler_identity())
+    compile_flags = shlex.split(sysconfig.get_config_var('CFLAGS') or '')
+    compile_flags += shlex.split(sysconfig.get_config_var('CCSHARED') or '')
+
+    include_dirs = [sysconfig.get_paths()['include'], sysconfig.get_paths()['platinclude']]
+    include_dirs += extension_kwargs.get('include_dirs', [])
+    compile_flags += ['-I' + include_dir for include_dir in include_dirs]
+
+    for macro in extension_kwargs.get('define_macros', []):
+        name, value = macro
+        compile_flags.append('-D' + name if value is None else '-D%s=%s' % (name, value))
+
+    compile_flags += extension_kwargs.get('extra_compile_args', [])
+
+    # The first item of LDSHARED is the linker, replaced by the C++ compiler
+    link_flags = shlex.split(sysconfig.get_config_var('LDSHARED') or '')[1:]
+    link_flags += ['-L' + library_dir for library_dir in extension_kwargs.get('library_dirs', [])]
+    link_flags += ['-l' + library for library in extension_kwargs.get('libraries', [])]
+    link_flags += extension_kwargs.get('extra_link_args', [])
+
+    return compiler + compile_flags, link_flags
+
+
+def _run_compiler(command, silent, cwd=None):
+    """Execute the compiler
+
+    Raises:
+        RuntimeError: if the compiler fails
+    """
+    import subprocess
+
+    if not silent:
+        print(' '.join(shlex.quote(arg) for arg in command))
+
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True,
+                            cwd=cwd)
+
+    if not silent and result.stdout:
+        print(result.stdout)
+    if result.returncode != 0:
+        raise RuntimeError('Compilation failed with exit code %d:\n%s' % (result.returncode, result.stdout))
+
+
+def _build_with_compiler(module_src, mod_name, extension_kwargs, module_dir, silent, report, sources):
+    """Build the module calling the C++ compiler once to compile and link the module
+
+    The other translation units are compiled before, in parallel, to the object files that are not
+    already in the build cache.
+
+    Returns:
+        str: The filename of the compiled module
+
+    Raises:
+        RuntimeError: if the module could not be built
+    """
+    mod_name_c = os.path.join(module_dir, mod_name + '.cpp')
+    with report.phase('write_source'), open(mod_name_c, 'w') as module_cpp_file:
+        module_cpp_file.write(module_src)
+
+    module_filename = os.path.join(module_dir, mod_name + sysconfig.get_config_var('EXT_SUFFIX'))
+
+    compile_command, link_flags = _compiler_command(extension_kwargs)
+    profile_guided = any(flag.startswith(('-fprofile-generate', '-fprofile-use')) for flag in compile_command)
+
+    # The precompiled headers change the names of the profile data files
+    pch_flags = list()
+    if _PRECOMPILED_HEADERS and not profile_guided:
+        with report.phase('precompiled_header'):
+            pch_flags = _precompiled_header_flags(module_src, compile_command, silent)
+
+    object_files = _compile_objects(sources, compile_command, silent, report)
+
+    # The profile data files are named by the paths of the source and of the module: the source is compiled
+    # from the build folder and the path of the build folder is removed from the name of the profile data,
+    # so that the profile collected by a build is used by the next builds of the same module
+    cwd = None
+    if profile_guided:
+        cwd = os.path.abspath(module_dir)
+        compile_command = compile_command + ['-fprofile-prefix-path=' + cwd]
+        mod_name_c = os.path.basename(mod_name_c)
+        output_filename = os.path.basename(module_filename)
+    else:
+        output_filename = module_filename
+
+    with report.phase('compile'):
+        _run_compiler(compile_command + pch_flags + [mod_name_c] + object_files + ['-o', output_filename] +
+                      link_flags, silent, cwd=cwd)
+
+    return module_filename
+
+
+def _object_file(source, compile_command):
+    """Filename of the object file of a source in the ``objects`` folder of the build cache
+    """
+    hasher = hashlib.sha256()
+    for part in [source] + compile_command + [sys.implementation.cache_tag]:
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\0')
+    return os.path.join(_CACHE_PATH or _PATH, 'objects', hasher.hexdigest()[:32] + '.o')
+
+
+def _compile_objects(sources, compile_command, silent, report):
+    """Compile the sources to object files, reusing the object files already in the build cache
+
+    Returns:
+        list[str]: The object files of the sources
+
+    Raises:
+        RuntimeError: if a source could not be compiled
+    """
+    object_files = [_object_file(source, compile_command) for source in sources]
+    to_compile = list()
+    for source, object_file in zip(sources, object_files):
+        if os.path.exists(object_file):
+            _mark_used(object_file)
+        else:
+            to_compile.append((source, object_file))
+    report.objects_compiled += len(to_compile)
+    report.objects_cached += len(sources) - len(to_compile)
+    if len(to_compile) == 0:
+        return object_files
+
+    os.makedirs(os.path.dirname(object_files[0]), exist_ok=True)
+
+    # The precompiled headers are built before starting the parallel compilations
+    commands = list()
+    for source, object_file in to_compile:
+        pch_flags = list()
+        if _PRECOMPILED_HEADERS:
+            with report.phase('precompiled_header'):
+                pch_flags = _precompiled_header_flags(source, compile_command, silent)
+
+        # Build with a temporary name, so other builds never use a partial object file
+        temp_name = '%s.%d' % (object_file[:-len('.o')], os.getpid())
+        with report.phase('write_source'), open(temp_name + '.cpp', 'w') as source_file:
+            source_file.write(source)
+        commands.append((compile_command + pch_flags + ['-c', temp_name + '.cpp', '-o', temp_name + '.o'],
+                         temp_name, object_file))
+
+    def compile_object(command, temp_name, object_file):
+        try:
+            _run_compiler(command, silent)
+            os.replace(temp_name + '.o', object_file)
+        finally:
+            os.remove(temp_name + '.cpp')
+
+    from concurrent.futures import ThreadPoolExecutor
+    with report.phase('compile'), ThreadPoolExecutor(max_workers=min(len(commands), os.cpu_count() or 1)) as pool:
+        for future in [pool.submit(compile_object, *command) for command in commands]:
+            future.result()
+
+    return object_files
+
+
+def _source_prelude(module_src):
+    """Preprocessor directives at the beginning of a source, before any other code
+
+    Returns:
+        str: The lines of the directives
+    """
+    prelude = list()
+    for line in module_src.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('#'):
+            prelude.append(stripped)
+        elif stripped and not stripped.startswith('//'):
+            break
+    return '\n'.join(prelude) + '\n' if prelude else ''
+
+
+def _is_precompiled_header_valid(compiled_header, dependency_file):
+    """Whether a precompiled header exists and is newer than all the headers it includes
+    """
+    try:
+        compiled_mtime = os.path.getmtime(compiled_header)
+        with open(dependency_file) as dependency:
+            # Makefile rule "target: dep1 dep2 \"
+            dependencies = dependency.read().replace('\\\n', ' ').split(':', 1)[1].split()
+        return all(os.path.getmtime(path) <= compiled_mtime for path in dependencies)
+    except (OSError, IndexError):
+        return False
+
+
+def _precompiled_header_flags(module_src, compile_command, silent):
+    """Compiler flags to use the precompiled header of the prelude of a source, built if required
+
+    A precompiled header that is missing, or older than one of the headers it includes, is built again.
+
+    Returns:
+        list[str]: The flags for including the precompiled header or an empty list if the precompiled
+            header could not be built
+    """
+    prelude = _source_prelude(module_src)
+    if not prelude:
+        return list()
+
+    hasher = hashlib.sha256()
+    for part in [prelude] + compile_command + [sys.implementation.cache_tag]:
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\0')
+
+    pch_dir = os.path.join(_CACHE_PATH or _PATH, 'pch', hasher.hexdigest()[:32])
+    header = os.path.join(pch_dir, 'pyinline_pch.h')
+    # GCC looks for <header>.gch and clang for <header>.pch
+    compiled_header = header + ('.pch' if 'clang' in compile_command[0] else '.gch')
+    dependency_file = header + '.d'
+    pch_flags = ['-include', header, '-Winvalid-pch']
+
+    if _is_precompiled_header_valid(compiled_header, dependency_file):
+        _mark_used(pch_dir)
+        return pch_flags
+
+    try:
+        os.makedirs(pch_dir, exist_ok=True)
+        with _file_lock(header + '.lock'):
+            # Another process could have built the precompiled header while waiting for the lock
+            if _is_precompiled_header_valid(compiled_header, dependency_file):
+                return pch_flags
+
+            temp_prelude = '%s.%d.tmp' % (header, os.getpid())
+            with open(temp_prelude, 'w') as header_file:
+                header_file.write(prelude)
+            os.replace(temp_prelude, header)
+
+            # Build with a temporary name, so other builds never use a partial precompiled header
+            temp_header = '%s.%d.tmp' % (compiled_header, os.getpid())
+            _run_compiler(compile_command + ['-x', 'c++-header', header, '-o', temp_header,
+                                             '-MMD', '-MF', dependency_file], silent)
+            os.replace(temp_header, compiled_header)
+    except (OSError, RuntimeError):
         if silent is False:
             import traceback
             traceback.print_exc()
-    finally:
-        os.chdir(curpath)
+        return list()
 
-    return module_filename
+    return pch_flags
+
+
+# The process builds the modules for the target of the prebuilt modules
+_use_prebuilt_target(_PREBUILT_PATH)
@@ -1,31 +1,270 @@
-import inspect
-import dis
+import functools
+import glob
 import os
-from importlib.machinery import ExtensionFileLoader
+import threading
+import types
 from textwrap import dedent, indent
 
-from .function import InlineFunction, IFunction
-from .inline import build_install_module
+from . import importer, inline, prebuilt
+from .function import InlineFunction, IFunction, CodeFunction, UFunction, BatchedFunction, METH_O, METH_KEYWORDS
+from .inline import build_install_module, module_cache_key, find_cached_module
+from .stats import BuildReport, record_build
+
+
+# Isolated builds (i.e. of the functions compiled in background) running at the same time, at most one
+# for each CPU like build_all()
+_ISOLATED_BUILDS = threading.BoundedSemaphore(os.cpu_count() or 1)
+
+
+# Functions of the modules with OpenMP support to control the number of threads
+_OPENMP_FUNCTIONS = [
+    CodeFunction('set_num_threads', dedent('''
+    extern "C" PyObject* __pyinline_omp_set_num_threads(PyObject* self, PyObject* num_threads)
+    {
+        long value = PyLong_AsLong(num_threads);
+        if(value == -1 && PyErr_Occurred())
+            return nullptr;
+        if(value < 1)
+        {
+            PyErr_SetString(PyExc_ValueError, "The number of threads must be positive");
+            return nullptr;
+        }
+        omp_set_num_threads(static_cast<int>(value));
+        Py_RETURN_NONE;
+    }
+    '''), flags=METH_O, c_name='__pyinline_omp_set_num_threads'),
+    CodeFunction('get_max_threads', dedent('''
+    extern "C" PyObject* __pyinline_omp_get_max_threads(PyObject* self)
+    {
+        return PyLong_FromLong(omp_get_max_threads());
+    }
+    '''), c_name='__pyinline_omp_get_max_threads'),
+]
+
+
+# Counters of a profiled function
+_PROFILE_HEADER = dedent('''
+#include <chrono>
+
+struct __pyinline_profile_t
+{
+    unsigned long long calls;
+    long long conversion_ns;
+    long long body_ns;
+};
+''')
+
+
+# Function of the modules instrumented for the profile guided optimization, that writes the profile data
+_GCOV_DUMP_FUNCTION = CodeFunction('__pyinline_gcov_dump__', dedent('''
+extern "C" void __gcov_dump(void);
+
+extern "C" PyObject* __pyinline_gcov_dump__(PyObject* self)
+{
+    __gcov_dump();
+    Py_RETURN_NONE;
+}
+'''))
+
+
+def _profile_stats_function(function_names):
+    """Function ``__pyinline_stats__(reset=False)`` that returns the counters of the profiled functions
+    """
+    names = ''.join('"%s", ' % name for name in function_names)
+    profiles = ''.join('&__pyinline_profile_%s, ' % name for name in function_names)
+    code = dedent('''
+    extern "C" PyObject* __pyinline_stats__(PyObject* self, PyObject* args, PyObject* kwargs)
+    {
+        static const char* _keywords_[] = {"reset", nullptr};
+        static const char* names[] = {%s nullptr};
+        static __pyinline_profile_t* profiles[] = {%s nullptr};
+
+        int reset = 0;
+        if(!PyArg_ParseTupleAndKeywords(args, kwargs, "|p", const_cast<char**>(_keywords_), &reset))
+            return nullptr;
+
+        PyObject* stats = PyDict_New();
+        if(stats == nullptr)
+            return nullptr;
+
+        for(size_t i = 0; names[i] != nullptr; ++i)
+        {
+            PyObject* function_stats = Py_BuildValue("{s:K,s:d,s:d}",
+                                                     "calls", profiles[i]->calls,
+                                                     "conversion_seconds", profiles[i]->conversion_ns * 1e-9,
+                                                     "body_seconds", profiles[i]->body_ns * 1e-9);
+            if(function_stats == nullptr || PyDict_SetItemString(stats, names[i], function_stats) < 0)
+            {
+                Py_XDECREF(function_stats);
+                Py_DECREF(stats);
+                return nullptr;
+            }
+            Py_DECREF(function_stats);
+
+            if(reset)
+                *profiles[i] = {0, 0, 0};
+        }
+
+        return stats;
+    }
+    ''') % (names, profiles)
+    return CodeFunction('__pyinline_stats__', code, flags=METH_KEYWORDS)
+
+
+def _init_declaration(function):
+    """Declaration of the function that initializes a function compiled in its own translation unit
+    """
+    return 'extern "C" void __pyinline_init_%s(PyObject* module, PyObject* scope);' % function.get_name()
+
+
+def _init_call(function):
+    """Call of the function that initializes a function compiled in its own translation unit
+    """
+    return '    __pyinline_init_%s(module, scope);' % function.get_name()
+
+
+def _isa_variants(function, isa_levels):
+    """Variants of a function compiled for the ISA levels above the baseline
+
+    Returns:
+        tuple[str,str]: The code and the declarations of the variants
+    """
+    if isinstance(function, BatchedFunction):
+        return _isa_batched_variants(function, isa_levels)
+    if not isinstance(function, InlineFunction):
+        return '', ''
+
+    code = ''
+    declarations = ''
+    for level in isa_levels[1:]:
+        signature = function._cpp_signature.replace(' %s(' % function.get_name(),
+                                                    ' %s(' % _isa_variant_name(function, level), 1)
+        code += '#pragma GCC push_options\n#pragma GCC target("arch=%s")\n' % level
+        code += function.get_code().replace(function._cpp_signature, signature, 1)
+        code += '#pragma GCC pop_options\n\n'
+        declarations += signature + ';\n'
+    return code, declarations
+
+
+def _isa_batched_variants(function, isa_levels):
+    """Variants of a batched function that call the variants of its function for the ISA levels above the baseline
+    """
+    target = function._function
+    code = ''
+    declarations = ''
+    for level in isa_levels[1:]:
+        target_name = _isa_variant_name(target, level)
+        code += target._cpp_signature.replace(' %s(' % target.get_name(), ' %s(' % target_name, 1) + ';\n'
+        code += function._create_code(_isa_variant_name(function, level), target_name) + '\n'
+        declarations += function._signature(_isa_variant_name(function, level)) + ';\n'
+    return code, declarations
+
+
+def _isa_variant_name(function, isa_level):
+    """Name of the C++ function of the variant of a function for an ISA level
+    """
+    return '%s__%s' % (function.get_name(), isa_level.replace('-', '_'))
+
+
+def _isa_dispatch(functions, isa_levels):
+    """Code that selects the variants of the functions for the best ISA level supported by the CPU
+    """
+    if len(isa_levels) < 2:
+        return ''
+
+    # The index of a function in the method table skips the functions that are not methods (i.e. the ufuncs)
+    dispatch = '__builtin_cpu_init();\n'
+    methods = [function for function in functions if function.get_function_def()]
+    for index, function in enumerate(methods):
+        if not isinstance(function, (InlineFunction, BatchedFunction)):
+            continue
+        condition = 'if'
+        for level in reversed(isa_levels[1:]):
+            dispatch += '%s(__builtin_cpu_supports("%s"))\n' % (condition, level)
+            dispatch += '    module_functions_def[%d].ml_meth = reinterpret_cast<PyCFunction>(%s);\n' % (
+                index, _isa_variant_name(function, level))
+            condition = 'else if'
+    return dispatch
 
 
 class InlineModule(object):
     """Module that can be compiled to a C Extension
     """
 
-    def __init__(self, name, enable_numpy=False, enable_pybind11=False):
+    def __init__(self, name, enable_numpy=False, enable_pybind11=False, enable_openmp=False, profile=False,
+                 incremental=False):
         """Constructor
 
         Args:
             name(str): Name of the module.
+
+        Keyword Args:
+            enable_numpy(bool): Enable the support for `numpy` C API. Default ``False``.
+            enable_openmp(bool): Enable OpenMP. The module has the ``set_num_threads(n)`` and
+                ``get_max_threads()`` functions to control the threads used by OpenMP. Default ``False``.
+            profile(bool): Count the calls of the functions and measure the time spent converting the arguments
+                and executing the C++ code. The counters are returned, by function name, by the
+                ``__pyinline_stats__(reset=False)`` function of the module. Default ``False``.
+            incremental(bool): Compile each :class:`InlineFunction` in its own translation unit. The object
+                files are stored in the build cache by the hash of their code, so that a change of a function
+                compiles only that function and links the module again. Only the ``compiler`` build backend
+                reuses the object files. Default ``False``.
         """
         self._name = name
         self._functions = list()
         self._cpp_code = ''
+        self._function_sources = list()
         self._cpp_footer = ''
+        self._imported_module = None
+        self._instrumented = False
+        self._isa_levels = list()
+        # Key of the Python functions of the module, to find the module without generating its code
+        self._function_key = None
         self._enable_numpy = enable_numpy
         self._enable_pybind11 = enable_pybind11
+        self._enable_openmp = enable_openmp
+        self._profile = profile
+        self._incremental = incremental
+
+    def _numpy_enabled(self):
+        """Whether the `numpy` support is enabled explicitly or required by a function
+        """
+        return self._enable_numpy or any(f.requires_numpy() for f in self._functions)
 
-    def _create_footer(self):
+    def _ufuncs_enabled(self):
+        """Whether the module has `numpy` ufuncs and uses the `numpy` ufunc C API
+        """
+        return any(isinstance(f, UFunction) for f in self._functions)
+
+    def _all_functions(self):
+        """Functions of the module, including the functions generated by the module itself
+        """
+        functions = list(self._functions)
+        functions += [f.get_batched_function() for f in self._functions
+                      if isinstance(f, InlineFunction) and f.get_batched_function() is not None]
+        if self._enable_openmp:
+            functions += _OPENMP_FUNCTIONS
+        if self._profile:
+            function_names = [f.get_name() for f in self._functions if isinstance(f, InlineFunction)]
+            functions.append(_profile_stats_function(function_names))
+        return functions
+
+    def get_name(self):
+        """Name of the module
+
+        Returns:
+            str: The name of the module
+        """
+        return self._name
+
+    def _separate_functions(self, functions):
+        """Functions compiled in their own translation unit
+        """
+        if not self._incremental:
+            return list()
+        return [f for f in functions if f.get_declaration()]
+
+    def _create_footer(self, separate_functions=()):
         """Create the module description and initialization function
         """
         module_def = 'static struct PyModuleDef inline_module = {\n'
@@ -36,14 +275,20 @@ class InlineModule(object):
         module_def += '    module_functions_def\n'
         module_def += '};\n'
 
+        # The numpy C API is imported before the init code of the functions, that can use it
         other_init_code = ''
-        if self._enable_numpy:
-            other_init_code += 'import_array();'
+        if self._numpy_enabled():
+            other_init_code += '    import_array();\n'
+        if self._ufuncs_enabled():
+            other_init_code += '    import_umath();\n'
 
-        functions_init = '\n'.join((f.get_module_init_code() for f in self._functions))
+        functions_init = '\n'.join((_init_call(f) if f in separate_functions else f.get_module_init_code()
+                                    for f in self._all_functions()))
         module_init = dedent('''
         PyMODINIT_FUNC PyInit_%s(void)
         {
+        %s
+        %s
             PyObject* module = PyModule_Create(&inline_module);
             if (module == nullptr)
                 return nullptr;
@@ -52,11 +297,10 @@ class InlineModule(object):
 
             %s
 
-            %s
-
             return module;
         }
-        ''') % (self._name, functions_init, other_init_code)
+        ''') % (self._name, indent(_isa_dispatch(self._all_functions(), self._isa_levels), '    '), other_init_code,
+                functions_init)
 
         self._cpp_footer = module_def + '\n\n' + module_init
 
@@ -74,6 +318,18 @@ class InlineModule(object):
         # Invalidate CPP code
         self._reset()
 
+    def add_ufunc(self, py_function, identity=None):
+        """Add a `numpy` ufunc, with the inner loop compiled from the scalar C++ code of a function
+
+        Args:
+            py_function(function): The Python function with the C++ code of the kernel (see :class:`UFunction`)
+
+        Keyword Args:
+            identity(int): Identity value of the ufunc (``0``, ``1`` or ``-1``), used by the reductions of
+                empty arrays. Default ``None`` for a ufunc without identity.
+        """
+        self.add_function(UFunction(py_function, identity=identity))
+
     def set_enable_numpy(self, enable=True):
         """Enable the support for `numpy` C API
 
@@ -83,57 +339,147 @@ class InlineModule(object):
         self._enable_numpy = enable
         self._reset()
 
+    def set_enable_openmp(self, enable=True):
+        """Enable the support for OpenMP
+
+        Keyword Args:
+            enable(bool): ``True`` for enabling OpenMP, ``False`` to disable it.
+        """
+        self._enable_openmp = enable
+        self._reset()
+
+    def set_incremental(self, enable=True):
+        """Enable the incremental build, with each function compiled in its own translation unit
+
+        Keyword Args:
+            enable(bool): ``True`` for enabling the incremental build, ``False`` to disable it.
+        """
+        self._incremental = enable
+        self._reset()
+
     def get_cpp_code(self):
         """C++ code of the module
 
+        With the incremental build, the code of the functions compiled in their own translation unit
+        is returned by :meth:`get_function_sources`.
+
         Returns:
             str: the C++ code of the module
         """
-        if len(self._cpp_code) == 0:
+        if len(self._cpp_code) == 0 or self._isa_levels != inline.isa_levels():
             self._create_code()
         return self._cpp_code
 
+    def get_function_sources(self):
+        """C++ code of the functions compiled in their own translation unit by the incremental build
+
+        Returns:
+            list[str]: The C++ code of a translation unit for each function or an empty list if the
+                incremental build is disabled
+        """
+        if len(self._cpp_code) == 0 or self._isa_levels != inline.isa_levels():
+            self._create_code()
+        return list(self._function_sources)
+
     def _reset(self):
         self._cpp_code = ''
         self._cpp_footer = ''
+        self._function_sources = list()
+        self._imported_module = None
 
-    def _create_code(self):
-        """Create the C++ code of the module
-        """
-
-        self._create_footer()
+    def _create_includes(self, function_unit=False):
+        """Create the includes at the beginning of a translation unit of the module
 
-        # Build include
+        Keyword Args:
+            function_unit(bool): ``True`` for the translation unit of a single function, that uses the
+                `numpy` C API imported by the module init function.
+        """
         module_header = dedent('''
         #include <Python.h>
 
         ''')
 
-        if self._enable_numpy:
+        if self._numpy_enabled():
+            if function_unit:
+                module_header += '#define NO_IMPORT_ARRAY\n'
             module_header += dedent('''
             #define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
             #define PY_ARRAY_UNIQUE_SYMBOL  numpy_ARRAY_API
             #include <numpy/arrayobject.h>
             ''')
+            # The ufuncs are always compiled with the module init function
+            if self._ufuncs_enabled() and not function_unit:
+                module_header += '#include <numpy/ufuncobject.h>\n'
+
+        if self._enable_openmp:
+            module_header += '#include <omp.h>\n'
 
+        if self._profile:
+            module_header += _PROFILE_HEADER
+
+        return module_header
+
+    def _create_function_unit(self, function):
+        """Create the translation unit of a function, with the function that initializes it
+        """
+        init_function = dedent('''
+        extern "C" void __pyinline_init_%s(PyObject* module, PyObject* scope)
+        {
+        %s
+        }
+        ''') % (function.get_name(), function.get_module_init_code())
+
+        return self._create_includes(function_unit=True) + '\n\n' + function.get_module_header_code() + \
+            '\n\n' + function.get_code() + '\n\n' + _isa_variants(function, self._isa_levels)[0] + init_function
+
+    def _create_code(self):
+        """Create the C++ code of the module
+        """
         for function in self._functions:
-            module_header += function.get_module_header_code() + '\n\n'
+            if isinstance(function, InlineFunction):
+                function.set_profile(self._profile)
+
+        self._isa_levels = inline.isa_levels()
+        functions = self._all_functions()
+        separate_functions = self._separate_functions(functions)
+        self._function_sources = [self._create_function_unit(f) for f in separate_functions]
+
+        self._create_footer(separate_functions)
+
+        # Build include
+        module_header = self._create_includes()
+
+        for function in functions:
+            if function in separate_functions:
+                module_header += function.get_declaration()
+                module_header += _isa_variants(function, self._isa_levels)[1]
+                module_header += _init_declaration(function) + '\n\n'
+            else:
+                module_header += function.get_module_header_code() + '\n\n'
 
         # Merge code of all the functions
         function_code = ''
-        for function in self._functions:
+        for function in functions:
+            if function in separate_functions:
+                continue
             function_code += function.get_code()
             function_code += '\n\n'
+            function_code += _isa_variants(function, self._isa_levels)[0]
+
+        # The function that writes the profile data is the last one, so that the lines of the other functions
+        # are the same in the instrumented module and in the optimized module
+        function_defs = [f.get_function_def() for f in functions if f.get_function_def()]
+        if self._instrumented:
+            function_code += _GCOV_DUMP_FUNCTION.get_code() + '\n\n'
+            function_defs.append(_GCOV_DUMP_FUNCTION.get_function_def())
 
         # Build method definition
 
-        function_def_iter = (f.get_function_def() for f in self._functions)
         function_def = dedent('''
         static PyMethodDef module_functions_def[] = {
-            %s,
-            nullptr
+            %s
         };
-        ''') % '    ,\n'.join(function_def_iter)
+        ''') % '    ,\n'.join(function_defs + ['nullptr'])
 
         # Merge all the code in a single source
         cpp_code = module_header + '\n\n'
@@ -143,13 +489,50 @@ class InlineModule(object):
 
         self._cpp_code = cpp_code
 
-    def import_module(self, module_dir=None, silent=True):
+    def _build_kwargs(self):
+        """Arguments for :func:`build_install_module` that depend on the module configuration
+
+        Returns:
+            tuple[dict,list]: The extension arguments and the extra values of the cache key
+        """
+        extension_kwargs = dict()
+        key_extra = list()
+        if self._numpy_enabled():
+            import numpy as np
+            extension_kwargs['include_dirs'] = [np.get_include()]
+            key_extra.append('numpy=' + np.__version__)
+
+        if self._enable_openmp:
+            extension_kwargs['extra_compile_args'] = list(inline.OPENMP_COMPILE_ARGS)
+            extension_kwargs['extra_link_args'] = list(inline.OPENMP_LINK_ARGS)
+
+        return extension_kwargs, key_extra
+
+    def get_cache_key(self):
+        """Key of the module in the build cache
+
+        Returns:
+            str: The hash of the code and of the build configuration of the module
+        """
+        extension_kwargs, key_extra = self._build_kwargs()
+        return module_cache_key(self.get_cpp_code(), extension_kwargs, key_extra, self.get_function_sources())
+
+    def import_module(self, module_dir=None, silent=True, isolated=False):
         """Build an import the module
 
+        The module is imported with the standard import machinery, so it is stored in ``sys.modules``
+        with its name. The next calls return the same module, until a function or an option of the
+        module is changed.
+
         Keyword Args:
             module_dir(str): The location to store all the files of the module (source, temporary objects,
-                shared object). Default to a temporary location.
+                shared object). Default to the build cache, where an already built module is loaded
+                without compiling it again.
             silent(bool): Silent compilation. Default True
+            isolated(bool): Build the module without changing the state of the calling process (i.e. the
+                working directory), in a separate process with the ``setuptools`` backend. Required when the
+                module is built from a thread. At most one isolated build for each CPU runs at the same time.
+                Default False
 
         Returns:
             The loaded C extension
@@ -157,21 +540,279 @@ class InlineModule(object):
         Raises:
             ImportError: if the C++ code could not be compiled or the module could not be loaded
         """
+        if prebuilt.is_collecting():
+            # Ahead-of-time build: the module is built later, the Python code is used in the meantime
+            prebuilt.collect(self)
+            return self._python_module()
+
+        # The module does not change until a function or an option is changed
+        if self._imported_module is not None:
+            return self._imported_module
+
+        report = BuildReport(self._name)
+
         # Build module
-        cpp_code = self.get_cpp_code()
+        with report.phase('codegen'):
+            cpp_code = self.get_cpp_code()
+            sources = self.get_function_sources()
+
+        extension_kwargs, key_extra = self._build_kwargs()
+
+        if isolated and find_cached_module(cpp_code, self._name, extension_kwargs, key_extra, sources) is None:
+            with _ISOLATED_BUILDS:
+                if inline.build_backend() == 'setuptools':
+                    # The setuptools build changes the working directory of the process
+                    module_filename, report = _build_in_process(_build_settings(), cpp_code, self._name,
+                                                                extension_kwargs, module_dir, silent, key_extra,
+                                                                report, sources)
+                else:
+                    module_filename = build_install_module(cpp_code, self._name, extension_kwargs=extension_kwargs,
+                                                           module_dir=module_dir, silent=silent,
+                                                           key_extra=key_extra, report=report, sources=sources)
+        else:
+            module_filename = build_install_module(cpp_code, self._name, extension_kwargs=extension_kwargs,
+                                                   module_dir=module_dir, silent=silent, key_extra=key_extra,
+                                                   report=report, sources=sources)
+
+        return self._load_module(module_filename, report)
+
+    def import_module_pgo(self, train, silent=True):
+        """Build and import the module optimized with the profile of a training workload (GCC only)
+
+        The module is first built with the profile instrumentation and ``train`` is called with the
+        instrumented module. The module is then built again, optimized with the collected profile.
+        The profile data is stored in the build cache next to the module, so the next builds of the
+        same module are optimized without running the training again.
 
-        extension_kwargs = dict()
-        if self._enable_numpy:
-            import numpy as np
-            extension_kwargs['include_dirs'] = [np.get_include()]
+        Args:
+            train(callable): Function that executes a representative workload with the functions of the
+                module received as argument.
+
+        Keyword Args:
+            silent(bool): Silent compilation. Default True
+
+        Returns:
+            The loaded C extension optimized with the profile
+
+        Raises:
+            ImportError: if the C++ code could not be compiled or the module could not be loaded
+            ValueError: if the incremental build is enabled or the compiler does not support the
+                profile guided optimization
+        """
+        if prebuilt.is_collecting():
+            return self.import_module(silent=silent)
+        if self._incremental:
+            raise ValueError('The profile guided optimization is not available with the incremental build')
+
+        profile_dir = inline.profile_data_dir(self._name, self.get_cache_key())
+
+        if len(glob.glob(os.path.join(profile_dir, '*.gcda'))) == 0:
+            self._instrumented = True
+            self._reset()
+            try:
+                instrumented_module = self._import_with_profile(profile_dir, True, silent)
+            finally:
+                self._instrumented = False
+                self._reset()
+
+            train(instrumented_module)
+            instrumented_module.__pyinline_gcov_dump__()
+
+        return self._import_with_profile(profile_dir, False, silent)
+
+    def _import_with_profile(self, profile_dir, generate, silent):
+        """Build and import the module with the flags of the profile guided optimization
+        """
+        report = BuildReport(self._name)
+        with report.phase('codegen'):
+            cpp_code = self.get_cpp_code()
+
+        extension_kwargs, key_extra = self._build_kwargs()
+        compile_args, link_args = inline.profile_guided_flags(profile_dir, generate)
+        extension_kwargs['extra_compile_args'] = list(extension_kwargs.get('extra_compile_args', [])) + compile_args
+        extension_kwargs['extra_link_args'] = list(extension_kwargs.get('extra_link_args', [])) + link_args
 
         module_filename = build_install_module(cpp_code, self._name, extension_kwargs=extension_kwargs,
-                                               module_dir=module_dir, silent=silent)
+                                               silent=silent, key_extra=key_extra, report=report)
+        return self._load_module(module_filename, report)
 
-        if module_filename is None:
-            raise ImportError('Module %s could not be load' % self._name)
+    def _python_module(self):
+        """Module with the Python code of the functions, used while collecting the modules to build
+        """
+        python_module = types.ModuleType(self._name)
+        for function in self._functions:
+            if isinstance(function, (InlineFunction, UFunction)):
+                setattr(python_module, function.get_name(), function._py_function)
+            if isinstance(function, InlineFunction) and function.get_batched_function() is not None:
+                setattr(python_module, function.get_batched_function().get_name(),
+                        functools.partial(_call_many, function._py_function))
+        return python_module
 
-        # Load module
-        file_loader = ExtensionFileLoader(self._name, module_filename)
-        imported_module = file_loader.load_module(self._name)
+    def _load_module(self, module_filename, report):
+        """Load the compiled module and record the report of its build
+
+        Args:
+            module_filename(str,None): Filename of the compiled module or ``None`` if the build failed
+            report(BuildReport): Report of the build of the module
+
+        Returns:
+            The loaded C extension
+
+        Raises:
+            ImportError: if the module could not be loaded
+        """
+        try:
+            if module_filename is None:
+                raise ImportError('Module %s could not be load' % self._name)
+
+            # Load module
+            with report.phase('load'):
+                imported_module = importer.load_extension(self._name, module_filename)
+        except:
+            report.success = False
+            raise
+        finally:
+            record_build(report)
+
+        if self._function_key is not None:
+            inline.record_function_module(self._name, self._function_key, module_filename, self._build_kwargs()[1])
+
+        self._imported_module = imported_module
         return imported_module
+
+
+def load_function_module(name, function_key):
+    """Load a module found by the key of its Python functions, without generating its C++ code
+
+    Args:
+        name(str): Name of the module.
+        function_key(str): Key of the Python functions of the module (see :func:`inline.function_cache_key`).
+
+    Returns:
+        The loaded C extension or ``None`` if the module is not in the build cache
+    """
+    report = BuildReport(name)
+    with report.phase('cache_lookup'):
+        module_filename = inline.find_function_module(name, function_key)
+    if module_filename is None:
+        return None
+
+    report.cache_hit = True
+    report.success = True
+    try:
+        with report.phase('load'):
+            return importer.load_extension(name, module_filename)
+    except ImportError:
+        report.success = False
+        return None
+    finally:
+        record_build(report)
+
+
+def _call_many(py_function, items):
+    """Python code of a :class:`BatchedFunction`
+    """
+    return [py_function(*args) for args in items]
+
+
+def _build_in_process(*args):
+    """Build a module with :func:`_build_worker` in a new process
+
+    The process is started with ``spawn``: the isolated builds run in background threads, and forking a
+    process with many threads could deadlock on the locks held by the other threads.
+
+    Returns:
+        tuple[str,BuildReport]: The filename of the compiled module and the report of the build
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(_build_worker, *args).result()
+
+
+def _build_settings():
+    """Global build settings of the current process, to be applied in the worker processes
+    """
+    return inline.extra_compile_args(), inline.extra_link_args(), inline.cache_dir(), inline.build_backend(), \
+        inline.isa_levels(), inline.cache_limits()
+
+
+def _build_worker(build_settings, cpp_code, name, extension_kwargs, module_dir, silent, key_extra, report,
+                  sources=None):
+    """Build a module in a worker process of :func:`build_all`
+
+    Returns:
+        tuple[str,BuildReport]: The filename of the compiled module and the report of the build
+    """
+    compile_args, link_args, cache_path, backend, isa_levels, cache_limits = build_settings
+    inline.set_extra_compile_args(compile_args)
+    inline.set_extra_link_args(link_args)
+    inline.set_cache_dir(cache_path)
+    inline.set_build_backend(backend)
+    inline.set_isa_levels(isa_levels)
+    inline.set_cache_limits(*cache_limits)
+    module_filename = build_install_module(cpp_code, name, extension_kwargs=extension_kwargs, module_dir=module_dir,
+                                           silent=silent, key_extra=key_extra, report=report, sources=sources)
+    return module_filename, report
+
+
+def build_all(modules, jobs=None, module_dir=None, silent=True):
+    """Build and import many modules compiling them in parallel in a pool of processes
+
+    The modules already in the build cache are loaded without starting any worker.
+
+    Args:
+        modules(list[InlineModule]): The modules to build.
+
+    Keyword Args:
+        jobs(int): Maximum number of parallel builds. Default to the number of CPUs.
+        module_dir(str): The location to store all the files of the modules. Default to the build cache.
+        silent(bool): Silent compilation. Default True
+
+    Returns:
+        list: The loaded C extensions, in the same order of ``modules``
+
+    Raises:
+        ImportError: if the C++ code of a module could not be compiled or the module could not be loaded
+    """
+    modules = list(modules)
+    module_filenames = [None] * len(modules)
+    reports = [BuildReport(module._name) for module in modules]
+    to_build = list()
+
+    for index, module in enumerate(modules):
+        report = reports[index]
+        with report.phase('codegen'):
+            cpp_code = module.get_cpp_code()
+            sources = module.get_function_sources()
+        extension_kwargs, key_extra = module._build_kwargs()
+        if module_dir is None:
+            with report.phase('cache_lookup'):
+                module_filenames[index] = find_cached_module(cpp_code, module._name, extension_kwargs, key_extra,
+                                                             sources)
+        if module_filenames[index] is None:
+            to_build.append((index, (cpp_code, module._name, extension_kwargs, module_dir, silent, key_extra,
+                                     report, sources)))
+        else:
+            report.cache_hit = True
+            report.success = True
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(to_build))
+
+    build_settings = _build_settings()
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [(index, executor.submit(_build_worker, build_settings, *build_args))
+                       for index, build_args in to_build]
+            for index, future in futures:
+                module_filenames[index], reports[index] = future.result()
+    else:
+        for index, build_args in to_build:
+            module_filenames[index], reports[index] = _build_worker(build_settings, *build_args)
+
+    return [module._load_module(filename, report)
+            for module, filename, report in zip(modules, module_filenames, reports)]
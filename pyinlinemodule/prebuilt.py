@@ -0,0 +1,171 @@
+"""
+Ahead-of-time builds of all the modules of a package.
+
+The modules of the package are imported in collection mode: the decorated functions keep their
+Python code and the :class:`InlineModule` are collected instead of being built. The collected
+modules are then built in parallel in the folder of the prebuilt modules, that is searched before
+the build cache at run time (see :func:`pyinlinemodule.inline.set_prebuilt_dir`).
+"""
+
+import importlib
+import os
+import shutil
+import sys
+import threading
+import warnings
+
+from . import inline
+
+
+# ISA levels of the prebuilt modules when they are not configured: baseline, SSE 4.2 and AVX2
+PORTABLE_ISA_LEVELS = ('x86-64', 'x86-64-v2', 'x86-64-v3')
+
+# Modules and groups of decorated functions collected by collect_modules(), None outside the collection
+_COLLECTED = None
+_COLLECT_LOCK = threading.Lock()
+
+
+def is_collecting():
+    """Whether the modules are being collected for an ahead-of-time build
+
+    Returns:
+        bool: ``True`` during :func:`collect_modules`
+    """
+    return _COLLECTED is not None
+
+
+def collect(item):
+    """Collect a module for the ahead-of-time build
+
+    Args:
+        item(InlineModule,_CppGroup): The module or the group of decorated functions to build
+    """
+    with _COLLECT_LOCK:
+        if _COLLECTED is not None and all(item is not collected for collected in _COLLECTED):
+            _COLLECTED.append(item)
+
+
+def _module_names(path):
+    """Names of the Python modules of a package folder or of a Python file
+
+    The parent folder of the package (or of the file) is added to ``sys.path``.
+    """
+    import pkgutil
+
+    path = os.path.abspath(path)
+    if os.path.isfile(path):
+        sys.path.insert(0, os.path.dirname(path))
+        return [os.path.splitext(os.path.basename(path))[0]]
+
+    if not os.path.isfile(os.path.join(path, '__init__.py')):
+        raise ValueError('%s is not a Python package' % path)
+
+    sys.path.insert(0, os.path.dirname(path))
+    package_name = os.path.basename(path)
+    module_names = [package_name]
+    for module_info in pkgutil.walk_packages([path], prefix=package_name + '.'):
+        module_names.append(module_info.name)
+    return module_names
+
+
+def collect_modules(paths):
+    """Import the modules of packages and collect their :class:`InlineModule` and decorated functions
+
+    A Python module that could not be imported is skipped with a warning.
+
+    Args:
+        paths(list[str]): Folders of Python packages or Python files.
+
+    Returns:
+        list[InlineModule]: The collected modules
+    """
+    from .decorators import _CppGroup
+
+    global _COLLECTED
+    with _COLLECT_LOCK:
+        _COLLECTED = list()
+
+    try:
+        for path in paths:
+            for module_name in _module_names(path):
+                try:
+                    importlib.import_module(module_name)
+                except Exception as error:
+                    warnings.warn('Unable to import %s: %s' % (module_name, error))
+    finally:
+        with _COLLECT_LOCK:
+            collected, _COLLECTED = _COLLECTED, None
+
+    return [item.create_module() if isinstance(item, _CppGroup) else item for item in collected]
+
+
+def _set_portable_target(native):
+    """Configure the target of the prebuilt modules, warning if they are built for the native CPU
+    """
+    if native:
+        warnings.warn('The prebuilt modules are built for the CPU of this machine (-march=native) and are '
+                      'loaded only on machines with the same CPU')
+        return
+    if inline.isa_levels() or '-march=native' not in inline.extra_compile_args():
+        return
+    try:
+        inline.set_isa_levels(PORTABLE_ISA_LEVELS)
+    except ValueError:
+        # Not x86-64 or an older compiler: the generic target of the compiler
+        inline.set_extra_compile_args([arg for arg in inline.extra_compile_args() if arg != '-march=native'])
+
+
+def build_prebuilt_modules(paths, output_dir, jobs=None, silent=True, native=False):
+    """Build all the modules of packages in a folder of prebuilt modules
+
+    Only the compiled modules are kept in the folder, the precompiled headers and the object files of
+    the incremental builds are removed. The limits of the build cache are not applied to the folder.
+
+    The prebuilt modules are meant to be shipped, so they are not built for the CPU of the build machine
+    (``-march=native``): the ISA levels of :func:`pyinlinemodule.inline.set_isa_levels` are used, or
+    :data:`PORTABLE_ISA_LEVELS` if they are not set and the compiler supports them, or else the generic
+    target of the compiler. The build configuration is recorded in the folder, so the modules are loaded
+    with any configuration and never on a CPU different from the one of a native build.
+
+    Args:
+        paths(list[str]): Folders of Python packages or Python files.
+        output_dir(str): Folder of the prebuilt modules.
+
+    Keyword Args:
+        jobs(int): Maximum number of parallel builds. Default to the number of CPUs.
+        silent(bool): Silent compilation. Default True
+        native(bool): Build the modules for the CPU of the build machine, loaded only on machines with the
+            same CPU. Default ``False``.
+
+    Returns:
+        list[InlineModule]: The built modules
+
+    Raises:
+        ImportError: if the C++ code of a module could not be compiled
+    """
+    from .module import build_all
+
+    modules = collect_modules(paths)
+
+    temp_dirs = [os.path.join(output_dir, name) for name in ('pch', 'objects')
+                 if not os.path.exists(os.path.join(output_dir, name))]
+    compile_args = inline.extra_compile_args()
+    isa_levels = inline.isa_levels()
+    _set_portable_target(native)
+    inline.write_prebuilt_config(output_dir)
+
+    cache_path = inline.cache_dir()
+    cache_limits = inline.cache_limits()
+    inline.set_cache_dir(output_dir)
+    inline.set_cache_limits(None, None)
+    try:
+        build_all(modules, jobs=jobs, silent=silent)
+    finally:
+        inline.set_cache_dir(cache_path)
+        inline.set_cache_limits(*cache_limits)
+        inline.set_extra_compile_args(compile_args)
+        inline.set_isa_levels(isa_levels)
+        for temp_dir in temp_dirs:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return modules
@@ -0,0 +1,177 @@
+"""
+Timings and counters of the builds of the modules.
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+# Maximum number of reports kept by build_reports()
+_MAX_REPORTS = 100
+
+_LOCK = threading.Lock()
+_REPORTS = deque(maxlen=_MAX_REPORTS)
+_CALLBACKS = list()
+_COUNTERS = dict()
+
+
+class BuildReport(object):
+    """Timing report of the build of a module
+
+    Attributes:
+        name(str): Name of the module.
+        phases(dict[str,float]): Seconds spent in each phase of the build. The phases are ``codegen``
+            (generation of the C++ code), ``cache_lookup``, ``lock_wait`` (wait for the build of the same
+            module in another process), ``write_source``, ``compile`` (compiler and linker), ``find_output``,
+            ``cache_prune`` (eviction of the least recently used entries of the build cache) and ``load``
+            (loading of the compiled module).
+        cache_hit(bool): ``True`` if the module was loaded from the build cache without compiling it.
+        success(bool): ``True`` if the module was built and loaded.
+        source_size(int): Size in bytes of the C++ source code.
+        module_size(int): Size in bytes of the compiled module.
+        backend(str): The build backend.
+        objects_compiled(int): Number of translation units compiled to object files by an incremental build.
+        objects_cached(int): Number of object files reused from the build cache by an incremental build.
+    """
+
+    def __init__(self, name):
+        """Constructor
+
+        Args:
+            name(str): Name of the module.
+        """
+        self.name = name
+        self.phases = dict()
+        self.cache_hit = False
+        self.success = False
+        self.source_size = 0
+        self.module_size = 0
+        self.backend = None
+        self.objects_compiled = 0
+        self.objects_cached = 0
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager that adds the time spent in its block to a phase
+
+        Args:
+            name(str): Name of the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def compile_seconds(self):
+        """Wall time of the compiler and of the linker"""
+        return self.phases.get('compile', 0.0)
+
+    @property
+    def total_seconds(self):
+        """Total time of all the phases"""
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        """Report as a dictionary
+
+        Returns:
+            dict: The values of the report
+        """
+        return dict(name=self.name, phases=dict(self.phases), cache_hit=self.cache_hit, success=self.success,
+                    source_size=self.source_size, module_size=self.module_size, backend=self.backend,
+                    objects_compiled=self.objects_compiled, objects_cached=self.objects_cached,
+                    compile_seconds=self.compile_seconds, total_seconds=self.total_seconds)
+
+    def __repr__(self):
+        return 'BuildReport(%r)' % self.as_dict()
+
+
+def _empty_counters():
+    return dict(builds=0, cache_hits=0, failures=0, compile_seconds=0.0, total_seconds=0.0)
+
+
+_COUNTERS.update(_empty_counters())
+
+
+def record_build(report):
+    """Record the report of a build in the counters and notify the callbacks
+
+    Args:
+        report(BuildReport): The report of the build
+    """
+    with _LOCK:
+        if report.cache_hit:
+            _COUNTERS['cache_hits'] += 1
+        else:
+            _COUNTERS['builds'] += 1
+        if not report.success:
+            _COUNTERS['failures'] += 1
+        _COUNTERS['compile_seconds'] += report.compile_seconds
+        _COUNTERS['total_seconds'] += report.total_seconds
+        _REPORTS.append(report)
+        callbacks = list(_CALLBACKS)
+
+    # The logging is not imported for the builds: if it was never imported, no logger is configured
+    if 'logging' in sys.modules:
+        sys.modules['logging'].getLogger('pyinlinemodule').debug('Build of module %s: %s', report.name,
+                                                                 report.as_dict())
+
+    for callback in callbacks:
+        callback(report)
+
+
+def build_stats():
+    """Process-wide counters of the builds
+
+    Returns:
+        dict: The number of ``builds`` (compilations), of ``cache_hits`` and of ``failures``,
+            the total seconds spent in the compiler (``compile_seconds``) and in all the phases
+            of the builds (``total_seconds``)
+    """
+    with _LOCK:
+        return dict(_COUNTERS)
+
+
+def build_reports():
+    """Reports of the last builds
+
+    Returns:
+        list[BuildReport]: The reports of the last builds, from the oldest
+    """
+    with _LOCK:
+        return list(_REPORTS)
+
+
+def reset_build_stats():
+    """Reset the counters and the reports of the builds
+    """
+    with _LOCK:
+        _COUNTERS.update(_empty_counters())
+        _REPORTS.clear()
+
+
+def add_build_callback(callback):
+    """Add a function called with the :class:`BuildReport` of each build
+
+    The reports are also logged with level ``DEBUG`` in the ``pyinlinemodule`` logger.
+
+    Args:
+        callback(callable): The function to call
+    """
+    with _LOCK:
+        _CALLBACKS.append(callback)
+
+
+def remove_build_callback(callback):
+    """Remove a function added with :func:`add_build_callback`
+
+    Args:
+        callback(callable): The function to remove
+    """
+    with _LOCK:
+        _CALLBACKS.remove(callback)
@@ -44,7 +44,7 @@ setup(
         # Pick your license as you wish (should match "license" above)
         'License :: OSI Approved :: MIT License',
 
-        'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3.7',
     ],
 
     # What does your project relate to?
@@ -73,11 +73,14 @@ setup(
     # To provide executable scripts, use entry points in preference to the
     # "scripts" keyword. Entry points provide cross-platform support and allow
     # pip to create the appropriate form of executable for the target platform.
-    # entry_points={
-    #     'console_scripts': [
-    #         'sample=sample:main',
-    #     ],
-    # },
+    entry_points={
+        'console_scripts': [
+            'pyinlinemodule=pyinlinemodule.__main__:main',
+        ],
+    },
+
+    # METH_FASTCALL is part of the public C API since Python 3.7
+    python_requires='>=3.7',
 
     setup_requires=['pytest-runner'],
     tests_require=['pytest', 'numpy'],
@@ -0,0 +1,11 @@
+import os
+import shutil
+import tempfile
+
+# Keep the build cache of the tests out of the user cache folder
+_TEST_CACHE_PATH = tempfile.mkdtemp(prefix='pyinline_test_cache_')
+os.environ['PY_INLINE_CACHE'] = _TEST_CACHE_PATH
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_TEST_CACHE_PATH, ignore_errors=True)
@@ -0,0 +1,113 @@
+import os
+import time
+import pytest
+
+from pyinlinemodule import cache, inline
+from pyinlinemodule.__main__ import main
+from pyinlinemodule.inline import build_install_module
+
+
+MODULE_SRC = '''
+#include <Python.h>
+
+static struct PyModuleDef inline_module = {
+    PyModuleDef_HEAD_INIT,
+    "%s",
+    nullptr,
+    -1,
+    nullptr
+};
+
+PyMODINIT_FUNC PyInit_%s(void)
+{
+    return PyModule_Create(&inline_module);
+}
+'''
+
+
+@pytest.fixture
+def cache_path(tmpdir, monkeypatch):
+    monkeypatch.setattr(inline, '_CACHE_PATH', str(tmpdir))
+    monkeypatch.setattr(inline, '_CACHE_MAX_SIZE', None)
+    monkeypatch.setattr(inline, '_CACHE_MAX_ENTRIES', None)
+    # Only the modules are in the cache
+    monkeypatch.setattr(inline, '_PRECOMPILED_HEADERS', False)
+    return str(tmpdir)
+
+
+def _build_modules(names):
+    """Build the modules, used from the oldest to the newest"""
+    module_dirs = list()
+    for index, name in enumerate(names):
+        module_filename = build_install_module(MODULE_SRC % (name, name), name)
+        assert module_filename is not None
+        module_dir = os.path.dirname(module_filename)
+        os.utime(module_dir, (time.time() - 1000 + index, time.time() - 1000 + index))
+        module_dirs.append(module_dir)
+    return module_dirs
+
+
+def test_cache_stats(cache_path):
+
+    _build_modules(['cache_stats_first', 'cache_stats_second'])
+
+    stats = cache.cache_stats()
+    assert stats['path'] == cache_path
+    assert stats['entries'] == 2
+    assert stats['kinds']['module']['entries'] == 2
+    assert stats['size'] > 0
+    assert stats['oldest_use'] < stats['newest_use']
+
+
+def test_prune_cache_removes_least_recently_used(cache_path):
+
+    first_dir, second_dir, third_dir = _build_modules(['cache_lru_first', 'cache_lru_second', 'cache_lru_third'])
+
+    # The cache hit marks the first module as the most recently used
+    assert inline.find_cached_module(MODULE_SRC % (('cache_lru_first', ) * 2), 'cache_lru_first') is not None
+
+    removed = cache.prune_cache(max_entries=2)
+    assert [entry.path for entry in removed] == [second_dir]
+    assert os.path.isdir(first_dir) and os.path.isdir(third_dir)
+
+    removed = cache.prune_cache(max_size=0, min_age=60)
+    assert [entry.path for entry in removed] == [third_dir]
+
+
+def test_prune_cache_skips_modules_being_built(cache_path):
+
+    module_dir, = _build_modules(['cache_locked'])
+
+    with inline._file_lock(module_dir + '.lock'):
+        assert cache.clear_cache() == []
+    assert os.path.isdir(module_dir)
+
+    assert len(cache.clear_cache()) == 1
+    assert cache.cache_stats()['entries'] == 0
+
+
+def test_build_prunes_cache_within_limits(cache_path, monkeypatch):
+
+    monkeypatch.setattr(cache, 'MIN_AGE', 0)
+    inline.set_cache_limits(max_entries=2)
+
+    first_dir, second_dir = _build_modules(['cache_limit_first', 'cache_limit_second'])
+    third_dir, = _build_modules(['cache_limit_third'])
+
+    assert not os.path.exists(first_dir)
+    assert os.path.isdir(second_dir) and os.path.isdir(third_dir)
+
+
+def test_cache_command(cache_path, capsys):
+
+    _build_modules(['cache_command'])
+
+    assert main(['cache', 'stats']) == 0
+    assert 'Entries: 1' in capsys.readouterr().out
+
+    assert main(['cache', 'prune', '--max-size', '1G']) == 0
+    assert 'Removed 0 entries' in capsys.readouterr().out
+
+    assert main(['cache', 'clear']) == 0
+    assert 'Removed 1 entries' in capsys.readouterr().out
+    assert cache.cache_stats()['entries'] == 0
@@ -1,7 +1,11 @@
+import threading
+import time
+
 import pytest
 import numpy as np
 
-from pyinlinemodule import Cpp
+from pyinlinemodule import Cpp, module
+from pyinlinemodule.inline import build_install_module
 
 A_GLOBAL_STRING_VALUE = "a_string_value"
 A_GLOBAL_INT_VALUE = 1111111
@@ -46,6 +50,39 @@ def function_with_cpp_numpy_returns_arange(start, stop, step):
     return 5
 
 
+@Cpp(lazy=True)
+def compiled_function_lazy(a):
+    __cpp__ = """
+    long a_value = PyLong_AsLong(a);
+    return PyLong_FromLong(a_value + 5);
+    """
+    return a + 7
+
+
+@Cpp(group='group')
+def compiled_function_group_first(a):
+    __cpp__ = """
+    return PyLong_FromLong(PyLong_AsLong(a) + 1);
+    """
+    return a + 10
+
+
+@Cpp(group='group')
+def compiled_function_group_second(a):
+    __cpp__ = """
+    return PyLong_FromLong(PyLong_AsLong(a) + 2);
+    """
+    return a + 20
+
+
+@Cpp(ufunc=True, no_python=True)
+def compiled_ufunc_scale(x: float, factor: float) -> float:
+    __cpp__ = """
+    return x * factor;
+    """
+    return x * factor
+
+
 @pytest.mark.parametrize('func,arg,expected', [
     (compiled_function_cpp, 3, 3 + 5),
     (compiled_function_no_cpp, 3, 3 + 7)
@@ -92,4 +129,120 @@ def test_cpp_function_with_numpy():
 
     test_result = function_with_cpp_numpy_returns_arange(0., 10., 1.)
 
-    assert np.all(test_result == np.arange(0., 10., 1.))
\ No newline at end of file
+    assert np.all(test_result == np.arange(0., 10., 1.))
+
+
+def test_cpp_lazy_compiles_on_first_call():
+
+    lazy_function = compiled_function_lazy
+    assert not isinstance(lazy_function, type(compiled_function_cpp))
+
+    assert lazy_function(3) == 3 + 5
+    assert lazy_function(4) == 4 + 5
+
+    # The proxy has been replaced by the compiled function
+    assert isinstance(compiled_function_lazy, type(compiled_function_cpp))
+    assert compiled_function_lazy(3) == 3 + 5
+
+
+def test_cpp_background_switches_to_compiled_function():
+
+    @Cpp(background=True)
+    def compiled_function_background(a):
+        __cpp__ = """
+        long a_value = PyLong_AsLong(a);
+        return PyLong_FromLong(a_value + 5);
+        """
+        return a + 7
+
+    assert compiled_function_background(3) in (3 + 5, 3 + 7)
+
+    assert compiled_function_background.wait(timeout=60)
+    assert compiled_function_background.ready.is_set()
+    assert compiled_function_background(3) == 3 + 5
+
+
+def test_cpp_background_uses_python_if_build_error():
+
+    @Cpp(background=True)
+    def compiled_function_background_build_error(a):
+        __cpp__ = """
+        This is a compilation error;
+        return PyLong_FromLong(5);
+        """
+        return a + 7
+
+    assert compiled_function_background_build_error.wait(timeout=60)
+    assert compiled_function_background_build_error(1) == 8
+
+
+@pytest.mark.parametrize('options', [dict(lazy=True), dict(group='group')])
+def test_cpp_background_raise_if_combined_with_lazy_or_group(options):
+
+    with pytest.raises(ValueError):
+        Cpp(background=True, **options)
+
+
+def test_cpp_group_builds_a_single_extension():
+
+    assert compiled_function_group_first(1) == 1 + 1
+    assert compiled_function_group_second(1) == 1 + 2
+
+    assert compiled_function_group_first.__self__ is compiled_function_group_second.__self__
+
+
+def test_cpp_ufunc():
+
+    assert isinstance(compiled_ufunc_scale, np.ufunc)
+    np.testing.assert_allclose(compiled_ufunc_scale(np.arange(3.0), 2.0), [0.0, 2.0, 4.0])
+    assert compiled_ufunc_scale(np.arange(4, dtype=np.int32), 0.5).dtype == np.float64
+
+
+def test_cpp_background_builds_are_bounded(monkeypatch):
+
+    running = list()
+    max_running = list()
+    lock = threading.Lock()
+
+    def counting_build(*args, **kwargs):
+        with lock:
+            running.append(1)
+            max_running.append(len(running))
+        time.sleep(0.2)
+        try:
+            return build_install_module(*args, **kwargs)
+        finally:
+            with lock:
+                running.pop()
+
+    monkeypatch.setattr(module, '_ISOLATED_BUILDS', threading.BoundedSemaphore(2))
+    monkeypatch.setattr(module, 'build_install_module', counting_build)
+
+    @Cpp(background=True)
+    def compiled_function_background_bounded_first(a):
+        __cpp__ = """
+        return PyLong_FromLong(PyLong_AsLong(a) + 1);
+        """
+        return a + 1
+
+    @Cpp(background=True)
+    def compiled_function_background_bounded_second(a):
+        __cpp__ = """
+        return PyLong_FromLong(PyLong_AsLong(a) + 2);
+        """
+        return a + 2
+
+    @Cpp(background=True)
+    def compiled_function_background_bounded_third(a):
+        __cpp__ = """
+        return PyLong_FromLong(PyLong_AsLong(a) + 3);
+        """
+        return a + 3
+
+    functions = [compiled_function_background_bounded_first, compiled_function_background_bounded_second,
+                 compiled_function_background_bounded_third]
+    for index, function in enumerate(functions):
+        assert function.wait(timeout=60)
+        assert function(1) == 2 + index
+    assert len(max_running) == 3
+    assert max(max_running) == 2
@@ -1,6 +1,7 @@
 import pytest
 
-from pyinlinemodule.function import InlineFunction, METH_NOARGS, METH_O, METH_VARARGS, METH_KEYWORDS
+from pyinlinemodule.function import InlineFunction, METH_NOARGS, METH_O, METH_FASTCALL, METH_FASTCALL_KEYWORDS
+from pyinlinemodule.function import _array_type
 
 THIS_IS_CPP_CODE = "this_is_cpp_code"
 
@@ -55,6 +56,15 @@ def function_with_cpp_code_in_global():
     __cpp__ = THIS_IS_CPP_CODE
 
 
+def function_with_cpp_typed_args(a: int, b: float, c: bool = True) -> float:
+    """this is a doctring
+    """
+    __cpp__ = """
+    return c ? a + b : a - b;
+    """
+    return None
+
+
 @pytest.mark.parametrize('func_call,expected_name', [
     (function_with_cpp_args_kwargs, 'function_with_cpp_args_kwargs'),
     (function_with_cpp_args, 'function_with_cpp_args'),
@@ -68,8 +78,8 @@ def test_function_name(func_call, expected_name):
 
 
 @pytest.mark.parametrize('func_call,expected_name,meth_def', [
-    (function_with_cpp_args_kwargs, 'function_with_cpp_args_kwargs', METH_KEYWORDS),
-    (function_with_cpp_args, 'function_with_cpp_args', METH_VARARGS),
+    (function_with_cpp_args_kwargs, 'function_with_cpp_args_kwargs', METH_FASTCALL_KEYWORDS),
+    (function_with_cpp_args, 'function_with_cpp_args', METH_FASTCALL),
     (function_with_cpp_single_args, 'function_with_cpp_single_args', METH_O),
     (function_with_cpp_noargs, 'function_with_cpp_noargs', METH_NOARGS),
 ])
@@ -89,3 +99,55 @@ def test_function_load_cpp_code(func_call):
 
     pyfunction = InlineFunction(func_call)
     assert pyfunction._cpp_code == THIS_IS_CPP_CODE
+
+
+def test_function_typed_args_declare_native_variables():
+
+    pyfunction = InlineFunction(function_with_cpp_typed_args)
+    cpp_code = pyfunction.get_code()
+
+    assert 'long a;' in cpp_code
+    assert 'double b;' in cpp_code
+    assert 'bool c;' in cpp_code
+    assert 'PyFloat_FromDouble(__result)' in cpp_code
+
+
+@pytest.mark.parametrize('annotation,expected_type', [
+    ('float64[:]', ('float64', 1, None)),
+    ('float64[:, :]', ('float64', 2, None)),
+    ('int32[::1]', ('int32', 1, 'C')),
+    ('uint8[:, :, ::1]', ('uint8', 3, 'C')),
+    ('float32[::1, :]', ('float32', 2, 'F')),
+    ('float', None),
+    (float, None),
+    ('list[int]', None),
+    ('dict[str, float]', None),
+    ('complex256[:]', None),
+])
+def test_array_type(annotation, expected_type):
+
+    assert _array_type(annotation) == expected_type
+
+
+@pytest.mark.parametrize('annotation', ['float64[:, 1]', 'float64[::1, :, ::1]'])
+def test_array_type_raise_if_invalid(annotation):
+
+    with pytest.raises(ValueError):
+        _array_type(annotation)
+
+
+def test_function_with_array_args_requires_numpy():
+
+    def function_with_cpp_array_arg(a: 'float64[:, ::1]'):
+        __cpp__ = """
+        return PyFloat_FromDouble(a[0]);
+        """
+
+    assert InlineFunction(function_with_cpp_array_arg).requires_numpy()
+    assert not InlineFunction(function_with_cpp_args).requires_numpy()
+
+
+def test_function_releasing_the_gil_requires_native_return():
+
+    with pytest.raises(ValueError):
+        InlineFunction(function_with_cpp_args, nogil=True)
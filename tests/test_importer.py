@@ -0,0 +1,76 @@
+import importlib
+import sys
+from importlib.machinery import ExtensionFileLoader
+
+from pyinlinemodule import importer
+from pyinlinemodule.importer import InlineModuleFinder
+from pyinlinemodule.module import InlineModule
+from pyinlinemodule.stats import build_reports
+
+
+def function_returning_answer():
+    __cpp__ = """
+    return PyLong_FromLong(42);
+    """
+    return 42
+
+
+def _create_module(name):
+    inline_module = InlineModule(name)
+    inline_module.add_function(function_returning_answer)
+    return inline_module
+
+
+def test_import_module_uses_import_system():
+
+    name = 'test_import_module_uses_import_system'
+    inline_module = _create_module(name)
+    tested_module = inline_module.import_module()
+
+    assert sys.modules[name] is tested_module
+    assert isinstance(tested_module.__spec__.loader, ExtensionFileLoader)
+    assert importlib.import_module(name) is tested_module
+    assert importer.FINDER in sys.meta_path
+
+    # The next imports return the module without generating the code again
+    num_reports = len(build_reports())
+    assert inline_module.import_module() is tested_module
+    assert len(build_reports()) == num_reports
+
+    # A new instance of the same module is loaded from the cache and returned from sys.modules
+    assert _create_module(name).import_module() is tested_module
+
+
+def test_finder_resolves_only_registered_modules():
+
+    name = 'test_finder_resolves_only_registered_modules'
+    module_filename = _create_module(name).import_module().__file__
+
+    # The builds in the cache are not searched
+    finder = InlineModuleFinder()
+    assert finder.find_spec(name) is None
+
+    finder.register(name, module_filename)
+    spec = finder.find_spec(name)
+    assert spec is not None
+    assert spec.origin == module_filename
+    assert finder.find_spec('test_finder_not_a_module') is None
+    assert finder.find_spec(name + '.submodule') is None
+
+
+def test_import_module_ignores_modules_with_the_same_name(tmpdir, monkeypatch):
+
+    name = 'test_import_module_same_name'
+    tmpdir.join(name + '.py').write('answer = None\n')
+    monkeypatch.syspath_prepend(str(tmpdir))
+    python_module = importlib.import_module(name)
+
+    tested_module = _create_module(name).import_module()
+    assert tested_module is not python_module
+    assert tested_module.function_returning_answer() == 42
+    # The unrelated module with the same name is left in sys.modules
+    assert sys.modules[name] is python_module
+
+    json_module = importlib.import_module('json')
+    assert _create_module('json').import_module().function_returning_answer() == 42
+    assert sys.modules['json'] is json_module
@@ -0,0 +1,190 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+
+from pyinlinemodule import inline
+from pyinlinemodule.inline import build_install_module, module_cache_key, _source_prelude
+from pyinlinemodule.stats import BuildReport
+
+
+MODULE_SRC = '''
+#include <Python.h>
+
+static PyMethodDef module_functions_def[] = {
+    {nullptr}
+};
+
+static struct PyModuleDef inline_module = {
+    PyModuleDef_HEAD_INIT,
+    "%s",
+    nullptr,
+    -1,
+    module_functions_def
+};
+
+PyMODINIT_FUNC PyInit_%s(void)
+{
+    return PyModule_Create(&inline_module);
+}
+'''
+
+
+@pytest.fixture
+def cache_path(tmpdir, monkeypatch):
+    monkeypatch.setattr(inline, '_CACHE_PATH', str(tmpdir))
+    return str(tmpdir)
+
+
+def test_module_cache_key_depends_on_build_configuration():
+
+    key = module_cache_key('code')
+
+    assert key == module_cache_key('code')
+    assert key != module_cache_key('other code')
+    assert key != module_cache_key('code', dict(include_dirs=['/usr/include']))
+    assert key != module_cache_key('code', key_extra=['numpy=1.0'])
+
+
+def test_module_cache_key_depends_on_native_cpu(monkeypatch):
+
+    monkeypatch.setattr(inline, '_EXTRA_COMPILE_ARGS', ['-O3', '-march=native'])
+    monkeypatch.setattr(inline, '_ISA_LEVELS', [])
+    monkeypatch.setattr(inline, '_CPU_IDENTITY', 'cpu a')
+    monkeypatch.setattr(inline, '_COMPILER_VERSION', 'g++ 12')
+    key = module_cache_key('code')
+
+    monkeypatch.setattr(inline, '_COMPILER_VERSION', 'g++ 13')
+    assert key != module_cache_key('code')
+    # The prebuilt modules are loaded without a compiler
+    prebuilt_key = module_cache_key('code', build_config=dict())
+    monkeypatch.setattr(inline, '_COMPILER_VERSION', '')
+    assert prebuilt_key == module_cache_key('code', build_config=dict())
+
+    monkeypatch.setattr(inline, '_CPU_IDENTITY', 'cpu b')
+    assert key != module_cache_key('code')
+    assert prebuilt_key != module_cache_key('code', build_config=dict())
+
+    # The portable builds do not depend on the CPU of the build
+    monkeypatch.setattr(inline, '_EXTRA_COMPILE_ARGS', ['-O3'])
+    portable_key = module_cache_key('code')
+    monkeypatch.setattr(inline, '_CPU_IDENTITY', 'cpu a')
+    assert portable_key == module_cache_key('code')
+
+
+def test_build_install_module_uses_cache(cache_path):
+
+    name = 'test_build_install_module_uses_cache'
+    module_src = MODULE_SRC % (name, name)
+
+    module_filename = build_install_module(module_src, name)
+    assert module_filename is not None
+    assert module_filename.startswith(cache_path)
+
+    mtime = os.path.getmtime(module_filename)
+    assert build_install_module(module_src, name) == module_filename
+    assert os.path.getmtime(module_filename) == mtime
+
+
+def test_build_install_module_without_cache(monkeypatch):
+
+    monkeypatch.setattr(inline, '_CACHE_PATH', None)
+
+    name = 'test_build_install_module_without_cache'
+    module_filename = build_install_module(MODULE_SRC % (name, name), name)
+
+    assert module_filename is not None
+    assert module_filename.startswith(inline._PATH)
+
+
+def _build_in_process(cache_path, module_src, name):
+    inline.set_cache_dir(cache_path)
+    report = BuildReport(name)
+    return build_install_module(module_src, name, report=report), report.cache_hit
+
+
+def test_build_install_module_shared_cache(cache_path):
+
+    name = 'test_build_install_module_shared_cache'
+    module_src = MODULE_SRC % (name, name)
+
+    # The processes that start together build the module once
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(_build_in_process, cache_path, module_src, name) for _ in range(4)]
+        results = [future.result() for future in futures]
+
+    module_filenames = set(module_filename for module_filename, _ in results)
+    assert len(module_filenames) == 1
+    assert None not in module_filenames
+    assert [cache_hit for _, cache_hit in results].count(False) == 1
+    assert not any(filename.endswith('.tmp') for filename in os.listdir(cache_path))
+
+
+@pytest.mark.parametrize('backend', ['compiler', 'setuptools'])
+def test_build_install_module_backends(cache_path, monkeypatch, backend):
+
+    monkeypatch.setattr(inline, '_BUILD_BACKEND', backend)
+
+    name = 'test_build_install_module_backends_' + backend
+    module_filename = build_install_module(MODULE_SRC % (name, name), name)
+
+    assert module_filename is not None
+    assert os.path.basename(module_filename).startswith(name + '.')
+
+
+def test_build_backend_raise_if_unknown():
+
+    with pytest.raises(ValueError):
+        inline.set_build_backend('compilr')
+
+    environ = dict(os.environ, PY_INLINE_BACKEND='compilr')
+    result = subprocess.run([sys.executable, '-c', 'import pyinlinemodule'], env=environ, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, universal_newlines=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.returncode != 0
+    assert 'Unknown build backend compilr in PY_INLINE_BACKEND' in result.stdout
+
+
+def test_build_install_module_returns_none_if_build_error(cache_path):
+
+    name = 'test_build_install_module_returns_none_if_build_error'
+
+    assert build_install_module('This is a compilation error;', name) is None
+
+
+def test_source_prelude():
+
+    module_src = '\n#include <Python.h>\n\n// comment\n#define VALUE 1\nstatic int value = VALUE;\n#include <vector>\n'
+
+    assert _source_prelude(module_src) == '#include <Python.h>\n#define VALUE 1\n'
+    assert _source_prelude('static int value = 1;\n') == ''
+
+
+def test_build_install_module_precompiled_header(cache_path, monkeypatch):
+
+    monkeypatch.setattr(inline, '_BUILD_BACKEND', 'compiler')
+    monkeypatch.setattr(inline, '_PRECOMPILED_HEADERS', True)
+
+    name = 'test_build_install_module_precompiled_header'
+    assert build_install_module(MODULE_SRC % (name, name), name) is not None
+
+    compiled_headers = [os.path.join(root, filename)
+                        for root, _, filenames in os.walk(os.path.join(cache_path, 'pch'))
+                        for filename in filenames if filename.endswith(('.gch', '.pch'))]
+    assert len(compiled_headers) == 1
+    compiled_header = compiled_headers[0]
+    header = os.path.splitext(compiled_header)[0]
+
+    # Reused by the next build
+    mtime = os.path.getmtime(compiled_header)
+    name += '_reused'
+    assert build_install_module(MODULE_SRC % (name, name), name) is not None
+    assert os.path.getmtime(compiled_header) == mtime
+
+    # Built again if one of the headers is newer
+    os.utime(header, (mtime + 10, mtime + 10))
+    name += '_stale'
+    assert build_install_module(MODULE_SRC % (name, name), name) is not None
+    assert os.path.getmtime(compiled_header) > mtime
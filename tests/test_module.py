@@ -1,8 +1,13 @@
+import os
+import platform
 import sys
 import pytest
 import numpy as np
 
-from pyinlinemodule.module import InlineModule
+from pyinlinemodule import inline
+from pyinlinemodule.function import InlineFunction
+from pyinlinemodule.module import InlineModule, build_all
+from pyinlinemodule.stats import build_reports
 
 
 def function_with_cpp_args_kwargs(a, b, c=None, d=3, e=(None, "test")):
@@ -54,6 +59,74 @@ def function_with_cpp_numpy_returns_arange(start, stop, step):
     return 5
 
 
+def function_with_cpp_typed_args(a: int, b: float, c: bool = True) -> float:
+    """this is a doctring
+    """
+    __cpp__ = """
+    return c ? a + b : a - b;
+    """
+    return None
+
+
+def function_with_cpp_typed_no_return(a: int) -> None:
+    """this is a doctring
+    """
+    __cpp__ = """
+    if(a < 0)
+        PyErr_SetString(PyExc_ValueError, "negative value");
+    """
+    return None
+
+
+def function_with_cpp_array_args(values: 'float64[:, ::1]', indices: 'int32[:]') -> float:
+    """this is a doctring
+    """
+    __cpp__ = """
+    double result = 0.0;
+    for(npy_intp i = 0; i < indices_shape[0]; ++i)
+    {
+        npy_int32 index = *reinterpret_cast<npy_int32*>(reinterpret_cast<char*>(indices) + i * indices_strides[0]);
+        result += values[index];
+    }
+    return result;
+    """
+    return None
+
+
+def function_with_cpp_nogil_section(a: int) -> int:
+    """this is a doctring
+    """
+    __cpp_nogil__ = """
+    int gil_held = PyGILState_Check();
+    """
+    __cpp__ = """
+    return gil_held * 10 + PyGILState_Check();
+    """
+    return None
+
+
+def function_with_cpp_nogil(a: int) -> int:
+    """this is a doctring
+    """
+    __cpp__ = """
+    return PyGILState_Check();
+    """
+    return None
+
+
+def function_with_cpp_openmp(n: int) -> int:
+    """this is a doctring
+    """
+    __cpp__ = """
+    long total = 0;
+    #pragma omp parallel for reduction(+:total)
+    for(long i = 0; i < n; ++i)
+        total += i;
+    return total;
+    """
+    return None
+
+
 @pytest.fixture(scope='module')
 def compiled_function_with_cpp_args_kwargs():
     inline_module = InlineModule('compiled_function_with_cpp_args_kwargs')
@@ -102,6 +175,7 @@ def test_compile_single_function_noargs(compiled_function_with_cpp_noargs, retur
     ((1, 2), dict(e=5), (1, 2, None, 3, 5)),
     ((1, 2, 7), dict(), (1, 2, 7, 3, (None, "test"))),
     ((1, 2, 'str'), dict(e=None), (1, 2, 'str', 3, None)),
+    (tuple(), dict(b=2, a=1, d=4), (1, 2, None, 4, (None, "test"))),
 ])
 def test_compile_single_function_with_kwargs(compiled_function_with_cpp_args_kwargs, args, kwargs, return_value):
 
@@ -118,6 +192,35 @@ def test_compile_single_function_with_kwargs(compiled_function_with_cpp_args_kwa
     assert sys.getrefcount(result) == 2
 
 
+@pytest.mark.parametrize('args,kwargs', [
+    (tuple(), dict()),
+    (tuple(), dict(b=2)),
+    ((1, 2, 3, 4, 5, 6), dict()),
+    ((1, 2), dict(a=1)),
+    ((1, 2), dict(f=1)),
+])
+def test_compile_single_function_with_kwargs_raise_if_wrong_args(compiled_function_with_cpp_args_kwargs,
+                                                                  args, kwargs):
+
+    tested_module, func_name = compiled_function_with_cpp_args_kwargs
+
+    compiled_function = getattr(tested_module, func_name)
+
+    with pytest.raises(TypeError):
+        compiled_function(*args, **kwargs)
+
+
+@pytest.mark.parametrize('args', [(1, ), (1, 2, 3)])
+def test_compile_single_function_with_args_raise_if_wrong_args(compiled_function_with_cpp_args, args):
+
+    tested_module, func_name = compiled_function_with_cpp_args
+
+    compiled_function = getattr(tested_module, func_name)
+
+    with pytest.raises(TypeError):
+        compiled_function(*args)
+
+
 @pytest.mark.parametrize('args,return_value', [
     ((1, 2), (1, 2)),
     ((1, []), (1, [])),
@@ -174,3 +277,344 @@ def test_compile_single_function_with_numpy(py_function, function_name, args, re
     result = compiled_function(*args)
     assert np.all(result == return_value)
 
+
+def test_build_all():
+
+    inline_modules = list()
+    for index, py_function in enumerate([function_with_cpp_args, function_with_cpp_single_arg]):
+        inline_module = InlineModule('test_build_all_%d' % index)
+        inline_module.add_function(py_function)
+        inline_modules.append(inline_module)
+
+    first_module, second_module = build_all(inline_modules, jobs=2)
+
+    assert first_module.function_with_cpp_args(1, 2) == (1, 2)
+    assert second_module.function_with_cpp_single_arg(1) == (1, 1)
+
+
+@pytest.fixture(scope='module')
+def compiled_typed_functions():
+    inline_module = InlineModule('compiled_typed_functions')
+    inline_module.add_function(function_with_cpp_typed_args)
+    inline_module.add_function(function_with_cpp_typed_no_return)
+    return inline_module.import_module()
+
+
+@pytest.mark.parametrize('args,kwargs,return_value', [
+    ((1, 2.5), dict(), 3.5),
+    ((1, 2), dict(), 3.0),
+    ((1, 2.5), dict(c=False), -1.5),
+])
+def test_compile_function_with_typed_args(compiled_typed_functions, args, kwargs, return_value):
+
+    result = compiled_typed_functions.function_with_cpp_typed_args(*args, **kwargs)
+
+    assert result == return_value
+    assert isinstance(result, float)
+
+
+@pytest.mark.parametrize('args,exception', [
+    (('1', 2.5), TypeError),
+    ((1, '2.5'), TypeError),
+])
+def test_compile_function_with_typed_args_raise_if_conversion_error(compiled_typed_functions, args, exception):
+
+    with pytest.raises(exception):
+        compiled_typed_functions.function_with_cpp_typed_args(*args)
+
+
+def test_compile_function_with_typed_args_returns_none(compiled_typed_functions):
+
+    assert compiled_typed_functions.function_with_cpp_typed_no_return(1) is None
+
+    with pytest.raises(ValueError):
+        compiled_typed_functions.function_with_cpp_typed_no_return(-1)
+
+
+@pytest.fixture(scope='module')
+def compiled_function_with_cpp_array_args():
+    inline_module = InlineModule('compiled_function_with_cpp_array_args')
+    inline_module.add_function(function_with_cpp_array_args)
+    return inline_module.import_module().function_with_cpp_array_args
+
+
+def test_compile_function_with_array_args(compiled_function_with_cpp_array_args):
+
+    values = np.arange(6, dtype=np.float64).reshape(2, 3)
+    indices = np.arange(6, dtype=np.int32)[::2]
+
+    assert compiled_function_with_cpp_array_args(values, indices) == 0. + 2. + 4.
+
+
+@pytest.mark.parametrize('values,exception', [
+    ([[1.]], TypeError),
+    (np.ones((2, 3), dtype=np.float32), TypeError),
+    (np.ones((2, 3), dtype='>f8'), TypeError),
+    (np.ones(6, dtype=np.float64), ValueError),
+    (np.ones((3, 2), dtype=np.float64).T, ValueError),
+])
+def test_compile_function_with_array_args_raise_if_wrong_array(compiled_function_with_cpp_array_args,
+                                                               values, exception):
+
+    with pytest.raises(exception):
+        compiled_function_with_cpp_array_args(values, np.zeros(1, dtype=np.int32))
+
+
+def test_compile_function_with_array_args_raise_if_readonly_array(compiled_function_with_cpp_array_args):
+
+    values = np.ones((2, 3), dtype=np.float64)
+    values.flags.writeable = False
+
+    with pytest.raises(ValueError, match="argument 'values' must be a writeable array"):
+        compiled_function_with_cpp_array_args(values, np.zeros(1, dtype=np.int32))
+
+
+def test_compile_function_releasing_the_gil():
+
+    inline_module = InlineModule('test_compile_function_releasing_the_gil')
+    inline_module.add_function(function_with_cpp_nogil_section)
+    inline_module.add_function(InlineFunction(function_with_cpp_nogil, nogil=True))
+    tested_module = inline_module.import_module()
+
+    # The nogil section is executed without the GIL, the code of __cpp__ with the GIL
+    assert tested_module.function_with_cpp_nogil_section(1) == 1
+    assert tested_module.function_with_cpp_nogil(1) == 0
+
+
+def test_compile_function_with_openmp():
+
+    inline_module = InlineModule('test_compile_function_with_openmp', enable_openmp=True)
+    inline_module.add_function(function_with_cpp_openmp)
+    tested_module = inline_module.import_module()
+
+    tested_module.set_num_threads(2)
+    assert tested_module.get_max_threads() == 2
+    assert tested_module.function_with_cpp_openmp(1000) == sum(range(1000))
+
+    with pytest.raises(ValueError):
+        tested_module.set_num_threads(0)
+
+
+def test_compile_module_with_profile():
+
+    inline_module = InlineModule('test_compile_module_with_profile', profile=True)
+    inline_module.add_function(function_with_cpp_args)
+    inline_module.add_function(function_with_cpp_typed_args)
+    tested_module = inline_module.import_module()
+
+    for _ in range(3):
+        assert tested_module.function_with_cpp_args(1, 2) == (1, 2)
+    assert tested_module.function_with_cpp_typed_args(1, 2.5) == 3.5
+
+    stats = tested_module.__pyinline_stats__(reset=True)
+
+    assert stats['function_with_cpp_args']['calls'] == 3
+    assert stats['function_with_cpp_typed_args']['calls'] == 1
+    assert stats['function_with_cpp_typed_args']['body_seconds'] >= 0.0
+    assert stats['function_with_cpp_typed_args']['conversion_seconds'] >= 0.0
+
+    stats = tested_module.__pyinline_stats__()
+    assert stats['function_with_cpp_args']['calls'] == 0
+
+
+def test_compile_module_incremental():
+
+    inline_module = InlineModule('test_compile_module_incremental', incremental=True, profile=True)
+    inline_module.add_function(function_with_cpp_args_kwargs)
+    inline_module.add_function(function_with_cpp_array_args)
+    inline_module.add_function(function_with_cpp_typed_args)
+    assert len(inline_module.get_function_sources()) == 3
+
+    tested_module = inline_module.import_module()
+    report = build_reports()[-1]
+    assert report.objects_compiled == 3
+    assert report.objects_cached == 0
+
+    assert tested_module.function_with_cpp_args_kwargs(1, 2, d=4) == (1, 2, None, 4, (None, "test"))
+    values = np.arange(6, dtype=np.float64).reshape(2, 3)
+    assert tested_module.function_with_cpp_array_args(values, np.arange(6, dtype=np.int32)[::2]) == 6.
+    assert tested_module.function_with_cpp_typed_args(1, 2.5) == 3.5
+    assert tested_module.__pyinline_stats__()['function_with_cpp_typed_args']['calls'] == 1
+
+    # Only the new function is compiled, the object files of the others are reused
+    inline_module = InlineModule('test_compile_module_incremental_changed', incremental=True, profile=True)
+    inline_module.add_function(function_with_cpp_args_kwargs)
+    inline_module.add_function(function_with_cpp_array_args)
+    inline_module.add_function(function_with_cpp_single_arg)
+    tested_module = inline_module.import_module()
+    report = build_reports()[-1]
+    assert report.objects_compiled == 1
+    assert report.objects_cached == 2
+
+    assert tested_module.function_with_cpp_args_kwargs(1, 2) == (1, 2, None, 3, (None, "test"))
+    assert tested_module.function_with_cpp_single_arg(1) == (1, 1)
+
+
+def function_with_cpp_branches(values: 'int64[::1]') -> int:
+    __cpp__ = """
+    long count = 0;
+    for(npy_intp i = 0; i < values_shape[0]; ++i)
+    {
+        if(values[i] % 3 == 0)
+            count += 2;
+        else if(values[i] % 5 == 0)
+            count -= 1;
+    }
+    return count;
+    """
+    return None
+
+
+@pytest.mark.skipif(os.name != 'posix' or sys.platform == 'darwin' or (inline._gcc_version() or (0, 0)) < (11, 0),
+                    reason='The profile guided optimization requires GCC 11')
+def test_compile_module_with_profile_guided_optimization():
+
+    trained = list()
+
+    def train(instrumented_module):
+        trained.append(instrumented_module)
+        instrumented_module.function_with_cpp_branches(np.arange(10000, dtype=np.int64))
+
+    inline_module = InlineModule('test_compile_module_with_profile_guided_optimization')
+    inline_module.add_function(function_with_cpp_branches)
+    tested_module = inline_module.import_module_pgo(train)
+
+    assert len(trained) == 1
+    assert not hasattr(tested_module, '__pyinline_gcov_dump__')
+    assert tested_module.function_with_cpp_branches(np.arange(15, dtype=np.int64)) == 2 * 5 - 2
+
+    # The profile data is reused by the next builds, without training
+    inline_module = InlineModule('test_compile_module_with_profile_guided_optimization')
+    inline_module.add_function(function_with_cpp_branches)
+    assert inline_module.import_module_pgo(train) is tested_module
+    assert len(trained) == 1
+
+
+def function_with_cpp_isa_level():
+    __cpp__ = """
+    return PyUnicode_FromString(__func__);
+    """
+    return None
+
+
+@pytest.mark.skipif(platform.machine().lower() not in ('x86_64', 'amd64') or os.name != 'posix' or
+                    (inline._gcc_version() or (0, 0)) < (12, 0),
+                    reason='The portable builds require x86-64 and GCC 12')
+def test_compile_module_with_isa_levels(monkeypatch):
+
+    monkeypatch.setattr(inline, '_ISA_LEVELS', [])
+    inline.set_isa_levels(['x86-64', 'x86-64-v2'])
+    assert '-march=native' not in inline._isa_compile_args(inline.extra_compile_args())
+
+    inline_module = InlineModule('test_compile_module_with_isa_levels')
+    inline_module.add_function(function_with_cpp_isa_level)
+    assert '#pragma GCC target("arch=x86-64-v2")' in inline_module.get_cpp_code()
+    assert '__builtin_cpu_supports("x86-64-v2")' in inline_module.get_cpp_code()
+
+    # The variant for x86-64-v2 (SSE 4.2) is selected on all the recent CPUs
+    assert inline_module.import_module().function_with_cpp_isa_level() == 'function_with_cpp_isa_level__x86_64_v2'
+
+    with pytest.raises(ValueError):
+        inline.set_isa_levels(['pentium'])
+
+
+@pytest.mark.skipif(os.name != 'posix' or sys.platform == 'darwin', reason='The checks of GCC require Linux')
+def test_gcc_features_raise_if_compiler_too_old(monkeypatch):
+
+    monkeypatch.setattr(inline, '_GCC_VERSION', (7, 5))
+    monkeypatch.setattr(inline, '_BUILD_BACKEND', 'compiler')
+    monkeypatch.setattr(platform, 'machine', lambda: 'x86_64')
+    with pytest.raises(ValueError, match='GCC 12.0 or newer'):
+        inline.set_isa_levels(['x86-64', 'x86-64-v3'])
+    with pytest.raises(ValueError, match='GCC 11.0 or newer'):
+        inline.profile_guided_flags('profile', True)
+
+
+def function_ufunc_hypot(x: float, y: float) -> float:
+    __cpp__ = """
+    return std::sqrt(x * x + y * y);
+    """
+    return (x * x + y * y) ** 0.5
+
+
+def function_ufunc_plus(a: 'int32', b: 'int32') -> 'int32':
+    __cpp__ = """
+    return a + b;
+    """
+    return a + b
+
+
+def test_compile_module_with_ufuncs():
+
+    inline_module = InlineModule('test_compile_module_with_ufuncs')
+    inline_module.add_ufunc(function_ufunc_hypot)
+    inline_module.add_ufunc(function_ufunc_plus, identity=0)
+    inline_module.add_function(function_with_cpp_single_arg)
+    compiled_module = inline_module.import_module()
+
+    hypot = compiled_module.function_ufunc_hypot
+    assert isinstance(hypot, np.ufunc)
+    assert hypot(3.0, 4.0) == 5.0
+    np.testing.assert_allclose(hypot(np.arange(4.0), 1.0), np.hypot(np.arange(4.0), 1.0))
+
+    # Broadcasting, output argument and non contiguous arrays
+    out = np.empty((3, 4))
+    hypot(np.arange(3.0)[:, np.newaxis], np.arange(8.0)[::2], out=out)
+    np.testing.assert_allclose(out, np.hypot(np.arange(3.0)[:, np.newaxis], np.arange(8.0)[::2]))
+
+    # Reductions
+    plus = compiled_module.function_ufunc_plus
+    values = np.arange(10, dtype=np.int32)
+    assert plus.reduce(values) == 45
+    assert plus.reduce(np.array([], dtype=np.int32)) == 0
+    np.testing.assert_array_equal(plus.accumulate(values), np.cumsum(values))
+
+    assert compiled_module.function_with_cpp_single_arg(1) == (1, 1)
+
+
+def test_ufunc_raise_if_not_scalar_annotation():
+
+    def function_ufunc_without_annotations(x, y):
+        __cpp__ = """
+        return x + y;
+        """
+        return x + y
+
+    inline_module = InlineModule('test_ufunc_raise_if_not_scalar_annotation')
+    with pytest.raises(ValueError):
+        inline_module.add_ufunc(function_ufunc_without_annotations)
+    with pytest.raises(ValueError):
+        inline_module.add_ufunc(function_ufunc_hypot, identity=2)
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['single', 'incremental'])
+def compiled_batched_functions(request):
+    inline_module = InlineModule('compiled_batched_functions', incremental=request.param)
+    inline_module.add_function(InlineFunction(function_with_cpp_typed_args, batched=True))
+    inline_module.add_function(InlineFunction(function_with_cpp_single_arg, batched=True))
+    inline_module.add_function(InlineFunction(function_with_cpp_args, batched=True))
+    inline_module.add_function(InlineFunction(function_with_cpp_noargs, batched=True))
+    return inline_module.import_module()
+
+
+def test_compile_batched_functions(compiled_batched_functions):
+
+    module = compiled_batched_functions
+    items = [(1, 2.5), (2, 0.5, False), (3, 1.0, True)]
+    assert module.function_with_cpp_typed_args_many(items) == [module.function_with_cpp_typed_args(*args)
+                                                               for args in items]
+    assert module.function_with_cpp_typed_args_many(iter([(1, 1.0)] * 1000)) == [2.0] * 1000
+    assert module.function_with_cpp_single_arg_many([(1, ), ('a', )]) == [(1, 1), ('a', 'a')]
+    assert module.function_with_cpp_args_many([(1, 2), (3, 4)]) == [(1, 2), (3, 4)]
+    assert module.function_with_cpp_noargs_many([(), ()]) == [(1, 2, 3), (1, 2, 3)]
+    assert module.function_with_cpp_args_many([]) == []
+
+
+@pytest.mark.parametrize('items,exception', [
+    (1, TypeError),
+    ([(1, 2), [3, 4]], TypeError),
+    ([(1, 2), (3, )], TypeError),
+])
+def test_compile_batched_functions_raise_if_wrong_items(compiled_batched_functions, items, exception):
+    with pytest.raises(exception):
+        compiled_batched_functions.function_with_cpp_args_many(items)
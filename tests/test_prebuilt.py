@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from pyinlinemodule import inline
+
+
+PACKAGE_INIT = '''
+from pyinlinemodule import Cpp, InlineModule
+
+
+@Cpp()
+def add_one(a: int) -> int:
+    __cpp__ = """
+    return a + 1;
+    """
+    return a + 1
+
+
+@Cpp(group='kernels')
+def twice(a: int) -> int:
+    __cpp__ = """
+    return 2 * a;
+    """
+    return 2 * a
+
+
+def answer():
+    __cpp__ = """
+    return PyLong_FromLong(42);
+    """
+    return 42
+
+
+inline_module = InlineModule('prebuilt_package_module')
+inline_module.add_function(answer)
+compiled_module = inline_module.import_module()
+'''
+
+CHECK_SCRIPT = '''
+import types
+import prebuilt_package
+from pyinlinemodule import build_stats
+
+assert isinstance(prebuilt_package.add_one, types.BuiltinFunctionType)
+assert prebuilt_package.add_one(1) == 2
+assert prebuilt_package.twice(2) == 4
+assert isinstance(prebuilt_package.compiled_module.answer, types.BuiltinFunctionType)
+assert prebuilt_package.compiled_module.answer() == 42
+stats = build_stats()
+assert stats['builds'] == 0 and stats['failures'] == 0, stats
+'''
+
+
+@pytest.fixture
+def package_path(tmpdir):
+    package_dir = tmpdir.mkdir('prebuilt_package')
+    package_dir.join('__init__.py').write(PACKAGE_INIT)
+    return str(package_dir)
+
+
+def _run(args, cwd, **env):
+    environ = dict(os.environ)
+    environ['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__))), cwd])
+    environ.update(env)
+    return subprocess.run([sys.executable] + args, cwd=cwd, env=environ, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, universal_newlines=True)
+
+
+def test_build_prebuilt_modules(package_path, tmpdir):
+    output_dir = str(tmpdir.join('prebuilt'))
+
+    result = _run(['-m', 'pyinlinemodule', 'build', package_path, '--output', output_dir], str(tmpdir))
+    assert result.returncode == 0, result.stdout
+    assert 'Built 3 modules' in result.stdout
+    assert not os.path.exists(os.path.join(output_dir, 'pch'))
+
+    # The prebuilt modules are not built for the CPU of the build machine
+    config = inline.prebuilt_config(output_dir)
+    assert config['cpu'] is None
+    assert config['isa_levels'] or '-march=native' not in config['compile_args']
+
+    # The prebuilt modules are loaded without a compiler and without the build cache
+    empty_dir = str(tmpdir.mkdir('empty'))
+    result = _run(['-c', textwrap.dedent(CHECK_SCRIPT)], str(tmpdir), PY_INLINE_PREBUILT=output_dir,
+                  PY_INLINE_CACHE='', PATH=empty_dir)
+    assert result.returncode == 0, result.stdout
+
+
+def test_build_prebuilt_modules_fails_with_invalid_path(tmpdir):
+    result = _run(['-m', 'pyinlinemodule', 'build', str(tmpdir.mkdir('not_a_package'))], str(tmpdir))
+    assert result.returncode == 1
+
+
+def test_prebuilt_modules_for_another_cpu_are_not_used(tmpdir, monkeypatch):
+    output_dir = str(tmpdir)
+    with open(os.path.join(output_dir, inline.PREBUILT_MARKER), 'w') as config_file:
+        json.dump(dict(compile_args=['-march=native'], isa_levels=[], machine='another machine'), config_file)
+
+    monkeypatch.setattr(inline, '_PREBUILT_PATH', output_dir)
+    monkeypatch.setattr(inline, '_CACHE_PATH', None)
+    with pytest.warns(UserWarning, match='built for another CPU'):
+        assert inline.find_cached_module('code', 'prebuilt_other_cpu') is None
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+STARTUP_MODULE = '''
+from pyinlinemodule import Cpp
+
+
+@Cpp()
+def add_one(a: int) -> int:
+    __cpp__ = """
+    return a + 1;
+    """
+    return a + 1
+
+
+@Cpp(group='kernels')
+def twice(a: int) -> int:
+    __cpp__ = """
+    return 2 * a;
+    """
+    return 2 * a
+'''
+
+CHECK_SCRIPT = '''
+import sys
+import types
+import startup_module
+from pyinlinemodule import build_stats
+
+assert isinstance(startup_module.add_one, types.BuiltinFunctionType)
+assert startup_module.add_one(1) == 2
+assert startup_module.twice(2) == 4
+stats = build_stats()
+print('builds=%d hits=%d' % (stats['builds'], stats['cache_hits']))
+print('codegen=%s' % any(name in sys.modules for name in ('inspect', 'dis', 'setuptools')))
+'''
+
+
+@pytest.fixture
+def module_path(tmpdir):
+    tmpdir.join('startup_module.py').write(STARTUP_MODULE)
+    return str(tmpdir)
+
+
+def _run(args, cwd, **env):
+    environ = dict(os.environ)
+    environ['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__))), cwd])
+    environ.update(env)
+    return subprocess.run([sys.executable] + args, cwd=cwd, env=environ, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, universal_newlines=True)
+
+
+def test_import_does_not_load_code_generation(module_path):
+
+    result = _run(['-c', 'import sys, pyinlinemodule; '
+                         'print(sorted(set(sys.modules) & {"inspect", "dis", "setuptools", "subprocess"}))'],
+                  module_path)
+    assert result.returncode == 0, result.stdout
+    assert result.stdout.strip() == '[]'
+
+
+def test_cache_hit_by_function_key_skips_code_generation(module_path, tmpdir):
+    cache_path = str(tmpdir.mkdir('cache'))
+
+    result = _run(['-c', CHECK_SCRIPT], module_path, PY_INLINE_CACHE=cache_path)
+    assert result.returncode == 0, result.stdout
+    assert 'builds=2 hits=0' in result.stdout
+    assert len(os.listdir(os.path.join(cache_path, 'functions'))) == 2
+
+    # The modules are loaded from the index without the C++ code generation
+    result = _run(['-c', CHECK_SCRIPT], module_path, PY_INLINE_CACHE=cache_path)
+    assert result.returncode == 0, result.stdout
+    assert 'builds=0 hits=2' in result.stdout
+    assert 'codegen=False' in result.stdout
+
+    # A change of the function changes its key
+    with open(os.path.join(module_path, 'startup_module.py'), 'w') as module_file:
+        module_file.write(STARTUP_MODULE.replace('a + 1;', 'a + 2 - 1;'))
+    result = _run(['-c', CHECK_SCRIPT], module_path, PY_INLINE_CACHE=cache_path)
+    assert result.returncode == 0, result.stdout
+    assert 'builds=1 hits=1' in result.stdout
+
+
+KEY_SCRIPT = '''
+from pyinlinemodule import inline
+
+
+def classify(name):
+    __cpp__ = """
+    Py_RETURN_NONE;
+    """
+    return name in {'alpha', 'beta', 'gamma', 'delta'}
+
+
+print(inline.function_cache_key([classify]))
+'''
+
+
+def test_function_key_does_not_depend_on_hash_seed(module_path):
+
+    keys = set()
+    for seed in ('1', '2', '3'):
+        result = _run(['-c', KEY_SCRIPT], module_path, PYTHONHASHSEED=seed)
+        assert result.returncode == 0, result.stdout
+        keys.add(result.stdout.strip())
+    assert len(keys) == 1
+
+
+def test_empty_function_index_is_a_cache_miss(tmpdir, monkeypatch):
+    from pyinlinemodule import inline
+
+    monkeypatch.setattr(inline, '_CACHE_PATH', str(tmpdir))
+    monkeypatch.setattr(inline, '_PREBUILT_PATH', None)
+    tmpdir.mkdir('functions').join('startup_empty-0123').write('')
+
+    assert inline.find_function_module('startup_empty', '0123') is None
@@ -0,0 +1,79 @@
+import pytest
+
+from pyinlinemodule import stats
+from pyinlinemodule.module import InlineModule
+
+
+def function_with_cpp_noargs():
+    """this is a doctring
+    """
+    __cpp__ = """
+    return PyLong_FromLong(7);
+    """
+    return 7
+
+
+@pytest.fixture
+def clean_stats():
+    stats.reset_build_stats()
+    yield
+    stats.reset_build_stats()
+
+
+def test_build_report_phase():
+
+    report = stats.BuildReport('module')
+    with report.phase('compile'):
+        pass
+    with report.phase('compile'):
+        pass
+
+    assert set(report.phases.keys()) == {'compile'}
+    assert report.compile_seconds == report.total_seconds
+
+
+def test_import_module_records_build_and_cache_hit(clean_stats):
+
+    reports = list()
+    stats.add_build_callback(reports.append)
+    try:
+        for _ in range(2):
+            inline_module = InlineModule('test_import_module_records_build_and_cache_hit')
+            inline_module.add_function(function_with_cpp_noargs)
+            assert inline_module.import_module().function_with_cpp_noargs() == 7
+    finally:
+        stats.remove_build_callback(reports.append)
+
+    build_report, cache_hit_report = reports
+
+    assert not build_report.cache_hit
+    assert build_report.success
+    assert build_report.module_size > 0
+    assert build_report.source_size > 0
+    assert {'codegen', 'write_source', 'compile', 'load'} <= set(build_report.phases.keys())
+
+    assert cache_hit_report.cache_hit
+    assert 'compile' not in cache_hit_report.phases
+
+    counters = stats.build_stats()
+    assert counters['builds'] == 1
+    assert counters['cache_hits'] == 1
+    assert counters['failures'] == 0
+    assert counters['compile_seconds'] == build_report.compile_seconds
+    assert stats.build_reports() == reports
+
+
+def test_import_module_records_failure(clean_stats):
+
+    def function_with_cpp_build_error():
+        __cpp__ = """
+        This is a compilation error;
+        """
+
+    inline_module = InlineModule('test_import_module_records_failure')
+    inline_module.add_function(function_with_cpp_build_error)
+    with pytest.raises(ImportError):
+        inline_module.import_module()
+
+    assert stats.build_stats()['failures'] == 1
+    assert not stats.build_reports()[0].success